@@ -0,0 +1,336 @@
+"""
+Bulk import of a directory tree into the document store.
+
+Walks DIRECTORY for supported files and parses them in a pool of worker
+processes. Chunks from many files are then embedded and written to Chroma, the
+keyword index and SQLite in large batches, through the same code paths as
+uploads. Files whose content_hash is already stored are skipped. Progress is
+appended to a checkpoint file, so running the same command again after an
+interruption resumes where it stopped. From the `backend` directory:
+
+    python -m app.bulk_import /path/to/documents --workers 8 --batch-size 512
+
+Run it while the API server is stopped, or restart the server afterwards: the
+embedded Chroma store doesn't support writers in several processes, and the
+server's in-memory corpus snapshot wouldn't see the imported chunks.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Set
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from .core.settings import settings
+from .db.sqlite_db import engine, init_db
+from .db.keyword_index import init_keyword_index
+from .models.database import Document
+from .parsers import PARSERS, get_parser
+from .rag.retrieve import embed_texts_cached
+from .services.document_service import DocumentService
+
+# --- Parse workers ---
+# Each worker hashes a file, skips it if its content is already stored, copies
+# it to UPLOAD_DIR (deleting a document removes its stored file, never the
+# source) and returns the parsed pages.
+
+_known_hashes: FrozenSet[str] = frozenset()
+
+
+def _init_worker(known_hashes: FrozenSet[str]):
+    global _known_hashes
+    _known_hashes = known_hashes
+    # Files are the unit of parallelism here; don't fan PDFs out to a second pool.
+    settings.PDF_WORKERS = 1
+
+
+def _hash_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(settings.UPLOAD_BLOCK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _parse_file(path: str) -> Dict[str, Any]:
+    """
+    Worker entry point. Returns {"path", "filename", "status", ...} with status
+    "parsed" (plus "content_hash", "filepath", "metadata", "pages"), "skipped"
+    or "failed" (plus "error").
+    """
+    filename = os.path.basename(path)
+    result = {"path": path, "filename": filename}
+    try:
+        content_hash = _hash_file(path)
+        if content_hash in _known_hashes:
+            return {**result, "status": "skipped", "content_hash": content_hash}
+        filepath = os.path.join(settings.UPLOAD_DIR, f"{uuid.uuid4()}_{filename}")
+        shutil.copyfile(path, filepath)
+        try:
+            metadata, pages = get_parser(filename).stream(filepath)
+            pages = [(page, text) for page, text in pages if text and text.strip()]
+        except Exception:
+            os.remove(filepath)
+            raise
+        return {**result, "status": "parsed", "content_hash": content_hash, "filepath": filepath,
+                "metadata": metadata or {}, "pages": pages}
+    except Exception as e:
+        return {**result, "status": "failed", "error": f"{type(e).__name__}: {e}"}
+
+
+FINAL_STATUSES = ("done", "skipped")
+
+
+class Checkpoint:
+    """
+    Append-only JSON-lines log of per-file progress, keyed by absolute path. A
+    file is "started" once its Document row exists, and then "done"; "skipped"
+    files are final too. A started file that never got to done was interrupted
+    and is re-imported, and a "failed" file is retried by the next run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.finished: Set[str] = set()
+        self.started: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by the interruption.
+                    if record["status"] == "started":
+                        self.started[record["path"]] = record
+                        continue
+                    self.started.pop(record["path"], None)
+                    if record["status"] in FINAL_STATUSES:
+                        self.finished.add(record["path"])
+                    else:
+                        self.finished.discard(record["path"])
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, path: str, status: str, **fields: Any):
+        self._file.write(json.dumps({"path": path, "status": status, **fields}) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class BulkImporter:
+    def __init__(self, session: Session, checkpoint: Checkpoint, workers: int, batch_size: int,
+                 report_every: float):
+        self.session = session
+        self.documents = DocumentService(session)
+        self.checkpoint = checkpoint
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.report_every = report_every
+        self.counters = {"files": 0, "pages": 0, "chunks": 0, "skipped": 0, "failed": 0}
+        self._seen_hashes: Set[str] = set()
+        # Files whose chunks are (partly) buffered or written but whose Document isn't final yet.
+        self._files: List[Dict[str, Any]] = []
+        self._buffer: List[Dict[str, Any]] = []
+        self._started = self._last_report = time.perf_counter()
+
+    def discard_unfinished(self):
+        """Removes the Documents, chunks and stored files of files an interrupted run had started."""
+        for record in self.checkpoint.started.values():
+            doc = self.session.get(Document, record["doc_id"])
+            if doc is not None and doc.content_hash == record["content_hash"]:
+                self.documents.remove_chunks(self.documents.chunk_ids(doc))
+                self.session.delete(doc)
+                self.session.commit()
+            if os.path.exists(record["filepath"]):
+                os.remove(record["filepath"])
+        if self.checkpoint.started:
+            print(f"--- [IMPORT] Discarded {len(self.checkpoint.started)} partially imported files ---")
+
+    def iter_paths(self, root: str) -> Iterator[str]:
+        """Supported files under `root` that the checkpoint doesn't list as finished, in a stable order."""
+        for directory, subdirectories, filenames in os.walk(root):
+            subdirectories.sort()
+            for filename in sorted(filenames):
+                path = os.path.abspath(os.path.join(directory, filename))
+                if os.path.splitext(filename)[1].lower() in PARSERS and path not in self.checkpoint.finished:
+                    yield path
+
+    def run(self, root: str):
+        self.discard_unfinished()
+        known_hashes = frozenset(self.session.exec(select(Document.content_hash)).all())
+        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+
+        max_inflight = 2 * self.workers
+        pending: Set[Future] = set()
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=(known_hashes,),
+        )
+        try:
+            for path in self.iter_paths(root):
+                pending.add(executor.submit(_parse_file, path))
+                if len(pending) >= max_inflight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._add(future.result())
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._add(future.result())
+            self._flush()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            # Stored copies of files that were parsed but never got a Document.
+            unstarted = [f["filepath"] for f in self._files if f["doc_id"] is None]
+            for future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    unstarted.append(future.result().get("filepath"))
+            for filepath in unstarted:
+                if filepath and os.path.exists(filepath):
+                    os.remove(filepath)
+        self._report(final=True)
+
+    def _add(self, result: Dict[str, Any]):
+        """Chunks a parsed file into the write buffer, or records why it is skipped."""
+        status = result["status"]
+        if status == "parsed" and result["content_hash"] in self._seen_hashes:
+            os.remove(result["filepath"])  # Same content as a file earlier in this run.
+            status = "skipped"
+        if status != "parsed":
+            self.counters[status] += 1
+            self.checkpoint.record(result["path"], status, **({"error": result["error"]} if "error" in result else {}))
+            self._maybe_report()
+            return
+
+        self._seen_hashes.add(result["content_hash"])
+        file = {
+            "path": result["path"], "filename": result["filename"], "filepath": result["filepath"],
+            "content_hash": result["content_hash"], "metadata": result["metadata"],
+            "pages": len(result["pages"]), "chunks": 0, "unwritten": 0, "chunked": False, "doc_id": None,
+        }
+        self._files.append(file)
+        # doc_id is stamped into the chunk metadata once the Document rows of the batch exist.
+        for chunk in self.documents.iter_chunks(result["pages"], file["filename"], file["filepath"], None):
+            chunk["file"] = file
+            file["chunks"] += 1
+            file["unwritten"] += 1
+            self._buffer.append(chunk)
+            if len(self._buffer) >= self.batch_size:
+                self._flush()
+        file["chunked"] = True
+        if len(self._files) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        """
+        Writes the buffered chunks: one transaction creates the Document rows of
+        files new to this batch, the chunks are embedded and indexed in one
+        batch, and one transaction records the chunk_count of completed files.
+        """
+        new_files = [f for f in self._files if f["doc_id"] is None]
+        if new_files:
+            docs = [
+                Document(filename=f["filename"], filepath=f["filepath"], content_hash=f["content_hash"],
+                         chunk_count=0, document_metadata=f["metadata"], status="ingesting")
+                for f in new_files
+            ]
+            self.session.add_all(docs)
+            self.session.flush()
+            for file, doc in zip(new_files, docs):
+                file["doc_id"] = doc.id
+                # Logged before the commit, so a crash can't leave an untracked Document.
+                self.checkpoint.record(file["path"], "started", doc_id=doc.id,
+                                       content_hash=file["content_hash"], filepath=file["filepath"])
+            self.session.commit()
+
+        if self._buffer:
+            for chunk in self._buffer:
+                chunk["metadata"]["doc_id"] = chunk["file"]["doc_id"]
+            embeddings = embed_texts_cached([c["text"] for c in self._buffer])
+            for chunk, embedding in zip(self._buffer, embeddings):
+                chunk["embedding"] = embedding
+            self.documents.index_chunks(self._buffer)
+            for chunk in self._buffer:
+                chunk["file"]["unwritten"] -= 1
+            self._buffer = []
+
+        complete = [f for f in self._files if f["chunked"] and f["unwritten"] == 0]
+        if complete:
+            self.session.exec(update(Document), params=[
+                {"id": f["doc_id"], "chunk_count": f["chunks"], "status": "ready"} for f in complete
+            ])
+            self.session.commit()
+            for file in complete:
+                self.checkpoint.record(file["path"], "done", doc_id=file["doc_id"])
+                self.counters["files"] += 1
+                self.counters["pages"] += file["pages"]
+                self.counters["chunks"] += file["chunks"]
+            self._files = [f for f in self._files if not (f["chunked"] and f["unwritten"] == 0)]
+        self._maybe_report()
+
+    def _maybe_report(self):
+        if time.perf_counter() - self._last_report >= self.report_every:
+            self._report()
+
+    def _report(self, final: bool = False):
+        self._last_report = time.perf_counter()
+        elapsed = max(self._last_report - self._started, 1e-9)
+        c = self.counters
+        print(
+            f"--- [IMPORT] {'Finished: ' if final else ''}{c['files']} files, {c['pages']} pages, {c['chunks']} chunks "
+            f"in {elapsed:.1f}s ({c['files'] / elapsed:.2f} files/s, {c['pages'] / elapsed:.2f} pages/s, "
+            f"{c['chunks'] / elapsed:.1f} chunks/s); {c['skipped']} skipped, {c['failed']} failed ---",
+            flush=True,
+        )
+
+
+def _default_checkpoint(root: str) -> str:
+    digest = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(os.path.dirname(settings.SQLITE_PATH), f"bulk_import_{digest}.jsonl")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bulk_import", description="Import a directory tree of documents.")
+    parser.add_argument("directory", help="Directory to import recursively.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parse worker processes.")
+    parser.add_argument("--batch-size", type=int, default=512, help="Chunks embedded and written per batch.")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: one per directory next to the SQLite database).")
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between throughput reports.")
+    options = parser.parse_args(argv)
+
+    if not os.path.isdir(options.directory):
+        parser.error(f"not a directory: {options.directory}")
+    checkpoint_path = options.checkpoint or _default_checkpoint(options.directory)
+
+    init_db()
+    init_keyword_index()
+    checkpoint = Checkpoint(checkpoint_path)
+    if checkpoint.finished:
+        print(f"--- [IMPORT] Resuming from {checkpoint_path} ({len(checkpoint.finished)} files already processed) ---")
+    try:
+        with Session(engine) as session:
+            BulkImporter(session, checkpoint, options.workers, options.batch_size, options.report_every).run(
+                options.directory
+            )
+    except KeyboardInterrupt:
+        print("--- [IMPORT] Interrupted; run the same command again to resume ---", file=sys.stderr)
+        return 130
+    finally:
+        checkpoint.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, AsyncGenerator, Callable, Iterator, Optional, TypeVar
+
+from .settings import settings
+
+T = TypeVar("T")
+
+
+@lru_cache(maxsize=1)
+def get_rag_executor() -> ThreadPoolExecutor:
+    """
+    Returns the thread pool that runs blocking RAG stages (model inference,
+    Chroma and SQLite calls) so that they never block the event loop.
+    """
+    return ThreadPoolExecutor(max_workers=settings.RAG_EXECUTOR_WORKERS, thread_name_prefix="rag")
+
+
+@lru_cache(maxsize=1)
+def get_generation_executor() -> ThreadPoolExecutor:
+    """
+    Returns the thread pool for work that waits for a generation model slot
+    (HyDE and answer token streams). It has a thread for every request the
+    generation scheduler admits, so queued generations never hold the RAG
+    executor's threads that cheap stages (embedding, BM25, rerank) need.
+    """
+    return ThreadPoolExecutor(
+        max_workers=max(1, settings.LLM_MAX_CONCURRENCY) + max(0, settings.LLM_MAX_QUEUE),
+        thread_name_prefix="generate",
+    )
+
+
+async def run_in_executor(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs a blocking callable on the RAG executor and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_rag_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def run_in_generation_executor(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs a blocking callable that waits for a model slot on the generation executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_generation_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def iterate_in_thread(
+    make_iterator: Callable[[], Iterator[T]],
+    stop: Optional[threading.Event] = None,
+    executor: Optional[ThreadPoolExecutor] = None,
+) -> AsyncGenerator[T, None]:
+    """
+    Drives a blocking iterator (e.g. an LLM token stream) on a worker thread of
+    `executor` (default: the RAG executor) and yields its items through an
+    asyncio queue. When the consumer stops early (e.g. the client
+    disconnected), `stop` is set and the worker stops before pulling the next
+    item; pass your own event to let the iterator observe it.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = stop or threading.Event()
+    done = object()
+
+    def publish(item: Any, error: Optional[BaseException] = None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+        except RuntimeError:
+            # The event loop is gone; nobody is listening anymore.
+            stop.set()
+
+    def pump():
+        try:
+            iterator = make_iterator()
+            try:
+                for item in iterator:
+                    if stop.is_set():
+                        break
+                    publish(item)
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+        except BaseException as e:
+            publish(done, e)
+            return
+        publish(done)
+
+    loop.run_in_executor(executor or get_rag_executor(), pump)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                break
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,217 @@
+import os
+import sys
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# --- Prometheus Metrics ---
+# A small in-process registry that renders the Prometheus text exposition
+# format (version 0.0.4). Metrics are plain in-memory counters, gauges and
+# histograms, so a scrape never touches the databases; gauges derived from
+# other components are refreshed by `services.metrics_service` at scrape time.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        if not self.labelnames:
+            self._values[()] = 0.0
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(upper)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# --- HTTP ---
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "rag_http_request_duration_seconds",
+    "Time until the response starts, per route template (streams are covered by the stage metrics).",
+    ["method", "route", "status"],
+)
+
+# --- Query pipeline ---
+QUERY_STAGE_DURATION = REGISTRY.histogram(
+    "rag_query_stage_duration_seconds", "Duration of each RAG query stage.", ["stage"],
+)
+QUERIES = REGISTRY.counter("rag_queries_total", "Chat queries answered, by answer source.", ["source"])
+PROMPT_TOKENS = REGISTRY.counter("rag_prompt_tokens_total", "Prompt tokens evaluated by the generation model.")
+COMPLETION_TOKENS = REGISTRY.counter("rag_completion_tokens_total", "Tokens generated by the generation model.")
+
+# --- Ingestion ---
+INGESTED_FILES = REGISTRY.counter("rag_ingested_files_total", "Files processed by the ingestion pool.", ["status"])
+INGESTED_PAGES = REGISTRY.counter("rag_ingested_pages_total", "Pages (or page-less documents) parsed during ingestion.")
+INGESTED_CHUNKS = REGISTRY.counter("rag_ingested_chunks_total", "Chunks written to the indexes during ingestion.")
+EMBEDDING_STORE_LOOKUPS = REGISTRY.counter(
+    "rag_embedding_store_lookups_total", "Chunk embedding lookups in the embedding store.", ["result"],
+)
+INGESTION_FILE_DURATION = REGISTRY.histogram(
+    "rag_ingestion_file_duration_seconds", "Wall-clock time to ingest one file.",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0),
+)
+
+# --- Database ---
+DB_WRITES = REGISTRY.counter(
+    "rag_db_writes_total", "Writes handed to the background DB writer, by outcome.", ["result"],
+)
+
+# --- Models ---
+MODEL_LOAD_SECONDS = REGISTRY.gauge("rag_model_load_seconds", "Time taken to load each model.", ["model"])
+MODEL_MEMORY_BYTES = REGISTRY.gauge(
+    "rag_model_resident_memory_bytes", "Growth of resident memory while loading each model (approximate).", ["model"],
+)
+
+# --- Gauges refreshed at scrape time ---
+PROCESS_RESIDENT_MEMORY = REGISTRY.gauge("rag_process_resident_memory_bytes", "Resident memory of the API process.")
+QUEUE_DEPTH = REGISTRY.gauge("rag_queue_depth", "Items waiting in internal queues.", ["queue"])
+GENERATION_SLOTS = REGISTRY.gauge("rag_generation_requests", "Chat requests in the generation scheduler.", ["state"])
+CACHE_HIT_RATIO = REGISTRY.gauge("rag_cache_hit_ratio", "Hit ratio of in-memory caches since start.", ["cache"])
+CACHE_ENTRIES = REGISTRY.gauge("rag_cache_entries", "Entries held by in-memory caches.", ["cache"])
+CHROMA_CHUNKS = REGISTRY.gauge("rag_chroma_collection_chunks", "Chunks in the Chroma collection.")
+
+
+def resident_memory_bytes() -> int:
+    """Current resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource  # Unix only; /proc covers Linux.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
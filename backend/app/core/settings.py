@@ -19,19 +19,149 @@ class Settings(BaseSettings):
     # CORRECTED: Define a central, project-level directory for all Hugging Face models.
     HF_HOME_DIR: str = str(BACKEND_ROOT / "models")
     
+    # --- Models ---
+    # "hf" loads the models below; "stub" swaps in the fast, deterministic
+    # stand-ins from rag/stub_models.py (benchmarks, offline development).
+    MODEL_BACKEND: str = "hf"
+    STUB_EMBEDDING_DIM: int = 384
+    STUB_ANSWER_TOKENS: int = 64
+    EMBEDDING_MODEL: str = "BAAI/bge-m3"
+    RERANKER_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    LLM_REPO_ID: str = "TheBloke/LLaMA-Pro-8B-Instruct-GGUF"
+    LLM_MODEL_FILE: str = "llama-pro-8b-instruct.Q2_K.gguf"
+    LLM_MODEL_TYPE: str = "llama"
+    LLM_GPU_LAYERS: int = 50
+    # One of the templates in rag/prompts.py: "llama-pro", "llama-3", "chatml".
+    LLM_PROMPT_FORMAT: str = "llama-pro"
+    
     # --- Database ---
     SQLITE_PATH: str = str(BACKEND_ROOT / "data/sqlite/main.db")
     CHROMA_PERSIST_DIR: str = str(BACKEND_ROOT / "data/chroma")
+    # SQLite runs in WAL mode, so reads don't block the writer (and vice versa).
+    # Lock waits of up to SQLITE_BUSY_TIMEOUT_MS are retried instead of failing
+    # with "database is locked".
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024
+    SQLITE_MMAP_SIZE_BYTES: int = 256 * 1024 * 1024
+    SQLITE_POOL_SIZE: int = 20
+    SQLITE_MAX_OVERFLOW: int = 20
+    
+    # --- Background DB Writer ---
+    # Conversations, query traces and query cache entries are written by one
+    # background thread; writes queued within DB_WRITER_MAX_DELAY_MS of each
+    # other (up to DB_WRITER_MAX_BATCH) share a transaction.
+    DB_WRITER_MAX_BATCH: int = 256
+    DB_WRITER_MAX_DELAY_MS: float = 20.0
+    DB_WRITER_MAX_QUEUE: int = 10000
+    
+    # --- Embedding Cache ---
+    # Chunk embeddings are cached on disk by (model, text hash); float16 halves the footprint.
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_DIR: str = str(BACKEND_ROOT / "data/embeddings")
+    EMBEDDING_CACHE_DTYPE: str = "float16"
     
     # --- File Storage ---
     UPLOAD_DIR: str = str(BACKEND_ROOT / "uploads")
     
+    # --- Ingestion ---
+    # Number of files processed in parallel by the background ingestion workers.
+    INGEST_WORKERS: int = 2
+    # Uploads are streamed to disk in blocks of this size; 0 disables the size limit.
+    UPLOAD_BLOCK_SIZE: int = 1024 * 1024
+    MAX_UPLOAD_BYTES: int = 512 * 1024 * 1024
+    # Whole upload request (all files), checked against Content-Length before the body is read; 0 disables.
+    MAX_UPLOAD_REQUEST_BYTES: int = 2 * 1024 * 1024 * 1024
+    # Chunks are embedded and written to Chroma in batches; at most
+    # INGEST_MAX_PENDING_BATCHES embedded batches wait for the writer.
+    EMBED_BATCH_SIZE: int = 64
+    INGEST_MAX_PENDING_BATCHES: int = 2
+    
     # --- RAG Defaults ---
+    # Chunk size and overlap are measured in CHUNK_SIZE_UNIT: "chars", or "tokens"
+    # of the embedding model's tokenizer (capped at the model's input window).
     DEFAULT_CHUNK_SIZE: int = 256
     DEFAULT_CHUNK_OVERLAP: int = 64
+    CHUNK_SIZE_UNIT: str = "chars"
+    
+    # --- Query Pipeline ---
+    # Worker threads for blocking RAG stages (embedding, BM25, rerank, Chroma and
+    # SQLite calls). Work that waits for a model slot (HyDE, answer streaming) runs
+    # on its own pool of LLM_MAX_CONCURRENCY + LLM_MAX_QUEUE threads.
+    RAG_EXECUTOR_WORKERS: int = 8
+    
+    # --- Generation Scheduler ---
+    # Each concurrent generation needs its own model instance (ctransformers is
+    # not thread-safe), so LLM_MAX_CONCURRENCY > 1 multiplies the LLM's memory.
+    # Chat requests beyond LLM_MAX_CONCURRENCY + LLM_MAX_QUEUE get a 429.
+    LLM_MAX_CONCURRENCY: int = 1
+    LLM_MAX_QUEUE: int = 8
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 60.0
+    LLM_RETRY_AFTER_SECONDS: int = 5
+    # Upper bound for a request's `max_new_tokens`, and the default when unset.
+    LLM_MAX_NEW_TOKENS: int = 1024
+    
+    # --- Prompt Packing ---
+    # Retrieved chunks are packed in rerank order into at most PROMPT_CONTEXT_TOKENS
+    # tokens, always leaving LLM_MIN_NEW_TOKENS of the context window for the answer.
+    LLM_CONTEXT_LENGTH: int = 4096
+    PROMPT_CONTEXT_TOKENS: int = 1536
+    LLM_MIN_NEW_TOKENS: int = 256
+    CONTEXT_MIN_CHUNK_TOKENS: int = 64
+    
+    # --- Micro-batching ---
+    # Query-time embedding and rerank calls from concurrent requests are collected
+    # for up to MICROBATCH_MAX_WAIT_MS (or until the batch is full) and run as one
+    # forward pass. Sizes count texts / (query, chunk) pairs, not requests.
+    MICROBATCH_ENABLED: bool = True
+    MICROBATCH_MAX_WAIT_MS: float = 5.0
+    EMBED_MICROBATCH_MAX_SIZE: int = 32
+    RERANK_MICROBATCH_MAX_SIZE: int = 128
+    
+    # --- Re-ranking ---
+    # Only the best RERANK_TOP_N candidates after RRF are scored by the Cross-Encoder.
+    RERANK_TOP_N: int = 20
+    RERANK_BATCH_SIZE: int = 32
+    RERANK_CACHE_SIZE: int = 20000
+    RERANK_CACHE_TTL_SECONDS: int = 60 * 60
+    # "torch" or "onnx". The ONNX backend needs sentence-transformers>=4.1 with
+    # `optimum[onnxruntime]`; RERANKER_ONNX_FILE selects e.g. an int8-quantized export.
+    RERANKER_BACKEND: str = "torch"
+    RERANKER_ONNX_FILE: str = "onnx/model_qint8_avx512.onnx"
+    
+    # --- Query Cache (HyDE) ---
+    # Deterministic HyDE uses greedy decoding so its output can be cached.
+    HYDE_DETERMINISTIC: bool = False
+    QUERY_CACHE_SIZE: int = 1024
+    QUERY_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    QUERY_CACHE_PERSIST: bool = True
+    # The persisted table is pruned to this many rows (and to the TTL) on
+    # startup and every QUERY_CACHE_PRUNE_EVERY writes.
+    QUERY_CACHE_MAX_ROWS: int = 10000
+    QUERY_CACHE_PRUNE_EVERY: int = 256
+    
+    # --- Answer Cache ---
+    # Finished answers are reused for queries whose embedding has at least
+    # ANSWER_CACHE_SIMILARITY cosine similarity, until the corpus changes.
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIZE: int = 512
+    ANSWER_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    ANSWER_CACHE_SIMILARITY: float = 0.95
+    
+    # --- PDF Page Pipeline ---
+    # Pages of large PDFs are extracted/OCR'd in a pool of PDF_WORKERS processes.
+    PDF_WORKERS: int = min(8, os.cpu_count() or 1)
+    PDF_PAGES_PER_TASK: int = 4
+    PDF_MAX_INFLIGHT_PAGES: int = 32
+    PDF_PARALLEL_MIN_PAGES: int = 8
     
     # --- OCR ---
     OCR_ENABLED: bool = True
+    # Adaptive mode renders each page so its long side is ~OCR_TARGET_LONG_SIDE_PX,
+    # clamped to [OCR_MIN_DPI, OCR_DPI]. Otherwise every page is rendered at OCR_DPI.
+    OCR_DPI: int = 300
+    OCR_ADAPTIVE_DPI: bool = True
+    OCR_MIN_DPI: int = 150
+    OCR_TARGET_LONG_SIDE_PX: int = 2500
     PADDLEOCR_LANG: str = "en"
     PADDLEOCR_USE_GPU: bool = False
 
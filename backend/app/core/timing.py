@@ -0,0 +1,66 @@
+import time
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# --- Per-Request Stage Timings ---
+# A StageTimings collects wall-clock durations for the stages of one query.
+# Code deep in the pipeline (e.g. HyDE inside the semantic leg) reports through
+# `timed_stage`, which finds the request's timings via a context variable that
+# `StageTimings.bind` sets on the worker thread running the stage.
+
+_current_timings: ContextVar[Optional["StageTimings"]] = ContextVar("stage_timings", default=None)
+
+
+class StageTimings:
+    """Thread-safe map of stage name -> accumulated milliseconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, ms: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000.0)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000.0
+
+    def bind(self, func: Callable[..., T]) -> Callable[..., T]:
+        """Wraps `func` so that `timed_stage` calls made while it runs report here."""
+        @functools.wraps(func)
+        def run(*args: Any, **kwargs: Any) -> T:
+            token = _current_timings.set(self)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _current_timings.reset(token)
+        return run
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return {stage: round(ms, 3) for stage, ms in self.stages.items()}
+
+
+@contextmanager
+def timed_stage(name: str) -> Iterator[None]:
+    """Times the block into the current request's StageTimings, if there is one."""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    with timings.stage(name):
+        yield
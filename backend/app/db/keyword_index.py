@@ -0,0 +1,105 @@
+import re
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+from .sqlite_db import engine
+from .chroma_db import get_or_create_collection
+
+# Persistent BM25 keyword index backed by SQLite FTS5.
+# `chunk_keys` maps Chroma chunk ids onto integer rowids so that the FTS table
+# can be patched (insert/delete) per chunk without scanning its content.
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def init_keyword_index():
+    """Creates the FTS5 keyword index tables if they don't exist yet."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS chunk_keys ("
+            "rowid INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE)"
+        ))
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts "
+            "USING fts5(text, tokenize='unicode61 remove_diacritics 2')"
+        ))
+
+
+def add_chunks(ids: List[str], texts: List[str]):
+    """Indexes chunks, replacing the indexed text of any id that already exists."""
+    if not ids:
+        return
+    rows = [{"chunk_id": chunk_id, "text": chunk} for chunk_id, chunk in zip(ids, texts)]
+    with engine.begin() as conn:
+        conn.execute(text("INSERT OR IGNORE INTO chunk_keys (chunk_id) VALUES (:chunk_id)"), rows)
+        conn.execute(text(
+            "DELETE FROM chunk_fts WHERE rowid = (SELECT rowid FROM chunk_keys WHERE chunk_id = :chunk_id)"
+        ), rows)
+        conn.execute(text(
+            "INSERT INTO chunk_fts (rowid, text) SELECT rowid, :text FROM chunk_keys WHERE chunk_id = :chunk_id"
+        ), rows)
+
+
+def delete_chunks(ids: List[str]):
+    """Removes chunks from the index by their Chroma ids."""
+    if not ids:
+        return
+    rows = [{"chunk_id": chunk_id} for chunk_id in ids]
+    with engine.begin() as conn:
+        conn.execute(text(
+            "DELETE FROM chunk_fts WHERE rowid = (SELECT rowid FROM chunk_keys WHERE chunk_id = :chunk_id)"
+        ), rows)
+        conn.execute(text("DELETE FROM chunk_keys WHERE chunk_id = :chunk_id"), rows)
+
+
+def count_chunks() -> int:
+    """Returns the number of indexed chunks."""
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM chunk_keys")).scalar_one()
+
+
+def build_match_query(query: str) -> str:
+    """
+    Turns a free-text query into an FTS5 MATCH expression that ORs the
+    (quoted) query terms, mirroring the bag-of-words scoring of BM25.
+    """
+    terms = dict.fromkeys(t.lower() for t in _TOKEN_RE.findall(query))
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+def search(query: str, limit: int) -> List[Tuple[str, float]]:
+    """
+    Returns up to `limit` (chunk_id, bm25_score) pairs, best match first.
+    Only the postings of the query terms are read. FTS5 reports BM25 as a
+    negative number, so it is negated here to keep "higher is better".
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT k.chunk_id, hits.rank FROM "
+            "(SELECT rowid, rank FROM chunk_fts WHERE chunk_fts MATCH :match ORDER BY rank LIMIT :limit) AS hits "
+            "JOIN chunk_keys k ON k.rowid = hits.rowid ORDER BY hits.rank"
+        ), {"match": match, "limit": limit}).all()
+    return [(chunk_id, -float(rank)) for chunk_id, rank in rows]
+
+
+def sync_keyword_index(batch_size: int = 1000):
+    """
+    Backfills the keyword index from the Chroma collection when the two are
+    out of step (e.g. a collection created before the index existed).
+    """
+    collection = get_or_create_collection()
+    total = collection.count()
+    if total == count_chunks():
+        return
+    print(f"--- [INFO] Rebuilding keyword index from {total} stored chunks ---")
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM chunk_fts"))
+        conn.execute(text("DELETE FROM chunk_keys"))
+    for offset in range(0, total, batch_size):
+        batch = collection.get(limit=batch_size, offset=offset, include=["documents"])
+        add_chunks(batch["ids"], batch["documents"])
+    print("--- [INFO] Keyword index rebuilt. ---")
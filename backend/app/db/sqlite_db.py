@@ -1,4 +1,6 @@
 import os
+from sqlalchemy import event, inspect
+from sqlalchemy.schema import CreateColumn
 from sqlmodel import create_engine, SQLModel, Session
 from ..core.settings import settings
 from ..models import database # Import to ensure models are registered
@@ -9,13 +11,53 @@ os.makedirs(db_dir, exist_ok=True)
 
 # The file path for the SQLite database
 sqlite_url = f"sqlite:///{settings.SQLITE_PATH}"
-engine = create_engine(sqlite_url, echo=False)
+engine = create_engine(
+    sqlite_url,
+    echo=False,
+    # Connections are shared by the API threadpool, the RAG executor and the
+    # ingestion/writer threads, so one pooled connection may be used from several threads.
+    connect_args={"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000.0},
+    pool_size=settings.SQLITE_POOL_SIZE,
+    max_overflow=settings.SQLITE_MAX_OVERFLOW,
+)
+
+@event.listens_for(engine, "connect")
+def _configure_connection(dbapi_connection, connection_record):
+    """
+    Per-connection pragmas: WAL lets readers run alongside the single writer,
+    synchronous=NORMAL is durable in WAL mode except for the last commits on
+    power loss, and busy_timeout makes lock contention wait instead of fail.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE_BYTES)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
 
 def init_db():
-    """Creates all database tables based on SQLModel metadata."""
+    """
+    Creates all database tables based on SQLModel metadata, and any column or
+    index that was added to an existing table since it was created (ALTER TABLE
+    ADD COLUMN, relying on the column's server default for existing rows, and
+    CREATE INDEX IF NOT EXISTS).
+    """
     SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN {ddl}')
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 def get_session():
     """Provides a database session for dependency injection."""
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
@@ -0,0 +1,168 @@
+import time
+import queue
+import threading
+import traceback
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlmodel import Session
+
+from ..core.settings import settings
+from ..core.metrics import DB_WRITES
+from .sqlite_db import engine
+
+# --- Background DB Writer ---
+# Request paths hand their inserts (conversations, query traces, query cache
+# entries) to one writer thread instead of committing inline, so a streamed
+# response never waits on SQLite. Group commit: everything queued while the
+# previous transaction was running, or within `max_delay` of the first queued
+# write, is applied in a single transaction.
+
+WriteOperation = Callable[[Session], None]
+_STOP = object()
+
+
+class BackgroundWriter:
+    """
+    Applies queued write operations `op(session)` on a dedicated thread. An
+    operation must build its own ORM objects, because it is re-run in a fresh
+    session if the batch it was part of fails. Writes are numbered in
+    submission order and applied in that order.
+    """
+
+    def __init__(self, max_batch: int, max_delay: float, max_queue: int):
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, max_queue))
+        self._cond = threading.Condition()
+        self._submitted_seq = 0
+        self._applied_seq = 0
+        self._closed = False
+        self.counters = {"submitted": 0, "committed": 0, "failed": 0, "transactions": 0, "dropped": 0}
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation: WriteOperation) -> Optional[int]:
+        """
+        Queues a write and returns its sequence number (see `flush`). Never
+        blocks and never writes on the caller's thread, which is often the
+        event loop: if the writer is stopped or its queue is full, the write is
+        dropped, counted and None is returned.
+        """
+        with self._cond:
+            if not self._closed:
+                try:
+                    self._queue.put_nowait((self._submitted_seq + 1, operation))
+                except queue.Full:
+                    pass
+                else:
+                    self._submitted_seq += 1
+                    self.counters["submitted"] += 1
+                    return self._submitted_seq
+            self.counters["dropped"] += 1
+            dropped = self.counters["dropped"]
+        DB_WRITES.inc(result="dropped")
+        if dropped % 1000 == 1:
+            print(f"--- [WARNING] DB writer is stopped or its queue is full; {dropped} write(s) dropped so far ---")
+        return None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._drain()
+                return
+            batch, stopping = [item], False
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stopping:
+                self._drain()
+                return
+
+    def _drain(self):
+        """Applies writes that raced with shutdown and were queued behind the stop marker."""
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            self._commit(batch)
+
+    def _commit(self, batch: List[Tuple[int, WriteOperation]]):
+        committed, failed = self._apply([operation for _, operation in batch])
+        DB_WRITES.inc(committed, result="committed")
+        DB_WRITES.inc(failed, result="failed")
+        with self._cond:
+            self._applied_seq = batch[-1][0]
+            self.counters["committed"] += committed
+            self.counters["failed"] += failed
+            self._cond.notify_all()
+
+    def _apply(self, batch: List[WriteOperation]):
+        """Commits the batch in one transaction, falling back to one transaction per write."""
+        try:
+            with Session(engine) as session:
+                for operation in batch:
+                    operation(session)
+                session.commit()
+            with self._cond:
+                self.counters["transactions"] += 1
+            return len(batch), 0
+        except Exception:
+            if len(batch) == 1:
+                print("---!!! [CRITICAL ERROR] Background DB write failed !!!---")
+                traceback.print_exc()
+                return 0, 1
+
+        committed = failed = 0
+        for operation in batch:
+            c, f = self._apply([operation])
+            committed += c
+            failed += f
+        return committed, failed
+
+    def flush(self, timeout: float = None, seq: Optional[int] = None) -> bool:
+        """
+        Waits until write `seq` (by default: every write submitted before this
+        call) has been applied. Writes submitted later don't extend the wait.
+        Returns False on timeout.
+        """
+        with self._cond:
+            target = self._submitted_seq if seq is None else seq
+            return self._cond.wait_for(lambda: self._applied_seq >= target, timeout)
+
+    def shutdown(self, timeout: float = None):
+        """Applies everything still queued, then stops the thread. Later writes are dropped."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"queued": self._submitted_seq - self._applied_seq, **self.counters}
+
+
+@lru_cache(maxsize=1)
+def get_background_writer() -> BackgroundWriter:
+    """Returns the process-wide background DB writer."""
+    return BackgroundWriter(
+        max_batch=settings.DB_WRITER_MAX_BATCH,
+        max_delay=settings.DB_WRITER_MAX_DELAY_MS / 1000.0,
+        max_queue=settings.DB_WRITER_MAX_QUEUE,
+    )
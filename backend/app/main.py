@@ -1,11 +1,22 @@
 # This file can be left empty.```
 
 ##### `app/main.py`
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from .core.settings import settings
 from .db.sqlite_db import init_db
+from .db.keyword_index import init_keyword_index, sync_keyword_index
 from .routes import documents, chat, analytics, config
+from .services.ingestion_service import get_ingestion_pool
+from .services.document_service import backfill_chunk_doc_ids
+from .db.writer import get_background_writer
+from .services.analytics_service import backfill_analytics_rollups
+from .services.chat_history_service import backfill_chat_sessions
+from .rag.query_cache import prune_query_cache
+from .services.metrics_service import render_metrics
+from .core.metrics import HTTP_REQUEST_DURATION, CONTENT_TYPE
 
 
 app = FastAPI(
@@ -21,8 +32,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    """Observes request latency per route template (not per raw path, to keep label cardinality bounded)."""
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status_code),
+        )
+
 # Include API routers
 app.include_router(documents.router, prefix="/api/documents", tags=["Documents"])
 app.include_router(chat.router, prefix="/api/chat", tags=["Chat"])
@@ -31,10 +61,32 @@ app.include_router(config.router, prefix="/api/config", tags=["Configuration"])
 
 @app.on_event("startup")
 def on_startup():
-    """Initialize the database on application startup."""
+    """
+    Initialize the database, analytics rollups, chat session summaries, chunk
+    document ids and the keyword index, and prune the persisted query cache, on
+    application startup.
+    """
     init_db()
+    prune_query_cache()
+    backfill_analytics_rollups()
+    backfill_chat_sessions()
+    init_keyword_index()
+    sync_keyword_index()
+    backfill_chunk_doc_ids()
+    get_ingestion_pool().resume_unfinished()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    """Stop handing out queued ingestion work (unfinished jobs resume on next start) and flush queued DB writes."""
+    get_ingestion_pool().shutdown()
+    get_background_writer().shutdown()
 
 @app.get("/api/health", tags=["Health"])
 def health_check():
     """Health check endpoint to verify API is running."""
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
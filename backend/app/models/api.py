@@ -15,6 +15,21 @@ class UploadResponse(BaseModel):
     success: List[DocumentOut]
     errors: List[Dict[str, str]]
 
+class IngestionJobOut(BaseModel):
+    job_id: str
+    status: str
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    total_files: int
+    processed_files: int
+    failed_files: int
+    # Per-file stage ("queued", "parsing", "embedding", "indexing", "done", "failed") and counters.
+    files: List[Dict[str, Any]]
+    # files/pages/chunks per second since the job started.
+    throughput: Dict[str, float]
+    result: Optional[UploadResponse]
+
 class ChunkOut(BaseModel):
     id: str
     text_preview: str
@@ -26,6 +41,12 @@ class ChatQueryIn(BaseModel):
     session_id: str
     query: str
     top_k: int = 5
+    # Overrides settings.HYDE_DETERMINISTIC for this request when set.
+    deterministic_hyde: Optional[bool] = None
+    # Answer token budget, capped at settings.LLM_MAX_NEW_TOKENS.
+    max_new_tokens: Optional[int] = None
+    # Skips the answer cache lookup; the fresh answer still replaces the cached one.
+    bypass_cache: bool = False
 
 class ChatQueryOut(BaseModel):
     answer: str
@@ -2,7 +2,7 @@ import json
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 
-from sqlalchemy import Column, TEXT
+from sqlalchemy import Column, Index, TEXT, LargeBinary
 from sqlalchemy.engine import Dialect
 from sqlalchemy.types import TypeDecorator
 from sqlmodel import Field, SQLModel
@@ -29,19 +29,124 @@ class Document(SQLModel, table=True):
     content_hash: str = Field(unique=True)
     chunk_count: int
     processed_at: datetime = Field(default_factory=datetime.utcnow)
+    # "ingesting" from the moment the row is claimed until all of its chunks are
+    # written; only "ready" documents are listed, served and counted.
+    status: str = Field(default="ready", index=True, sa_column_kwargs={"server_default": "ready"})
     
     # CORRECTED: Renamed the field from 'metadata' to 'document_metadata'
     # to avoid conflict with the reserved SQLAlchemy 'metadata' attribute.
     document_metadata: Dict[str, Any] = Field(default={}, sa_column=Column(JSONEncodedDict))
 
 class Conversation(SQLModel, table=True):
+    # (session_id, id) serves a session's turns in order, and pages through them by id.
+    __table_args__ = (Index("ix_conversation_session_id_id", "session_id", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     session_id: str = Field(index=True)
     query: str
     answer: str
     confidence: str
     response_time: float
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     
     # This field is fine, 'sources' is not a reserved name.
-    sources: List[Dict[str, Any]] = Field(default=[], sa_column=Column(JSONEncodedDict))
\ No newline at end of file
+    sources: List[Dict[str, Any]] = Field(default=[], sa_column=Column(JSONEncodedDict))
+
+class ChatSession(SQLModel, table=True):
+    """
+    One row per chat session, updated as its conversations are saved, so the
+    session list is read from here instead of grouping every Conversation.
+    """
+    __table_args__ = (Index("ix_chatsession_last_activity_at_session_id", "last_activity_at", "session_id"),)
+
+    session_id: str = Field(primary_key=True)
+    title: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_activity_at: datetime = Field(default_factory=datetime.utcnow)
+    turn_count: int = 0
+
+class QueryCacheEntry(SQLModel, table=True):
+    """Persisted HyDE generation and its embedding, keyed on the normalized query."""
+    key: str = Field(primary_key=True)
+    query: str
+    hypothetical_answer: str
+    embedding: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class IngestionJob(SQLModel, table=True):
+    """A batch of uploaded files processed in the background by the ingestion worker pool."""
+    id: str = Field(primary_key=True)
+    status: str = Field(default="queued", index=True)  # queued | running | completed
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    # Per-file entries of jobs created before IngestionFile rows existed; moved
+    # to IngestionFile rows when such a job is resumed.
+    files: List[Dict[str, Any]] = Field(default=[], sa_column=Column(JSONEncodedDict))
+    # The final UploadResponse, set once every file has finished.
+    result: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSONEncodedDict))
+
+
+class IngestionFile(SQLModel, table=True):
+    """
+    One file of an IngestionJob. Each worker updates only the row of the file
+    it is processing, so progress writes don't grow with the job's size.
+    """
+    # (job_id, stage) counts a job's unfinished files without scanning them all.
+    __table_args__ = (Index("ix_ingestionfile_job_id_stage", "job_id", "stage"),)
+
+    job_id: str = Field(foreign_key="ingestionjob.id", primary_key=True)
+    position: int = Field(primary_key=True)
+    stage: str = "queued"  # queued | parsing | embedding | indexing | done | failed
+    # filename, filepath, content_hash, counters and the resulting document or error.
+    data: Dict[str, Any] = Field(default={}, sa_column=Column(JSONEncodedDict))
+
+
+class AnalyticsRollup(SQLModel, table=True):
+    """
+    Hourly aggregates of Conversation rows, kept up to date as conversations
+    are saved and deleted, so analytics read O(hours) rows instead of every
+    conversation.
+    """
+    bucket_start: datetime = Field(primary_key=True)
+    queries: int = 0
+    response_time_sum: float = 0.0
+    latency_under_0_5s: int = 0
+    latency_0_5_to_1s: int = 0
+    latency_1_to_2s: int = 0
+    latency_2_to_5s: int = 0
+    latency_over_5s: int = 0
+    # Conversations with at least one source, and their summed min(1, sources / k).
+    with_sources: int = 0
+    p_at_1_sum: float = 0.0
+    p_at_3_sum: float = 0.0
+    p_at_5_sum: float = 0.0
+
+
+class QueryTrace(SQLModel, table=True):
+    """Per-stage latency (ms) and token counts of the query that produced a conversation."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: int = Field(foreign_key="conversation.id", index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    cached: bool = False
+
+    total_ms: Optional[float] = None
+    ttft_ms: Optional[float] = None
+    cache_lookup_ms: Optional[float] = None
+    retrieval_ms: Optional[float] = None
+    hyde_ms: Optional[float] = None
+    query_embedding_ms: Optional[float] = None
+    bm25_ms: Optional[float] = None
+    ann_ms: Optional[float] = None
+    rerank_ms: Optional[float] = None
+    sources_ms: Optional[float] = None
+    queue_wait_ms: Optional[float] = None
+    prompt_build_ms: Optional[float] = None
+    prefill_ms: Optional[float] = None
+    decode_ms: Optional[float] = None
+
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    tokens_per_sec: Optional[float] = None
@@ -0,0 +1,20 @@
+import os
+from typing import Dict, Optional
+
+from .base import BaseParser
+from . import pdf_parser, docx_parser, text_parser, md_parser, html_parser
+
+# Parser for each supported file extension. Parsers hold no per-file state.
+PARSERS: Dict[str, BaseParser] = {
+    ".pdf": pdf_parser.PDFParser(),
+    ".docx": docx_parser.DOCXParser(),
+    ".txt": text_parser.TextParser(),
+    ".md": md_parser.MDParser(),
+    ".html": html_parser.HTMLParser(),
+    ".htm": html_parser.HTMLParser(),
+}
+
+
+def get_parser(filename: str) -> Optional[BaseParser]:
+    """Returns the parser for a file name's extension, or None if the type is unsupported."""
+    return PARSERS.get(os.path.splitext(filename)[1].lower())
@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Optional, Tuple
 
 class ParseResult:
     def __init__(self, text: str, metadata: Dict[str, Any]):
@@ -7,4 +7,13 @@ class ParseResult:
 
 class BaseParser:
     def parse(self, file_path: str) -> ParseResult:
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def stream(self, file_path: str) -> Tuple[Dict[str, Any], Iterator[Tuple[Optional[int], str]]]:
+        """
+        Returns the document metadata and a lazy iterator of (page_number, text)
+        units. Formats without pages yield a single unit with page_number None;
+        paged formats override this to avoid materializing the whole document.
+        """
+        result = self.parse(file_path)
+        return result.metadata, iter([(None, result.text)])
@@ -1,11 +1,16 @@
 import logging
+import multiprocessing
 import pdfplumber
-from typing import List, Dict, Any
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Tuple
 
 from ..core.settings import settings
 from .base import BaseParser, ParseResult
 
 # --- Lazy-loading OCR Engine ---
+# Each page-worker process initializes its own engine on first use.
 _PADDLE_OCR_ENGINE = None
 
 def _get_paddleocr():
@@ -27,48 +32,121 @@ def _get_paddleocr():
         logging.error(f"Failed to initialize PaddleOCR engine: {e}")
         return None
 
+# --- Page Processing (runs in the page-worker processes) ---
+
+def _ocr_resolution(page) -> int:
+    """
+    Picks the rasterization DPI for OCR. In adaptive mode the page is rendered so
+    that its long side is about OCR_TARGET_LONG_SIDE_PX pixels, which keeps large
+    pages from producing huge images while small pages keep enough detail.
+    """
+    if not settings.OCR_ADAPTIVE_DPI:
+        return settings.OCR_DPI
+    long_side_inches = max(page.width, page.height) / 72.0
+    if long_side_inches <= 0:
+        return settings.OCR_DPI
+    dpi = int(settings.OCR_TARGET_LONG_SIDE_PX / long_side_inches)
+    return max(settings.OCR_MIN_DPI, min(settings.OCR_DPI, dpi))
+
+def _extract_page_text(page, page_num: int, file_path: str) -> str:
+    """Extracts a page's text layer, falling back to OCR only for pages without one."""
+    text = page.extract_text() or ""
+
+    if not text.strip() and settings.OCR_ENABLED:
+        logging.info(f"Page {page_num} of '{file_path}' contains no text. Attempting OCR...")
+        ocr_engine = _get_paddleocr()
+        if ocr_engine:
+            try:
+                img = page.to_image(resolution=_ocr_resolution(page)).original
+                result = ocr_engine.ocr(img, cls=True)
+                del img
+                if result and result[0] is not None:
+                    line_texts = [line[1][0] for line in result[0]]
+                    text = "\n".join(line_texts)
+                    logging.info(f"Successfully extracted {len(line_texts)} lines of text via OCR from page {page_num}.")
+                else:
+                    logging.warning(f"OCR run on page {page_num} but returned no results.")
+            except Exception as e:
+                logging.error(f"Error during OCR on page {page_num}: {e}")
+        # Release the rendered page image and layout caches before the next page.
+        page.flush_cache()
+    return text
+
+def _extract_pages(file_path: str, page_numbers: List[int]) -> List[Tuple[int, str]]:
+    """Worker entry point: returns (page_number, text) for a batch of 1-based pages."""
+    with pdfplumber.open(file_path) as pdf:
+        return [(n, _extract_page_text(pdf.pages[n - 1], n, file_path)) for n in page_numbers]
+
+@lru_cache(maxsize=1)
+def get_pdf_executor() -> ProcessPoolExecutor:
+    """
+    Returns the process pool used for page extraction and OCR. Workers are
+    spawned rather than forked so they don't inherit the parent's model threads.
+    """
+    return ProcessPoolExecutor(max_workers=settings.PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
 # --- The PDF Parser (Final Version) ---
 class PDFParser(BaseParser):
-    def parse(self, file_path: str) -> ParseResult:
-        full_text_parts = []
-        doc_metadata = {}
-        pages_metadata_list = [] # A list to hold metadata for each page
+    def iter_page_texts(self, file_path: str, page_count: int) -> Iterator[Tuple[int, str]]:
+        """
+        Yields (page_number, text) in page order. Large documents fan out across
+        the page-worker pool in batches of PDF_PAGES_PER_TASK pages; at most
+        PDF_MAX_INFLIGHT_PAGES pages are submitted ahead of the consumer, and each
+        worker rasterizes one page at a time, which bounds memory on scanned PDFs.
+        """
+        page_numbers = list(range(1, page_count + 1))
+        if page_count < settings.PDF_PARALLEL_MIN_PAGES or settings.PDF_WORKERS <= 1:
+            yield from _extract_pages(file_path, page_numbers)
+            return
+
+        batch_size = max(1, settings.PDF_PAGES_PER_TASK)
+        batches = iter([page_numbers[i:i + batch_size] for i in range(0, page_count, batch_size)])
+        max_inflight = max(1, settings.PDF_MAX_INFLIGHT_PAGES // batch_size)
 
+        executor = get_pdf_executor()
+        pending = deque()
+        try:
+            for batch in batches:
+                pending.append(executor.submit(_extract_pages, file_path, batch))
+                if len(pending) >= max_inflight:
+                    break
+            while pending:
+                results = pending.popleft().result()
+                next_batch = next(batches, None)
+                if next_batch is not None:
+                    pending.append(executor.submit(_extract_pages, file_path, next_batch))
+                yield from results
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _read_metadata(self, file_path: str) -> Dict[str, Any]:
         with pdfplumber.open(file_path) as pdf:
-            doc_metadata = {
+            return {
                 "title": pdf.metadata.get("Title"),
                 "author": pdf.metadata.get("Author"),
                 "page_count": len(pdf.pages),
             }
 
-            for i, page in enumerate(pdf.pages):
-                page_num = i + 1
-                text = page.extract_text() or ""
-                
-                if not text.strip() and settings.OCR_ENABLED:
-                    logging.info(f"Page {page_num} of '{file_path}' contains no text. Attempting OCR...")
-                    ocr_engine = _get_paddleocr()
-                    if ocr_engine:
-                        try:
-                            img = page.to_image(resolution=300).original
-                            result = ocr_engine.ocr(img, cls=True)
-                            if result and result[0] is not None:
-                                line_texts = [line[1][0] for line in result[0]]
-                                text = "\n".join(line_texts)
-                                logging.info(f"Successfully extracted {len(line_texts)} lines of text via OCR from page {page_num}.")
-                            else:
-                                logging.warning(f"OCR run on page {page_num} but returned no results.")
-                        except Exception as e:
-                            logging.error(f"Error during OCR on page {page_num}: {e}")
-                
-                full_text_parts.append(text)
-                # Store this page's specific metadata
-                pages_metadata_list.append({
-                    "text": text,
-                    "page_number": page_num
-                })
+    def stream(self, file_path: str) -> Tuple[Dict[str, Any], Iterator[Tuple[int, str]]]:
+        """Returns the document metadata and the pages as they are extracted, in order."""
+        doc_metadata = self._read_metadata(file_path)
+        return doc_metadata, self.iter_page_texts(file_path, doc_metadata["page_count"])
+
+    def parse(self, file_path: str) -> ParseResult:
+        full_text_parts = []
+        pages_metadata_list = [] # A list to hold metadata for each page
+
+        doc_metadata = self._read_metadata(file_path)
+        for page_num, text in self.iter_page_texts(file_path, doc_metadata["page_count"]):
+            full_text_parts.append(text)
+            # Store this page's specific metadata
+            pages_metadata_list.append({
+                "text": text,
+                "page_number": page_num
+            })
 
         final_text = "\n\n".join(full_text_parts).strip()
         doc_metadata["pages"] = pages_metadata_list
 
-        return ParseResult(text=final_text, metadata=doc_metadata)
\ No newline at end of file
+        return ParseResult(text=final_text, metadata=doc_metadata)
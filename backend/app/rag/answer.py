@@ -1,84 +1,169 @@
-from typing import List, Dict, Any, Tuple, Generator
-from functools import lru_cache
-from ctransformers import AutoModelForCausalLM
-import os
-from huggingface_hub import login
-
-# --- Hugging Face Login ---
-# This is good practice, though not strictly required for this GGUF model.
-HF_TOKEN = os.getenv("HF_TOKEN")
-if HF_TOKEN:
-    print("--- [INFO] Logging in to Hugging Face Hub ---")
-    login(token=HF_TOKEN)
-else:
-    print("--- [WARNING] HF_TOKEN environment variable not set. ---")
-
-
-# --- Llama Pro LLM Answer Generation Pipeline (GGUF for Universal Compatibility) ---
-
-@lru_cache(maxsize=1)
-def get_llama_llm():
+import time
+import threading
+from typing import List, Dict, Any, Callable, Generator, Optional, Tuple
+
+from ..core.settings import settings
+from ..core.timing import StageTimings
+from .prompts import get_prompt_template
+from .scheduler import get_generation_scheduler, clamp_max_new_tokens
+
+
+# --- LLM Answer Generation Pipeline (GGUF for Universal Compatibility) ---
+# Model instances are lent out by `rag.scheduler`, shared with HyDE.
+
+ANSWER_SYSTEM_PROMPT = (
+    "You are an expert document analyst. Your task is to answer the user's question based *only* on the provided context. "
+    "Synthesize a coherent, helpful answer. If the context does not contain the information needed to answer the question, "
+    "you must say \"Based on the provided documents, I could not find an answer.\" Do not use any outside knowledge or make up information."
+)
+
+CONTEXT_SEPARATOR = "\n\n"
+
+def _uncovered_text(hit: Dict[str, Any], covered: Dict[tuple, List[Tuple[int, int]]]) -> str:
     """
-    Initializes and caches the Llama-Pro-8B-Instruct GGUF model using ctransformers.
+    Returns the parts of a chunk's text not already in the packed context.
+    Chunks from the same document page overlap by DEFAULT_CHUNK_OVERLAP; their
+    `char_start`/`char_end` offsets tell which characters were already included.
     """
-    # This is your working model configuration. We are not changing it.
-    llm = AutoModelForCausalLM.from_pretrained(
-        "TheBloke/LLaMA-Pro-8B-Instruct-GGUF",
-        model_file="llama-pro-8b-instruct.Q2_K.gguf", # Using a higher quality quantization
-        model_type="llama",
-        gpu_layers=50 
-    )
-    return llm
-
-def build_llama_pro_prompt(query: str, hits: List[Dict[str, Any]]) -> str:
+    metadata = hit.get("metadata") or {}
+    start, end = metadata.get("char_start"), metadata.get("char_end")
+    text = hit["text"]
+    if start is None or end is None or end - start != len(text):
+        return text
+    spans = covered.setdefault((metadata.get("source_path") or metadata.get("filename"), metadata.get("page")), [])
+
+    parts, cursor = [], start
+    for covered_start, covered_end in sorted(spans):
+        if covered_end <= cursor or covered_start >= end:
+            continue
+        if covered_start > cursor:
+            parts.append(text[cursor - start:covered_start - start])
+        cursor = max(cursor, covered_end)
+    if cursor < end:
+        parts.append(text[cursor - start:])
+    spans.append((start, end))
+    return " ... ".join(p.strip() for p in parts if p.strip())
+
+def pack_context(hits: List[Dict[str, Any]], budget_tokens: int, tokenize: Callable[[str], List[int]],
+                 detokenize: Optional[Callable[[List[int]], str]] = None) -> Tuple[List[str], int]:
     """
-    Builds a prompt following the specific instruction format for Llama Pro Instruct.
+    Fills up to `budget_tokens` of context with the hits in rerank order,
+    dropping text that overlaps chunks already packed. The first chunk that
+    doesn't fit is truncated (when `detokenize` is available and at least
+    CONTEXT_MIN_CHUNK_TOKENS remain) and packing stops there.
+    Returns the context passages and their token count.
     """
-    context_texts = [hit['text'] for hit in hits[:5]]
-    context = "\n\n".join(context_texts)
-
-    # This is your working prompt format. We are not changing it.
-    prompt = f"""<|system|>
-You are an expert document analyst. Your task is to answer the user's question based *only* on the provided context. Synthesize a coherent, helpful answer. If the context does not contain the information needed to answer the question, you must say "Based on the provided documents, I could not find an answer." Do not use any outside knowledge or make up information.
-<|user|>
-CONTEXT:
+    passages, used = [], 0
+    covered: Dict[tuple, List[Tuple[int, int]]] = {}
+    separator_tokens = len(tokenize(CONTEXT_SEPARATOR))
+    for hit in hits:
+        text = _uncovered_text(hit, covered)
+        if not text:
+            continue
+        cost = len(tokenize(text)) + (separator_tokens if passages else 0)
+        if used + cost <= budget_tokens:
+            passages.append(text)
+            used += cost
+            continue
+        separator = separator_tokens if passages else 0
+        remaining = budget_tokens - used - separator
+        if detokenize is not None and remaining >= settings.CONTEXT_MIN_CHUNK_TOKENS:
+            passages.append(detokenize(tokenize(text)[:remaining]))
+            used += separator + remaining
+        break
+    return passages, used
+
+def build_answer_prompt(query: str, passages: List[str]) -> str:
+    """
+    Builds the answer prompt in the instruction format of the configured model.
+    """
+    context = CONTEXT_SEPARATOR.join(passages)
+
+    user_message = f"""CONTEXT:
 ---
 {context}
 ---
 
-QUESTION: {query}
-<|assistant|>
-"""
-    return prompt
+QUESTION: {query}"""
+    return get_prompt_template().render([
+        {"role": "system", "content": ANSWER_SYSTEM_PROMPT},
+        {"role": "user", "content": user_message},
+    ])
+
+def build_packed_prompt(llm, query: str, hits: List[Dict[str, Any]], max_new_tokens: Optional[int]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Packs the hits into a token-budgeted prompt for `llm` and picks
+    max_new_tokens so that prompt and answer fit in LLM_CONTEXT_LENGTH.
+    Returns the prompt and its token accounting.
+    """
+    tokenize = llm.tokenize
+    detokenize = getattr(llm, "detokenize", None)
+
+    base_tokens = len(tokenize(build_answer_prompt(query, [])))
+    room = settings.LLM_CONTEXT_LENGTH - base_tokens - settings.LLM_MIN_NEW_TOKENS
+    budget = max(0, min(settings.PROMPT_CONTEXT_TOKENS, room))
+    passages, _ = pack_context(hits, budget, tokenize, detokenize)
+
+    prompt = build_answer_prompt(query, passages)
+    prompt_tokens = len(tokenize(prompt))
+    max_new_tokens = clamp_max_new_tokens(max_new_tokens)
+    max_new_tokens = max(1, min(max_new_tokens, settings.LLM_CONTEXT_LENGTH - prompt_tokens))
+    return prompt, {
+        "prompt_tokens": prompt_tokens,
+        "context_tokens_budget": budget,
+        "context_chunks": len(passages),
+        "max_new_tokens": max_new_tokens,
+    }
 
 # CORRECTED: The function is now a generator to support streaming.
-def generate_llama_answer_stream(query: str, hits: List[Dict[str, Any]]) -> Generator[str, None, None]:
+def generate_llama_answer_stream(
+    query: str,
+    hits: List[Dict[str, Any]],
+    max_new_tokens: Optional[int] = None,
+    cancel: Optional[threading.Event] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    timings: Optional[StageTimings] = None,
+) -> Generator[str, None, None]:
     """
-    Generates a precise, relevant answer using the local Llama Pro GGUF model
-    and streams the output token by token.
+    Generates a precise, relevant answer using the shared local GGUF model
+    and streams the output token by token. The model is borrowed from the
+    generation scheduler for the whole run; closing the generator (or setting
+    `cancel`) ends the generation and returns the model. Token counts are
+    written into `stats` and stage durations (queue_wait, prompt_build,
+    prefill, decode) into `timings` when given.
     """
+    stats = {} if stats is None else stats
+    timings = timings or StageTimings()
     if not hits:
         yield "I could not find any relevant information in the provided documents."
         return
 
-    llm = get_llama_llm()
-    prompt = build_llama_pro_prompt(query, hits)
-    
-    # --- THIS IS THE DEFINITIVE FIX ---
-    # We use the exact same llm(...) call that was working before,
-    # and simply add the `stream=True` parameter to it.
-    token_generator = llm(
-        prompt, 
-        max_new_tokens=4096, 
-        temperature=0.2, 
-        top_p=0.95, 
-        stop=["<|user|>", "<|system|>"],
-        stream=True
-    )
-
-    # We loop over the generator and yield each token as it is produced.
-    for token in token_generator:
-        yield token
+    waiting_since = time.perf_counter()
+    with get_generation_scheduler().model_slot(cancel=cancel) as llm:
+        timings.add("queue_wait", (time.perf_counter() - waiting_since) * 1000.0)
+        with timings.stage("prompt_build"):
+            prompt, accounting = build_packed_prompt(llm, query, hits, max_new_tokens)
+        stats.update(accounting, completion_tokens=0)
+        generation_started = time.perf_counter()
+        first_token_at = None
+        token_generator = llm(
+            prompt,
+            max_new_tokens=accounting["max_new_tokens"],
+            temperature=0.2,
+            top_p=0.95,
+            stop=get_prompt_template().stop,
+            stream=True
+        )
+        for token in token_generator:
+            if cancel is not None and cancel.is_set():
+                return
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                timings.add("prefill", (first_token_at - generation_started) * 1000.0)
+            stats["completion_tokens"] += 1
+            yield token
+        if first_token_at is not None:
+            timings.add("decode", (time.perf_counter() - first_token_at) * 1000.0)
 
 # This alias connects our new streaming function to the RAG service.
-generate_simple_answer = generate_llama_answer_stream
\ No newline at end of file
+generate_simple_answer = generate_llama_answer_stream
@@ -0,0 +1,143 @@
+import time
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.settings import settings
+from .corpus import get_corpus_snapshot
+
+# --- Semantic Answer Cache ---
+# Finished answers are cached under the embedding of the raw query, so a
+# rephrased question whose embedding is within ANSWER_CACHE_SIMILARITY (cosine)
+# of a cached one is answered without HyDE, retrieval or generation. An entry is
+# only served while the corpus is at the version it was answered against and
+# all of its source chunks still exist; any document add/delete bumps the
+# corpus version, which invalidates every older entry.
+
+
+class CachedAnswer:
+    def __init__(self, query: str, answer: str, sources: List[Dict[str, Any]], confidence: str,
+                 chunk_ids: List[str], corpus_version: int, options: Tuple):
+        self.query = query
+        self.answer = answer
+        self.sources = sources
+        self.confidence = confidence
+        self.chunk_ids = chunk_ids
+        self.corpus_version = corpus_version
+        self.options = options
+        self.expires_at = time.monotonic() + settings.ANSWER_CACHE_TTL_SECONDS
+
+
+class AnswerCache:
+    """
+    A bounded LRU of CachedAnswer entries. Query embeddings live in one
+    preallocated matrix, so a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, max_size: int, similarity_threshold: float):
+        self.max_size = max(1, max_size)
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._valid = np.zeros(self.max_size, dtype=bool)
+        self._entries: List[Optional[CachedAnswer]] = [None] * self.max_size
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _evict(self, slot: int):
+        self._valid[slot] = False
+        self._entries[slot] = None
+        self._lru.pop(slot, None)
+
+    def get(self, embedding, options: Tuple) -> Optional[CachedAnswer]:
+        """Returns the most similar valid entry above the threshold, or None."""
+        query = self._normalize(embedding)
+        snapshot = get_corpus_snapshot()
+        with self._lock:
+            if self._matrix is None or not self._valid.any():
+                self.misses += 1
+                return None
+            similarities = np.where(self._valid, self._matrix @ query, -np.inf)
+            now = time.monotonic()
+            for slot in np.argsort(-similarities):
+                if similarities[slot] < self.similarity_threshold:
+                    break
+                entry = self._entries[slot]
+                if entry.options != options:
+                    continue
+                if entry.expires_at <= now or entry.corpus_version != snapshot.version:
+                    self._evict(int(slot))
+                    self.invalidated += 1
+                    continue
+                if None in snapshot.lookup(entry.chunk_ids):
+                    self._evict(int(slot))
+                    self.invalidated += 1
+                    continue
+                self._lru.move_to_end(int(slot))
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def put(self, embedding, entry: CachedAnswer):
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+            # A fresh answer supersedes cached answers it would otherwise compete with.
+            similarities = np.where(self._valid, self._matrix @ vector, -np.inf)
+            for slot in np.flatnonzero(similarities >= self.similarity_threshold):
+                if self._entries[slot].options == entry.options:
+                    self._evict(int(slot))
+            free = np.flatnonzero(~self._valid)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = next(iter(self._lru))
+                self._evict(slot)
+            self._matrix[slot] = vector
+            self._valid[slot] = True
+            self._entries[slot] = entry
+            self._lru[slot] = None
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            self._valid[:] = False
+            self._entries = [None] * self.max_size
+            self._lru.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": int(self._valid.sum()),
+                "max_size": self.max_size,
+                "similarity_threshold": self.similarity_threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "invalidated": self.invalidated,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_answer_cache() -> AnswerCache:
+    """Returns the process-wide semantic answer cache."""
+    return AnswerCache(max_size=settings.ANSWER_CACHE_SIZE, similarity_threshold=settings.ANSWER_CACHE_SIMILARITY)
@@ -0,0 +1,166 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, List, Sequence, Tuple
+
+from ..core.settings import settings
+from .models import get_embedding_model, get_reranker_model
+
+# --- Dynamic Micro-batching ---
+# Concurrent queries each need one small forward pass (a query embedding, ~20
+# rerank pairs). Run separately they compete for the same CPU threads; a
+# MicroBatcher instead collects the requests that arrive within a few
+# milliseconds, runs one batched forward pass on its own thread and hands each
+# caller its slice of the results.
+
+_HISTOGRAM_BUCKETS = [(1, 1), (2, 2), (3, 4), (5, 8), (9, 16), (17, 32), (33, 64), (65, 128), (129, float('inf'))]
+
+
+def _bucket_label(low, high) -> str:
+    if high == float('inf'):
+        return f">{low - 1}"
+    return str(low) if low == high else f"{low}-{high}"
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = {_bucket_label(low, high): 0 for low, high in _HISTOGRAM_BUCKETS}
+
+    def observe(self, value: int):
+        for low, high in _HISTOGRAM_BUCKETS:
+            if low <= value <= high:
+                self.counts[_bucket_label(low, high)] += 1
+                return
+
+
+class MicroBatcher:
+    """
+    Coalesces `submit(items)` calls from many threads into batched calls of
+    `process_batch(items) -> results`, where results line up with items.
+    A batch is dispatched once it holds `max_batch_size` items or the oldest
+    request has waited `max_wait_ms`. A single request larger than the batch
+    size is never split.
+    """
+
+    def __init__(self, name: str, process_batch: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int, max_wait_ms: float, enabled: bool = True):
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.enabled = enabled
+        self._process_batch = process_batch
+        self._pending: Deque[Tuple[List[Any], Future, float]] = deque()
+        self._pending_items = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+        self.batches = 0
+        self.requests = 0
+        self.items = 0
+        self._batch_sizes = _Histogram()
+        self._queue_depths = _Histogram()
+
+    def submit(self, items: Sequence[Any]) -> List[Any]:
+        """Blocks until the batch containing `items` has run and returns their results."""
+        items = list(items)
+        if not items:
+            return []
+        if not self.enabled:
+            return list(self._process_batch(items))
+
+        future: Future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"microbatch-{self.name}", daemon=True)
+                self._thread.start()
+            self._pending.append((items, future, time.monotonic()))
+            self._pending_items += len(items)
+            self._cond.notify()
+        return future.result()
+
+    def _take_batch(self) -> Tuple[List[Tuple[List[Any], Future, float]], int]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = self._pending[0][2] + self.max_wait
+            while self._pending_items < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            queue_depth = len(self._pending)
+            batch, size = [], 0
+            while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch_size):
+                request = self._pending.popleft()
+                batch.append(request)
+                size += len(request[0])
+            self._pending_items -= size
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.items += size
+            self._batch_sizes.observe(size)
+            self._queue_depths.observe(queue_depth)
+            return batch, size
+
+    def _run(self):
+        while True:
+            batch, _ = self._take_batch()
+            flat = [item for items, _, _ in batch for item in items]
+            try:
+                results = self._process_batch(flat)
+            except BaseException as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for items, future, _ in batch:
+                future.set_result(list(results[offset:offset + len(items)]))
+                offset += len(items)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": len(self._pending),
+                "batches": self.batches,
+                "requests": self.requests,
+                "items": self.items,
+                "avg_batch_size": round(self.items / self.batches, 3) if self.batches else 0.0,
+                "avg_requests_per_batch": round(self.requests / self.batches, 3) if self.batches else 0.0,
+                "batch_size_histogram": dict(self._batch_sizes.counts),
+                "queue_depth_histogram": dict(self._queue_depths.counts),
+            }
+
+
+@lru_cache(maxsize=1)
+def get_embedding_batcher() -> MicroBatcher:
+    """Returns the shared batcher for query-time embedding calls."""
+    def encode(texts: List[str]):
+        return get_embedding_model().encode(texts, convert_to_numpy=True, batch_size=len(texts))
+
+    return MicroBatcher(
+        "embedding", encode,
+        max_batch_size=settings.EMBED_MICROBATCH_MAX_SIZE,
+        max_wait_ms=settings.MICROBATCH_MAX_WAIT_MS,
+        enabled=settings.MICROBATCH_ENABLED,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_rerank_batcher() -> MicroBatcher:
+    """Returns the shared batcher for Cross-Encoder (query, chunk) scoring."""
+    def predict(pairs: List[List[str]]):
+        return get_reranker_model().predict(pairs, batch_size=settings.RERANK_BATCH_SIZE)
+
+    return MicroBatcher(
+        "rerank", predict,
+        max_batch_size=settings.RERANK_MICROBATCH_MAX_SIZE,
+        max_wait_ms=settings.MICROBATCH_MAX_WAIT_MS,
+        enabled=settings.MICROBATCH_ENABLED,
+    )
@@ -0,0 +1,128 @@
+import threading
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
+
+from ..db.chroma_db import get_or_create_collection
+
+# --- Versioned In-Memory Corpus Snapshot ---
+# Retrieval resolves chunk ids to text/metadata through this snapshot instead of
+# re-materializing the Chroma collection on every query. DocumentService patches
+# it on add/update/delete, and every change bumps `version`.
+
+class CorpusSnapshot:
+    """
+    Holds chunk ids, texts and metadata in parallel arrays, addressed through an
+    id -> position map. Deleted rows are tombstoned and compacted lazily.
+    """
+
+    def __init__(self, load_batch_size: int = 5000):
+        self._lock = threading.RLock()
+        self._load_batch_size = load_batch_size
+        self._loaded = False
+        self._ids: List[Optional[str]] = []
+        self._texts: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict[str, Any]]] = []
+        self._positions: Dict[str, int] = {}
+        self.version = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._positions)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        collection = get_or_create_collection()
+        total = collection.count()
+        print(f"--- [INFO] Loading corpus snapshot ({total} chunks) ---")
+        for offset in range(0, total, self._load_batch_size):
+            batch = collection.get(limit=self._load_batch_size, offset=offset, include=["metadatas", "documents"])
+            self._append(batch["ids"], batch["documents"], batch["metadatas"])
+        self._loaded = True
+
+    def _append(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            position = self._positions.get(chunk_id)
+            if position is None:
+                self._positions[chunk_id] = len(self._ids)
+                self._ids.append(chunk_id)
+                self._texts.append(text)
+                self._metadatas.append(metadata)
+            else:
+                self._texts[position] = text
+                self._metadatas[position] = metadata
+
+    def _compact(self):
+        keep = [i for i, chunk_id in enumerate(self._ids) if chunk_id is not None]
+        self._ids = [self._ids[i] for i in keep]
+        self._texts = [self._texts[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(self._ids)}
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        """Adds (or replaces) chunks and bumps the corpus version."""
+        with self._lock:
+            if self._loaded:
+                self._append(ids, texts, metadatas)
+            self.version += 1
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Replaces the metadata of held chunks (texts unchanged) and bumps the corpus version."""
+        with self._lock:
+            if self._loaded:
+                for chunk_id, metadata in zip(ids, metadatas):
+                    position = self._positions.get(chunk_id)
+                    if position is not None:
+                        self._metadatas[position] = metadata
+            self.version += 1
+
+    def remove(self, ids: List[str]):
+        """Removes chunks and bumps the corpus version."""
+        with self._lock:
+            if self._loaded:
+                for chunk_id in ids:
+                    position = self._positions.pop(chunk_id, None)
+                    if position is None:
+                        continue
+                    self._ids[position] = None
+                    self._texts[position] = None
+                    self._metadatas[position] = None
+                if len(self._ids) > 2 * len(self._positions) + 1024:
+                    self._compact()
+            self.version += 1
+
+    def loaded_size(self) -> Optional[int]:
+        """Number of chunks held, or None if the snapshot hasn't been loaded (without loading it)."""
+        with self._lock:
+            return len(self._positions) if self._loaded else None
+
+    def invalidate(self):
+        """Drops the snapshot so that it is reloaded from Chroma on next use."""
+        with self._lock:
+            self._loaded = False
+            self._ids, self._texts, self._metadatas = [], [], []
+            self._positions = {}
+            self.version += 1
+
+    def lookup(self, ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Resolves chunk ids to {"id", "text", "metadata"} dicts, preserving order.
+        Ids that are not in the snapshot resolve to None.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            results = []
+            for chunk_id in ids:
+                position = self._positions.get(chunk_id)
+                if position is None:
+                    results.append(None)
+                else:
+                    results.append({"id": chunk_id, "text": self._texts[position], "metadata": self._metadatas[position]})
+            return results
+
+
+@lru_cache(maxsize=1)
+def get_corpus_snapshot() -> CorpusSnapshot:
+    """Returns the process-wide corpus snapshot."""
+    return CorpusSnapshot()
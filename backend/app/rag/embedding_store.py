@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..core.settings import settings
+from .models import embedding_model_name
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, single writer assumed.
+    fcntl = None
+
+# --- Content-Addressed Embedding Store ---
+# Embeddings are cached on disk keyed by (model name, sha256 of the chunk text),
+# so re-uploading an edited document only encodes the chunks that changed.
+#
+# Layout per model (<EMBEDDING_CACHE_DIR>/<model-slug>/):
+#   meta.json    - model name, dimension and dtype
+#   vectors.bin  - row-major matrix of embeddings, memory-mapped for reads
+#   index.bin    - append-only list of 32-byte text digests; digest i <-> row i
+# Vectors are appended before their digests, so a torn write never exposes a
+# digest without its row.
+
+_DIGEST_SIZE = 32
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    def __init__(self, directory: str, model_name: str, dtype: str = "float16"):
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "__", model_name)
+        self.directory = os.path.join(directory, slug)
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._index_bytes_read = 0
+        self._matrix: Optional[np.memmap] = None
+        os.makedirs(self.directory, exist_ok=True)
+        self._meta_path = os.path.join(self.directory, "meta.json")
+        self._vectors_path = os.path.join(self.directory, "vectors.bin")
+        self._index_path = os.path.join(self.directory, "index.bin")
+        self._load_meta()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh_index()
+            return len(self._rows)
+
+    def _load_meta(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path) as f:
+            meta = json.load(f)
+        if np.dtype(meta["dtype"]) != self.dtype:
+            raise ValueError(
+                f"Embedding cache at '{self.directory}' stores {meta['dtype']}, "
+                f"but EMBEDDING_CACHE_DTYPE is {self.dtype}."
+            )
+        self.dim = meta["dim"]
+
+    def _write_meta(self):
+        with open(self._meta_path, "w") as f:
+            json.dump({"model": self.model_name, "dim": self.dim, "dtype": self.dtype.name}, f)
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh_index(self):
+        """Picks up digests appended since the last read (possibly by another process)."""
+        if not os.path.exists(self._index_path):
+            return
+        size = os.path.getsize(self._index_path)
+        size -= size % _DIGEST_SIZE
+        if size <= self._index_bytes_read:
+            return
+        with open(self._index_path, "rb") as f:
+            f.seek(self._index_bytes_read)
+            data = f.read(size - self._index_bytes_read)
+        first_row = self._index_bytes_read // _DIGEST_SIZE
+        for i in range(len(data) // _DIGEST_SIZE):
+            self._rows.setdefault(data[i * _DIGEST_SIZE:(i + 1) * _DIGEST_SIZE], first_row + i)
+        self._index_bytes_read = size
+        if self.dim is None:
+            self._load_meta()
+
+    def _matrix_with_rows(self, n_rows: int) -> np.memmap:
+        if self._matrix is None or self._matrix.shape[0] < n_rows:
+            self._matrix = np.memmap(self._vectors_path, dtype=self.dtype, mode="r", shape=(n_rows, self.dim))
+        return self._matrix
+
+    def get_many(self, digests: List[bytes]) -> List[Optional[np.ndarray]]:
+        """Returns the cached float32 vector for each digest, or None on a miss."""
+        with self._lock:
+            self._refresh_index()
+            rows = [self._rows.get(digest) for digest in digests]
+            hits = [row for row in rows if row is not None]
+            if not hits:
+                return [None] * len(digests)
+            matrix = self._matrix_with_rows(self._index_bytes_read // _DIGEST_SIZE)
+            return [None if row is None else np.asarray(matrix[row], dtype=np.float32) for row in rows]
+
+    def put_many(self, digests: List[bytes], vectors: np.ndarray):
+        """Appends vectors for digests that aren't stored yet."""
+        vectors = np.asarray(vectors)
+        if len(digests) == 0:
+            return
+        with self._lock, self._file_lock():
+            self._refresh_index()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._write_meta()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {vectors.shape[1]}.")
+
+            new_rows, new_digests, seen = [], [], set()
+            for digest, vector in zip(digests, vectors):
+                if digest in self._rows or digest in seen:
+                    continue
+                seen.add(digest)
+                new_rows.append(vector)
+                new_digests.append(digest)
+            if not new_digests:
+                return
+
+            # Drop rows left behind by a writer that died before appending digests.
+            stored_rows = self._index_bytes_read // _DIGEST_SIZE
+            row_bytes = self.dim * self.dtype.itemsize
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(stored_rows * row_bytes)
+                f.write(np.asarray(new_rows, dtype=self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._index_path, "ab") as f:
+                f.truncate(stored_rows * _DIGEST_SIZE)
+                f.write(b"".join(new_digests))
+            self._refresh_index()
+
+
+@lru_cache(maxsize=1)
+def get_embedding_store() -> EmbeddingStore:
+    """Returns the embedding store for the configured embedding model."""
+    return EmbeddingStore(
+        directory=settings.EMBEDDING_CACHE_DIR,
+        model_name=embedding_model_name(),
+        dtype=settings.EMBEDDING_CACHE_DTYPE,
+    )
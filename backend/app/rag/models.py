@@ -1,54 +1,113 @@
+import time
+import logging
+import functools
 from functools import lru_cache
-from sentence_transformers import SentenceTransformer, CrossEncoder
-from ctransformers import AutoModelForCausalLM
-from transformers import AutoTokenizer
 import os
-from huggingface_hub import login
+
+from ..core.settings import settings
+from ..core.metrics import MODEL_LOAD_SECONDS, MODEL_MEMORY_BYTES, resident_memory_bytes
+from .stub_models import StubEmbeddingModel, StubCrossEncoder, StubLLM
+
+# The model libraries are imported by the loaders, so MODEL_BACKEND="stub"
+# runs without sentence-transformers, ctransformers or a Hugging Face login.
+USE_STUB_MODELS = settings.MODEL_BACKEND == "stub"
 
 # --- Hugging Face Login ---
 HF_TOKEN = os.getenv("HF_TOKEN")
-if HF_TOKEN:
+if USE_STUB_MODELS:
+    print("--- [INFO] MODEL_BACKEND=stub: using deterministic stub models ---")
+elif HF_TOKEN:
+    from huggingface_hub import login
     print("--- [INFO] Logging in to Hugging Face Hub ---")
     login(token=HF_TOKEN)
 else:
     print("--- [WARNING] HF_TOKEN environment variable not set. ---")
 
 
+def embedding_model_name() -> str:
+    """Identifies the active embedding model, e.g. to key cached embeddings."""
+    return f"stub-{settings.STUB_EMBEDDING_DIM}" if USE_STUB_MODELS else settings.EMBEDDING_MODEL
+
+
 # --- Model Loading Functions ---
 # These functions rely on the HF_HOME environment variable being set correctly
 # in settings.py, which directs all downloads and lookups to our local `backend/models` folder.
+# This module is the single registry for model handles: HyDE and answer
+# generation share the LLM instances handed out by `rag.scheduler`, which
+# loads them through `load_llm`.
+
+def _record_load(model: str):
+    """
+    Records a loader's duration and the growth of resident memory during the
+    load (approximate when several models load at once) in the metrics.
+    """
+    def decorator(loader):
+        @functools.wraps(loader)
+        def load(*args, **kwargs):
+            memory_before = resident_memory_bytes()
+            started = time.perf_counter()
+            result = loader(*args, **kwargs)
+            MODEL_LOAD_SECONDS.set(time.perf_counter() - started, model=model)
+            MODEL_MEMORY_BYTES.set(max(0, resident_memory_bytes() - memory_before), model=model)
+            return result
+        return load
+    return decorator
 
 @lru_cache(maxsize=1)
+@_record_load("embedding")
 def get_embedding_model():
     """Loads and caches the BAAI/bge-m3 embedding model from the local cache."""
-    print("--- [INFO] Loading embedding model: BAAI/bge-m3 ---")
-    return SentenceTransformer("BAAI/bge-m3")
+    if USE_STUB_MODELS:
+        return StubEmbeddingModel(dimension=settings.STUB_EMBEDDING_DIM)
+    from sentence_transformers import SentenceTransformer
+    print(f"--- [INFO] Loading embedding model: {settings.EMBEDDING_MODEL} ---")
+    return SentenceTransformer(settings.EMBEDDING_MODEL)
 
 @lru_cache(maxsize=1)
+@_record_load("reranker")
 def get_reranker_model():
-    """Loads and caches a Cross-Encoder model for re-ranking from the local cache."""
-    print("--- [INFO] Loading re-ranking model: cross-encoder/ms-marco-MiniLM-L-6-v2 ---")
-    return CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+    """
+    Loads and caches a Cross-Encoder model for re-ranking from the local cache.
+    With RERANKER_BACKEND="onnx" the model runs on ONNX Runtime (optionally an
+    int8-quantized export), falling back to PyTorch if that can't be loaded.
+    """
+    if USE_STUB_MODELS:
+        return StubCrossEncoder()
+    from sentence_transformers import CrossEncoder
+    print(f"--- [INFO] Loading re-ranking model: {settings.RERANKER_MODEL} ({settings.RERANKER_BACKEND}) ---")
+    if settings.RERANKER_BACKEND == "onnx":
+        model_kwargs = {"file_name": settings.RERANKER_ONNX_FILE} if settings.RERANKER_ONNX_FILE else {}
+        try:
+            return CrossEncoder(settings.RERANKER_MODEL, backend="onnx", model_kwargs=model_kwargs)
+        except Exception as e:
+            logging.warning(f"Failed to load ONNX re-ranker ({e}). Falling back to the PyTorch backend.")
+    return CrossEncoder(settings.RERANKER_MODEL)
 
-@lru_cache(maxsize=1)
-def get_llm_and_tokenizer():
+@_record_load("llm")
+def load_llm():
     """
-    Initializes and caches the Llama-3 GGUF model and its tokenizer.
-    The tokenizer is loaded from the HF_HOME cache, and the GGUF model
-    is downloaded by ctransformers into the same cache.
+    Loads a GGUF generation model (Llama-Pro-8B-Instruct by default) using
+    ctransformers. Prompts for it are rendered by `rag.prompts`, so no
+    `transformers` tokenizer is needed on the query path. ctransformers models
+    are not thread-safe: use one instance per thread at a time.
     """
-    print("--- [INFO] Loading tokenizer: meta-llama/Meta-Llama-3-8B-Instruct ---")
-    tokenizer = AutoTokenizer.from_pretrained("meta-llama/Meta-Llama-3-8B-Instruct")
-    
-    print("--- [INFO] Loading generation model: TheBloke/Meta-Llama-3-8B-Instruct-GGUF ---")
+    if USE_STUB_MODELS:
+        return StubLLM(answer_tokens=settings.STUB_ANSWER_TOKENS)
+    from ctransformers import AutoModelForCausalLM
+    print(f"--- [INFO] Loading generation model: {settings.LLM_REPO_ID} ({settings.LLM_MODEL_FILE}) ---")
     llm = AutoModelForCausalLM.from_pretrained(
-        "TheBloke/LLaMA-Pro-8B-Instruct-GGUF",
-        model_file="llama-pro-8b-instruct.Q2_K.gguf",
-        model_type="llama",
+        settings.LLM_REPO_ID,
+        model_file=settings.LLM_MODEL_FILE,
+        model_type=settings.LLM_MODEL_TYPE,
+        context_length=settings.LLM_CONTEXT_LENGTH,
         # This will automatically use the best hardware available (CUDA, Metal, CPU).
         # On Mac, set a number to offload layers to the GPU for a massive speed boost.
         # On Windows/Linux with no NVIDIA GPU, it will run efficiently on the CPU.
-        gpu_layers=50 
+        gpu_layers=settings.LLM_GPU_LAYERS
     )
-    
-    return llm, tokenizer
\ No newline at end of file
+    return llm
+
+@lru_cache(maxsize=1)
+def get_llm():
+    """Returns the process-wide generation model instance."""
+    return load_llm()
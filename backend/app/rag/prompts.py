@@ -0,0 +1,72 @@
+from typing import List, Dict
+
+from ..core.settings import settings
+
+# --- Lightweight Chat Prompt Templates ---
+# GGUF models are driven with raw prompt strings. Rather than loading a full
+# `transformers` tokenizer just for `apply_chat_template`, each supported model
+# family gets a small template describing how to wrap every role.
+
+class PromptTemplate:
+    """Renders a list of {"role", "content"} messages into a model-specific prompt."""
+
+    def __init__(self, name: str, roles: Dict[str, str], generation_prefix: str, stop: List[str], prefix: str = ""):
+        self.name = name
+        self.roles = roles
+        self.generation_prefix = generation_prefix
+        self.stop = stop
+        self.prefix = prefix
+
+    def render(self, messages: List[Dict[str, str]], add_generation_prompt: bool = True) -> str:
+        parts = [self.prefix]
+        for message in messages:
+            parts.append(self.roles[message["role"]].format(content=message["content"]))
+        if add_generation_prompt:
+            parts.append(self.generation_prefix)
+        return "".join(parts)
+
+
+PROMPT_TEMPLATES: Dict[str, PromptTemplate] = {
+    "llama-pro": PromptTemplate(
+        name="llama-pro",
+        roles={
+            "system": "<|system|>\n{content}\n",
+            "user": "<|user|>\n{content}\n",
+            "assistant": "<|assistant|>\n{content}\n",
+        },
+        generation_prefix="<|assistant|>\n",
+        stop=["<|user|>", "<|system|>"],
+    ),
+    "llama-3": PromptTemplate(
+        name="llama-3",
+        prefix="<|begin_of_text|>",
+        roles={
+            "system": "<|start_header_id|>system<|end_header_id|>\n\n{content}<|eot_id|>",
+            "user": "<|start_header_id|>user<|end_header_id|>\n\n{content}<|eot_id|>",
+            "assistant": "<|start_header_id|>assistant<|end_header_id|>\n\n{content}<|eot_id|>",
+        },
+        generation_prefix="<|start_header_id|>assistant<|end_header_id|>\n\n",
+        stop=["<|eot_id|>"],
+    ),
+    "chatml": PromptTemplate(
+        name="chatml",
+        roles={
+            "system": "<|im_start|>system\n{content}<|im_end|>\n",
+            "user": "<|im_start|>user\n{content}<|im_end|>\n",
+            "assistant": "<|im_start|>assistant\n{content}<|im_end|>\n",
+        },
+        generation_prefix="<|im_start|>assistant\n",
+        stop=["<|im_end|>"],
+    ),
+}
+
+
+def get_prompt_template() -> PromptTemplate:
+    """Returns the prompt template matching the configured generation model."""
+    try:
+        return PROMPT_TEMPLATES[settings.LLM_PROMPT_FORMAT]
+    except KeyError:
+        raise ValueError(
+            f"Unknown LLM_PROMPT_FORMAT '{settings.LLM_PROMPT_FORMAT}'. "
+            f"Expected one of: {', '.join(PROMPT_TEMPLATES)}"
+        )
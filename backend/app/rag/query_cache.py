@@ -0,0 +1,136 @@
+import re
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import Session, col, delete, select
+
+from ..core.settings import settings
+from ..db.sqlite_db import engine
+from ..db.writer import get_background_writer
+from ..models.database import QueryCacheEntry
+from .cache import LRUTTLCache
+
+# --- Query-Side Cache (HyDE generation + query embedding) ---
+# Only deterministic HyDE generations are cached: with sampling enabled the
+# hypothetical answer differs on every call, so a cached one would be stale.
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case-folds and collapses whitespace so trivially different queries share an entry."""
+    return _WHITESPACE_RE.sub(" ", query).strip().casefold()
+
+
+def query_cache_key(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+class QueryCache:
+    """
+    In-memory LRU+TTL cache of (hypothetical_answer, query_embedding) pairs,
+    optionally backed by the `QueryCacheEntry` table so it survives restarts.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, persist: bool):
+        self.memory = LRUTTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self.persist = persist
+        self.persisted_hits = 0
+        self._puts = 0
+
+    def get(self, query: str) -> Optional[Tuple[str, List[float]]]:
+        key = query_cache_key(query)
+        cached = self.memory.get(key)
+        if cached is not None or not self.persist:
+            return cached
+
+        try:
+            with Session(engine) as session:
+                entry = session.get(QueryCacheEntry, key)
+                if entry is None:
+                    return None
+                age = datetime.utcnow() - entry.created_at
+                if age > timedelta(seconds=self.memory.ttl_seconds):
+                    session.delete(entry)
+                    session.commit()
+                    return None
+                value = (entry.hypothetical_answer, np.frombuffer(entry.embedding, dtype=np.float32).tolist())
+        except Exception as e:
+            logging.error(f"Failed to read persisted query cache entry: {e}")
+            return None
+
+        remaining = self.memory.ttl_seconds - age.total_seconds()
+        self.memory.put(key, value, ttl_seconds=remaining)
+        self.persisted_hits += 1
+        return value
+
+    def put(self, query: str, hypothetical_answer: str, embedding: List[float]):
+        key = query_cache_key(query)
+        self.memory.put(key, (hypothetical_answer, embedding))
+        if not self.persist:
+            return
+        embedding_bytes = np.asarray(embedding, dtype=np.float32).tobytes()
+        self._puts += 1
+        prune = self._puts % settings.QUERY_CACHE_PRUNE_EVERY == 0
+
+        def write(session: Session):
+            session.merge(QueryCacheEntry(
+                key=key,
+                query=query,
+                hypothetical_answer=hypothetical_answer,
+                embedding=embedding_bytes,
+            ))
+            if prune:
+                _prune_entries(session, self.memory.ttl_seconds, settings.QUERY_CACHE_MAX_ROWS)
+
+        # Persisted by the background writer, off the query path.
+        get_background_writer().submit(write)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.memory.stats()
+        # A lookup that missed memory but was served from the table is a hit.
+        hits = stats["hits"] + self.persisted_hits
+        misses = stats["misses"] - self.persisted_hits
+        lookups = hits + misses
+        return {
+            **stats,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "persisted_hits": self.persisted_hits,
+            "persist": self.persist,
+        }
+
+
+def _prune_entries(session: Session, ttl_seconds: float, max_rows: int) -> int:
+    """Deletes expired entries, then all but the `max_rows` newest. Returns the number of rows removed."""
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+    removed = session.exec(delete(QueryCacheEntry).where(col(QueryCacheEntry.created_at) < cutoff)).rowcount
+    newest = select(QueryCacheEntry.key).order_by(col(QueryCacheEntry.created_at).desc()).limit(max_rows)
+    removed += session.exec(delete(QueryCacheEntry).where(col(QueryCacheEntry.key).not_in(newest))).rowcount
+    return removed
+
+
+def prune_query_cache():
+    """Bounds the persisted query cache by age and row count; run on startup."""
+    if not settings.QUERY_CACHE_PERSIST:
+        return
+    with Session(engine) as session:
+        removed = _prune_entries(session, settings.QUERY_CACHE_TTL_SECONDS, settings.QUERY_CACHE_MAX_ROWS)
+        session.commit()
+    if removed:
+        print(f"--- [INFO] Pruned {removed} persisted query cache entries. ---")
+
+
+@lru_cache(maxsize=1)
+def get_query_cache() -> QueryCache:
+    """Returns the process-wide HyDE/query-embedding cache."""
+    return QueryCache(
+        max_size=settings.QUERY_CACHE_SIZE,
+        ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS,
+        persist=settings.QUERY_CACHE_PERSIST,
+    )
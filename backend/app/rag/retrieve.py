@@ -1,12 +1,26 @@
 import re
-from typing import List, Dict, Any
-from rank_bm25 import BM25Okapi
+import asyncio
+import bisect
+import threading
+from collections import deque
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from functools import lru_cache
 import numpy as np
 
 from ..core.settings import settings
+from ..core.concurrency import run_in_executor, run_in_generation_executor
+from ..core.timing import StageTimings, timed_stage
+from ..core.metrics import EMBEDDING_STORE_LOOKUPS
 from ..db.chroma_db import get_or_create_collection
-from ..rag.models import get_embedding_model, get_reranker_model, get_llm_and_tokenizer
+from ..db import keyword_index
+from .corpus import get_corpus_snapshot
+from .query_cache import get_query_cache, query_cache_key
+from .cache import LRUTTLCache
+from .embedding_store import get_embedding_store, text_digest
+from ..rag.models import get_embedding_model
+from .batcher import get_embedding_batcher, get_rerank_batcher
+from .prompts import get_prompt_template
+from .scheduler import GenerationCancelled, get_generation_scheduler
 
 # --- Embedding Logic ---
 
@@ -15,65 +29,248 @@ def embed_texts(texts: List[str]) -> List[List[float]]:
     model = get_embedding_model()
     return model.encode(texts, convert_to_numpy=True).tolist()
 
+def embed_texts_cached(texts: List[str]) -> np.ndarray:
+    """
+    Generates a float32 embedding matrix for chunk texts, encoding only those
+    whose (model, text hash) isn't in the on-disk embedding store yet.
+    """
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        EMBEDDING_STORE_LOOKUPS.inc(len(texts), result="disabled")
+        return get_embedding_model().encode(texts, convert_to_numpy=True).astype(np.float32, copy=False)
+
+    store = get_embedding_store()
+    digests = [text_digest(t) for t in texts]
+    vectors = store.get_many(digests)
+
+    missing: Dict[bytes, str] = {}
+    for digest, text, vector in zip(digests, texts, vectors):
+        if vector is None:
+            missing.setdefault(digest, text)
+    EMBEDDING_STORE_LOOKUPS.inc(len(texts) - len(missing), result="hit")
+    EMBEDDING_STORE_LOOKUPS.inc(len(missing), result="miss")
+    if missing:
+        missing_digests = list(missing)
+        encoded = get_embedding_model().encode([missing[d] for d in missing_digests], convert_to_numpy=True)
+        store.put_many(missing_digests, encoded)
+        by_digest = dict(zip(missing_digests, encoded))
+        vectors = [by_digest[d] if v is None else v for d, v in zip(digests, vectors)]
+
+    return np.asarray(vectors, dtype=np.float32)
+
 def embed_text(text: str) -> List[float]:
-    """Generates an embedding for a single text."""
+    """
+    Generates a query-time embedding for a single text. The call is
+    micro-batched with concurrent queries into one forward pass.
+    """
     instruction = "Represent this sentence for searching relevant passages: "
-    return embed_texts([instruction + text])[0]
+    return np.asarray(get_embedding_batcher().submit([instruction + text])[0], dtype=np.float32).tolist()
 
 
 # --- Hypothetical Document Generation (HyDE) ---
 
-def generate_hypothetical_answer(query: str) -> str:
+def generate_hypothetical_answer(
+    query: str, deterministic: bool = False, cancel: Optional[threading.Event] = None
+) -> str:
     """
     Uses the main LLM to generate a hypothetical, ideal answer to the user's query.
+    With `deterministic=True` decoding is greedy, so the same query always
+    produces the same answer. Setting `cancel` stops waiting for the model, or
+    the generation itself, with GenerationCancelled.
     """
-    # We get the LLM from our central models file
-    llm, tokenizer = get_llm_and_tokenizer()
+    template = get_prompt_template()
 
     prompt_data = [
         {"role": "system", "content": "You are a helpful assistant. Please generate a short, high-quality, hypothetical paragraph that directly answers the following user question. Do not say 'Here is a hypothetical answer.' Just generate the paragraph itself."},
         {"role": "user", "content": query}
     ]
-    prompt = tokenizer.apply_chat_template(prompt_data, tokenize=False, add_generation_prompt=True)
+    prompt = template.render(prompt_data)
 
-    hypothetical_answer = llm(prompt, max_new_tokens=128, temperature=0.7, stop=["<|eot_id|>"])
-    
-    return hypothetical_answer
+    if deterministic:
+        sampling = {"temperature": 0.0, "top_k": 1}
+    else:
+        sampling = {"temperature": 0.7}
+    parts = []
+    with get_generation_scheduler().model_slot(cancel=cancel) as llm:
+        for token in llm(prompt, max_new_tokens=128, stop=template.stop, stream=True, **sampling):
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled()
+            parts.append(token)
 
+    return "".join(parts)
 
-# --- Chunking and Retrieval Logic (No changes from before) ---
+def get_query_embedding(query: str, deterministic: bool, cancel: Optional[threading.Event] = None) -> List[float]:
+    """
+    Returns the HyDE embedding for a query. Deterministic generations are
+    served from (and stored in) the query cache.
+    """
+    cache = get_query_cache()
+    if deterministic:
+        cached = cache.get(query)
+        if cached is not None:
+            return cached[1]
 
-def recursive_character_text_splitter(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
-    # ... (This function remains the same)
-    if len(text) <= chunk_size:
-        return [text]
-    separators = ["\n\n", "\n", ". ", " ", ""]
-    best_separator = separators[-1]
-    for sep in separators:
-        if sep in text:
-            best_separator = sep
-            break
-    chunks = []
-    splits = text.split(best_separator)
-    current_chunk = ""
-    for part in splits:
-        if len(part) > chunk_size:
-            chunks.extend(recursive_character_text_splitter(part, chunk_size, chunk_overlap))
-            continue
-        if len(current_chunk) + len(part) + len(best_separator) <= chunk_size:
-            current_chunk += part + best_separator
+    with timed_stage("hyde"):
+        hypothetical_answer = generate_hypothetical_answer(query, deterministic=deterministic, cancel=cancel)
+    with timed_stage("query_embedding"):
+        query_embedding = embed_text(hypothetical_answer)
+
+    if deterministic:
+        cache.put(query, hypothetical_answer, query_embedding)
+    return query_embedding
+
+
+# --- Chunking Logic ---
+# The splitter works on (start, end) character spans of the original text and
+# never concatenates strings, so it runs in a single linear pass and yields
+# chunks lazily. Sizes are measured in characters or, in token mode, in tokens
+# of the embedding model's tokenizer.
+
+SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+class _SpanMeasure:
+    """Measures spans of `text` in characters, or in tokens when given a tokenizer."""
+
+    def __init__(self, text: str, tokenizer=None):
+        self.token_starts = None
+        if tokenizer is not None:
+            encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+            self.token_starts = [start for start, _ in encoding["offset_mapping"]]
+
+    def size(self, start: int, end: int) -> int:
+        if self.token_starts is None:
+            return end - start
+        return bisect.bisect_left(self.token_starts, end) - bisect.bisect_left(self.token_starts, start)
+
+    def tail_start(self, text: str, start: int, end: int, budget: int) -> int:
+        """Returns the earliest word/token boundary p in [start, end] with size(p, end) <= budget."""
+        if self.token_starts is None:
+            pos = max(start, end - budget)
+            while start < pos < end and not text[pos - 1].isspace():
+                pos += 1
+            return pos
+        last = bisect.bisect_left(self.token_starts, end)
+        first = max(bisect.bisect_left(self.token_starts, start), last - budget)
+        return self.token_starts[first] if first < last else end
+
+    def hard_split(self, start: int, end: int, chunk_size: int) -> Iterator[Tuple[int, int]]:
+        """Splits a span without separators into pieces of at most chunk_size units."""
+        if self.token_starts is None:
+            boundaries = range(start, end, chunk_size)
         else:
-            chunks.append(current_chunk)
-            overlap_start_index = max(0, len(current_chunk) - chunk_overlap)
-            current_chunk = current_chunk[overlap_start_index:] + part + best_separator
-    if current_chunk:
-        chunks.append(current_chunk)
-    return [c.strip() for c in chunks if c.strip()]
-
-def chunk_text(text: str, chunk_size: int, overlap: int, metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
-    # ... (This function remains the same)
-    chunks_of_text = recursive_character_text_splitter(text, chunk_size, overlap)
-    return [{"text": chunk, "metadata": metadata} for chunk in chunks_of_text]
+            first = bisect.bisect_left(self.token_starts, start)
+            last = bisect.bisect_left(self.token_starts, end)
+            boundaries = [start] + self.token_starts[first + chunk_size:last:chunk_size]
+        boundaries = list(boundaries) + [end]
+        for piece_start, piece_end in zip(boundaries, boundaries[1:]):
+            if piece_end > piece_start:
+                yield piece_start, piece_end
+
+def _iter_segments(text: str, start: int, end: int, separators: List[str], chunk_size: int, measure: _SpanMeasure) -> Iterator[Tuple[int, int]]:
+    """
+    Yields contiguous spans covering [start, end), each at most chunk_size units,
+    split on the coarsest separator present (the separator stays with the span
+    before it). Oversized pieces are split again with the finer separators.
+    """
+    if measure.size(start, end) <= chunk_size:
+        yield start, end
+        return
+    for i, sep in enumerate(separators):
+        if sep and text.find(sep, start, end) == -1:
+            continue
+        if not sep:
+            yield from measure.hard_split(start, end, chunk_size)
+            return
+        pos = start
+        while pos < end:
+            idx = text.find(sep, pos, end)
+            piece_end = end if idx == -1 else idx + len(sep)
+            if measure.size(pos, piece_end) <= chunk_size:
+                yield pos, piece_end
+            else:
+                yield from _iter_segments(text, pos, piece_end, separators[i + 1:], chunk_size, measure)
+            pos = piece_end
+        return
+
+def iter_chunk_spans(text: str, chunk_size: int, chunk_overlap: int, tokenizer=None) -> Iterator[Tuple[int, int]]:
+    """
+    Yields (start, end) character offsets of chunks of at most chunk_size units.
+    Consecutive chunks share up to chunk_overlap units of whole segments.
+    Leading and trailing whitespace is excluded from each span.
+    """
+    measure = _SpanMeasure(text, tokenizer)
+    window = deque()
+    window_size = 0
+    last_end = 0
+
+    def emit():
+        chunk_start, chunk_end = window[0][0], window[-1][1]
+        while chunk_start < chunk_end and text[chunk_start].isspace():
+            chunk_start += 1
+        while chunk_end > chunk_start and text[chunk_end - 1].isspace():
+            chunk_end -= 1
+        return chunk_start, chunk_end
+
+    def is_new(chunk_start: int, chunk_end: int) -> bool:
+        # Spans end on non-whitespace, so ending past the previous chunk means
+        # the span adds text beyond the overlap; otherwise (e.g. after a
+        # whitespace-only segment) it would repeat the previous chunk.
+        return chunk_end > chunk_start and chunk_end > last_end
+
+    for segment in _iter_segments(text, 0, len(text), SEPARATORS, chunk_size, measure):
+        segment_size = measure.size(*segment)
+        if window and window_size + segment_size > chunk_size:
+            chunk_start, chunk_end = emit()
+            if is_new(chunk_start, chunk_end):
+                yield chunk_start, chunk_end
+                last_end = chunk_end
+            # Keep a tail of whole segments as overlap, leaving room for this one...
+            dropped = None
+            while window and (window_size > chunk_overlap or window_size + segment_size > chunk_size):
+                dropped = window.popleft()
+                window_size -= measure.size(*dropped)
+            # ...topped up with the word-aligned end of the last dropped segment.
+            budget = min(chunk_overlap, chunk_size - segment_size) - window_size
+            if dropped is not None and budget > 0:
+                tail = (measure.tail_start(text, dropped[0], dropped[1], budget), dropped[1])
+                if tail[1] > tail[0]:
+                    window.appendleft(tail)
+                    window_size += measure.size(*tail)
+        window.append(segment)
+        window_size += segment_size
+
+    if window:
+        chunk_start, chunk_end = emit()
+        if is_new(chunk_start, chunk_end):
+            yield chunk_start, chunk_end
+
+def recursive_character_text_splitter(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """Splits text into character-sized chunks; see `iter_chunk_spans`."""
+    return [text[start:end] for start, end in iter_chunk_spans(text, chunk_size, chunk_overlap)]
+
+def get_chunking_tokenizer():
+    """Returns the embedding model's tokenizer when chunks are sized in tokens."""
+    if settings.CHUNK_SIZE_UNIT != "tokens":
+        return None
+    return get_embedding_model().tokenizer
+
+def effective_chunk_size(chunk_size: int) -> int:
+    """
+    In token mode, caps the chunk size at the embedding model's input window,
+    less the special tokens the tokenizer adds around every input.
+    """
+    if settings.CHUNK_SIZE_UNIT != "tokens":
+        return chunk_size
+    model = get_embedding_model()
+    return min(chunk_size, model.max_seq_length - model.tokenizer.num_special_tokens_to_add())
+
+def chunk_text(text: str, chunk_size: int, overlap: int, metadata: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily yields {"text", "metadata"} chunks. Each chunk's metadata records its
+    character offsets (`char_start`, `char_end`) within `text`.
+    """
+    tokenizer = get_chunking_tokenizer()
+    for start, end in iter_chunk_spans(text, effective_chunk_size(chunk_size), overlap, tokenizer):
+        yield {"text": text[start:end], "metadata": {**metadata, "char_start": start, "char_end": end}}
 
 
 # --- Hybrid Retrieval Logic with Re-ranking ---
@@ -90,45 +287,132 @@ def reciprocal_rank_fusion(ranked_lists: List[List[Dict]], k: int = 60) -> List[
     reranked_results = sorted(fused_scores.values(), key=lambda x: x['score'], reverse=True)
     return [result['doc'] for result in reranked_results]
 
-def retrieve_hybrid(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+def resolve_chunks(ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    Resolves ranked chunk ids to {"id", "text", "metadata"} dicts via the corpus
+    snapshot. Ids the snapshot doesn't know yet are fetched from Chroma directly.
+    """
+    resolved = get_corpus_snapshot().lookup(ids)
+    missing = [chunk_id for chunk_id, chunk in zip(ids, resolved) if chunk is None]
+    if missing:
+        found = get_or_create_collection().get(ids=missing, include=["metadatas", "documents"])
+        by_id = {
+            doc_id: {"id": doc_id, "text": found['documents'][i], "metadata": found['metadatas'][i]}
+            for i, doc_id in enumerate(found['ids'])
+        }
+        resolved = [chunk if chunk is not None else by_id.get(chunk_id) for chunk_id, chunk in zip(ids, resolved)]
+    return [chunk for chunk in resolved if chunk is not None]
+
+def keyword_search(query: str, n_results: int) -> List[Dict[str, Any]]:
+    """
+    Runs the BM25 leg against the persistent keyword index and returns the
+    matching chunks (best first) with their text and metadata.
+    """
+    with timed_stage("bm25"):
+        ranked = keyword_index.search(query, n_results)
+        return resolve_chunks([chunk_id for chunk_id, _ in ranked])
+
+def semantic_search(
+    query: str, n_results: int, deterministic_hyde: bool, cancel: Optional[threading.Event] = None
+) -> List[Dict[str, Any]]:
+    """
+    Runs the semantic leg: HyDE -> embed -> ANN lookup in Chroma. Setting
+    `cancel` abandons the HyDE generation.
+    """
+    query_embedding = get_query_embedding(query, deterministic_hyde, cancel)
+    with timed_stage("ann"):
+        semantic_results_raw = get_or_create_collection().query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            include=["distances"]
+        )
+        if not semantic_results_raw or not semantic_results_raw['ids'][0]:
+            return []
+        return resolve_chunks(semantic_results_raw['ids'][0])
+
+@lru_cache(maxsize=1)
+def get_rerank_cache() -> LRUTTLCache:
+    """Returns the process-wide (query hash, chunk id) -> Cross-Encoder score cache."""
+    return LRUTTLCache(max_size=settings.RERANK_CACHE_SIZE, ttl_seconds=settings.RERANK_CACHE_TTL_SECONDS)
+
+def rerank(query: str, candidate_chunks: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    """
+    Re-scores the best RERANK_TOP_N fused candidates with the Cross-Encoder and
+    returns the best top_k. Scores already computed for this query are reused.
+    """
+    with timed_stage("rerank"):
+        candidate_chunks = candidate_chunks[:max(settings.RERANK_TOP_N, top_k)]
+        cache = get_rerank_cache()
+        query_key = query_cache_key(query)
+
+        scores = [cache.get((query_key, chunk['id'])) for chunk in candidate_chunks]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            # Pairs from concurrent queries are scored together by the shared batcher.
+            reranker_input = [[query, candidate_chunks[i]['text']] for i in missing]
+            predicted = get_rerank_batcher().submit(reranker_input)
+            for i, score in zip(missing, predicted):
+                scores[i] = float(score)
+                cache.put((query_key, candidate_chunks[i]['id']), scores[i])
+
+        for chunk, score in zip(candidate_chunks, scores):
+            chunk['rerank_score'] = score
+        reranked_results = sorted(candidate_chunks, key=lambda x: x['rerank_score'], reverse=True)
+
+        return reranked_results[:top_k]
+
+def retrieve_hybrid(query: str, top_k: int = 5, deterministic_hyde: Optional[bool] = None) -> List[Dict[str, Any]]:
     """
     Performs a three-stage retrieval process: HyDE, Fast Retrieval, and Re-ranking.
+    `deterministic_hyde` overrides settings.HYDE_DETERMINISTIC for this query.
     """
-    collection = get_or_create_collection()
-    all_docs = collection.get(include=["metadatas", "documents"])
-    if not all_docs or not all_docs['ids']:
+    if get_or_create_collection().count() == 0:
         return []
+    if deterministic_hyde is None:
+        deterministic_hyde = settings.HYDE_DETERMINISTIC
 
-    # Stage 1: Query Transformation (HyDE)
-    hypothetical_answer = generate_hypothetical_answer(query)
-
-    # Stage 2: Fast Retrieval
+    # Stages 1 + 2: Query Transformation (HyDE) and Fast Retrieval
     num_candidates = top_k * 5
-    tokenized_docs = [doc.split() for doc in all_docs['documents']]
-    bm25 = BM25Okapi(tokenized_docs)
-    bm25_scores = bm25.get_scores(query.split())
-    top_n_bm25_indices = np.argsort(bm25_scores)[::-1][:num_candidates]
-    bm25_results = [{"id": all_docs['ids'][i], "text": all_docs['documents'][i], "metadata": all_docs['metadatas'][i]} for i in top_n_bm25_indices]
-    query_embedding = embed_text(hypothetical_answer)
-    semantic_results_raw = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=num_candidates,
-        include=["metadatas", "documents"]
-    )
-    semantic_results = []
-    if semantic_results_raw and semantic_results_raw['ids'][0]:
-        for i, doc_id in enumerate(semantic_results_raw['ids'][0]):
-            semantic_results.append({"id": doc_id, "text": semantic_results_raw['documents'][0][i], "metadata": semantic_results_raw['metadatas'][0][i]})
+    bm25_results = keyword_search(query, num_candidates)
+    semantic_results = semantic_search(query, num_candidates, deterministic_hyde)
     candidate_chunks = reciprocal_rank_fusion([bm25_results, semantic_results])
     if not candidate_chunks:
         return []
 
     # Stage 3: Accurate Re-ranking
-    reranker = get_reranker_model()
-    reranker_input = [[query, chunk['text']] for chunk in candidate_chunks]
-    reranker_scores = reranker.predict(reranker_input)
-    for i in range(len(candidate_chunks)):
-        candidate_chunks[i]['rerank_score'] = reranker_scores[i]
-    reranked_results = sorted(candidate_chunks, key=lambda x: x['rerank_score'], reverse=True)
-    
-    return reranked_results[:top_k]
\ No newline at end of file
+    return rerank(query, candidate_chunks, top_k)
+
+async def retrieve_hybrid_async(
+    query: str,
+    top_k: int = 5,
+    deterministic_hyde: Optional[bool] = None,
+    timings: Optional[StageTimings] = None,
+    cancel: Optional[threading.Event] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Same pipeline as `retrieve_hybrid`, but every stage runs off the event loop
+    and the BM25 and semantic legs run concurrently, so wall-clock latency is
+    max(BM25, semantic) rather than their sum. The semantic leg waits for a
+    model slot (HyDE), so it runs on the generation executor; the other stages
+    run on the RAG executor. Setting `cancel` (e.g. when the caller is
+    cancelled) abandons the HyDE generation. Stage durations are recorded in
+    `timings` when given.
+    """
+    timings = timings or StageTimings()
+    with timings.stage("retrieval"):
+        collection = get_or_create_collection()
+        if await run_in_executor(collection.count) == 0:
+            return []
+        if deterministic_hyde is None:
+            deterministic_hyde = settings.HYDE_DETERMINISTIC
+
+        num_candidates = top_k * 5
+        bm25_results, semantic_results = await asyncio.gather(
+            run_in_executor(timings.bind(keyword_search), query, num_candidates),
+            run_in_generation_executor(timings.bind(semantic_search), query, num_candidates, deterministic_hyde, cancel),
+        )
+        candidate_chunks = reciprocal_rank_fusion([bm25_results, semantic_results])
+        if not candidate_chunks:
+            return []
+
+        return await run_in_executor(timings.bind(rerank), query, candidate_chunks, top_k)
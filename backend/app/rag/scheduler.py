@@ -0,0 +1,157 @@
+import time
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+
+from ..core.settings import settings
+from .models import get_llm, load_llm
+
+# --- LLM Generation Scheduler ---
+# ctransformers models are stateful and not thread-safe, so every generation
+# (HyDE and answers) borrows a model instance from the scheduler for its whole
+# run. LLM_MAX_CONCURRENCY instances exist at most; each one holds a full copy
+# of the weights. Chat requests are admitted up front against a bounded queue so
+# that overload is answered with a fast 429 instead of a long stall.
+
+
+class SchedulerBusy(Exception):
+    """Raised when a request can't be admitted or doesn't get a model in time."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GenerationCancelled(Exception):
+    """Raised when the caller gave up while waiting for a model."""
+
+
+class Admission:
+    """A chat request's place in the scheduler. Released exactly once."""
+
+    def __init__(self, scheduler: "GenerationScheduler"):
+        self._scheduler = scheduler
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler._release_admission()
+
+    def __enter__(self) -> "Admission":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class GenerationScheduler:
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float, retry_after: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._cond = threading.Condition()
+        self._idle: List[Any] = []
+        self._loaded = 0
+        self._admitted = 0
+        self._waiting = 0
+        self._active = 0
+        self.counters = {"admitted": 0, "rejected": 0, "timed_out": 0, "cancelled": 0, "generations": 0}
+
+    def admit(self) -> Admission:
+        """
+        Reserves a place for a chat request, or raises SchedulerBusy when
+        LLM_MAX_CONCURRENCY requests are generating and LLM_MAX_QUEUE more are waiting.
+        """
+        with self._cond:
+            if self._admitted >= self.max_concurrency + self.max_queue:
+                self.counters["rejected"] += 1
+                raise SchedulerBusy("The server is busy generating other answers. Please retry shortly.", self.retry_after)
+            self._admitted += 1
+            self.counters["admitted"] += 1
+        return Admission(self)
+
+    def _release_admission(self):
+        with self._cond:
+            self._admitted -= 1
+
+    @contextmanager
+    def model_slot(self, cancel: Optional[threading.Event] = None) -> Iterator[Any]:
+        """
+        Lends out a model instance for one generation. Waits at most
+        LLM_QUEUE_TIMEOUT_SECONDS (raising SchedulerBusy) and stops waiting as
+        soon as `cancel` is set (raising GenerationCancelled).
+        """
+        llm = self._acquire(cancel)
+        try:
+            yield llm
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._idle.append(llm)
+                self.counters["generations"] += 1
+                self._cond.notify()
+
+    def _acquire(self, cancel: Optional[threading.Event]) -> Any:
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while not self._idle and self._loaded >= self.max_concurrency:
+                    if cancel is not None and cancel.is_set():
+                        self.counters["cancelled"] += 1
+                        raise GenerationCancelled()
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters["timed_out"] += 1
+                        raise SchedulerBusy("Timed out waiting for the generation model. Please retry shortly.", self.retry_after)
+                    # Wake up periodically to notice cancellation.
+                    self._cond.wait(min(remaining, 0.25))
+                self._active += 1
+                if self._idle:
+                    return self._idle.pop()
+                self._loaded += 1
+                first_instance = self._loaded == 1
+            finally:
+                self._waiting -= 1
+
+        try:
+            return get_llm() if first_instance else load_llm()
+        except BaseException:
+            with self._cond:
+                self._active -= 1
+                self._loaded -= 1
+                self._cond.notify()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "in_flight": self._admitted,
+                "waiting": self._waiting,
+                "active": self._active,
+                "loaded_models": self._loaded,
+                **self.counters,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_generation_scheduler() -> GenerationScheduler:
+    """Returns the process-wide LLM generation scheduler."""
+    return GenerationScheduler(
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        max_queue=settings.LLM_MAX_QUEUE,
+        queue_timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS,
+        retry_after=settings.LLM_RETRY_AFTER_SECONDS,
+    )
+
+
+def clamp_max_new_tokens(requested: Optional[int]) -> int:
+    """Applies the per-request token budget, capped at LLM_MAX_NEW_TOKENS."""
+    if requested is None or requested <= 0:
+        return settings.LLM_MAX_NEW_TOKENS
+    return min(requested, settings.LLM_MAX_NEW_TOKENS)
@@ -0,0 +1,118 @@
+import re
+import zlib
+from typing import Any, Dict, Iterator, List, Sequence, Union
+
+import numpy as np
+
+# --- Deterministic Stub Models ---
+# Stand-ins for the embedding model, the Cross-Encoder and the GGUF LLM, used
+# when MODEL_BACKEND="stub" (benchmarks, offline development). They implement
+# just the interface the RAG pipeline calls, are deterministic across processes
+# and cost a small, stable amount of CPU, so pipeline overhead can be measured
+# without downloading or running the real models.
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# LLM tokens are whitespace-prefixed words, so detokenize(tokenize(t)) == t.
+_LLM_TOKEN_RE = re.compile(r"\s*\S+|\s+")
+
+
+def _word_hash(word: str) -> int:
+    return zlib.crc32(word.encode("utf-8"))
+
+
+class StubTokenizer:
+    """A word-level tokenizer with the call signature of a Hugging Face fast tokenizer."""
+
+    def __call__(self, text: str, add_special_tokens: bool = False, return_offsets_mapping: bool = False) -> Dict[str, Any]:
+        matches = list(_WORD_RE.finditer(text))
+        encoding = {"input_ids": [_word_hash(m.group().lower()) for m in matches]}
+        if return_offsets_mapping:
+            encoding["offset_mapping"] = [m.span() for m in matches]
+        return encoding
+
+    def num_special_tokens_to_add(self, pair: bool = False) -> int:
+        return 0
+
+
+class StubEmbeddingModel:
+    """
+    Hashed bag-of-words embeddings: each lowercase word adds +-1 to a bucket
+    picked by its CRC32, and the result is L2-normalized. Texts sharing words
+    get similar vectors, which keeps ANN results meaningful.
+    """
+
+    def __init__(self, dimension: int, max_seq_length: int = 8192):
+        self.dimension = dimension
+        self.max_seq_length = max_seq_length
+        self.tokenizer = StubTokenizer()
+        self._buckets: Dict[str, tuple] = {}
+
+    def _bucket(self, word: str) -> tuple:
+        bucket = self._buckets.get(word)
+        if bucket is None:
+            h = _word_hash(word)
+            bucket = (h % self.dimension, 1.0 if (h >> 16) & 1 else -1.0)
+            if len(self._buckets) < 1_000_000:
+                self._buckets[word] = bucket
+        return bucket
+
+    def encode(self, sentences: Union[str, Sequence[str]], convert_to_numpy: bool = True, batch_size: int = 32, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in _WORD_RE.findall(text.lower()):
+                index, sign = self._bucket(word)
+                vectors[row, index] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        result = vectors[0] if single else vectors
+        return result if convert_to_numpy else result.tolist()
+
+
+class StubCrossEncoder:
+    """Scores (query, passage) pairs by the fraction of query words found in the passage."""
+
+    def predict(self, sentences: Sequence[Sequence[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        scores = np.empty(len(sentences), dtype=np.float32)
+        for i, (query, passage) in enumerate(sentences):
+            query_words = set(_WORD_RE.findall(query.lower()))
+            passage_words = set(_WORD_RE.findall(passage.lower()))
+            scores[i] = len(query_words & passage_words) / len(query_words) if query_words else 0.0
+        return scores
+
+
+class StubLLM:
+    """
+    Mimics a ctransformers model: `tokenize`/`detokenize` and a callable that
+    returns (or streams) `max_new_tokens` tokens drawn deterministically from
+    the prompt's own words.
+    """
+
+    def __init__(self, answer_tokens: int):
+        self.answer_tokens = answer_tokens
+        self._vocab: Dict[str, int] = {}
+        self._words: List[str] = []
+
+    def tokenize(self, text: str) -> List[int]:
+        ids = []
+        for piece in _LLM_TOKEN_RE.findall(text):
+            token_id = self._vocab.get(piece)
+            if token_id is None:
+                token_id = self._vocab[piece] = len(self._words)
+                self._words.append(piece)
+            ids.append(token_id)
+        return ids
+
+    def detokenize(self, tokens: Sequence[int]) -> str:
+        return "".join(self._words[t] for t in tokens)
+
+    def _generate(self, prompt: str, max_new_tokens: int) -> Iterator[str]:
+        words = _WORD_RE.findall(prompt) or ["stub"]
+        start = zlib.crc32(prompt.encode("utf-8")) % len(words)
+        for i in range(min(max_new_tokens, self.answer_tokens)):
+            yield ("" if i == 0 else " ") + words[(start + i * 7) % len(words)]
+
+    def __call__(self, prompt: str, max_new_tokens: int = 256, stream: bool = False, **kwargs):
+        tokens = self._generate(prompt, max_new_tokens)
+        return tokens if stream else "".join(tokens)
@@ -1,3 +1,5 @@
+from datetime import datetime
+from typing import Optional
 from fastapi import APIRouter, Depends
 from ..services.analytics_service import AnalyticsService
 from ..models.api import AnalyticsOverview
@@ -5,13 +7,34 @@ from ..models.api import AnalyticsOverview
 router = APIRouter()
 
 @router.get("/overview", response_model=AnalyticsOverview)
-def get_overview(service: AnalyticsService = Depends(AnalyticsService)):
-    return service.get_overview()
+def get_overview(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 service: AnalyticsService = Depends(AnalyticsService)):
+    return service.get_overview(start, end)
 
 @router.get("/latency")
-def get_latency(service: AnalyticsService = Depends(AnalyticsService)):
-    return service.get_latency_histogram()
+def get_latency(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                service: AnalyticsService = Depends(AnalyticsService)):
+    return service.get_latency_histogram(start, end)
 
 @router.get("/precision")
-def get_precision(service: AnalyticsService = Depends(AnalyticsService)):
-    return service.get_precision_at_k()
\ No newline at end of file
+def get_precision(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                  service: AnalyticsService = Depends(AnalyticsService)):
+    return service.get_precision_at_k(start, end)
+
+@router.get("/stages")
+def get_stage_latency(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      service: AnalyticsService = Depends(AnalyticsService)):
+    return service.get_stage_latency(start, end)
+
+@router.get("/cache")
+def get_cache_stats(service: AnalyticsService = Depends(AnalyticsService)):
+    return service.get_cache_stats()
+
+
+@router.get("/batching")
+def get_batching_stats(service: AnalyticsService = Depends(AnalyticsService)):
+    return service.get_batching_stats()
+
+@router.get("/generation")
+def get_generation_stats(service: AnalyticsService = Depends(AnalyticsService)):
+    return service.get_generation_stats()
@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import StreamingResponse
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Response, status
 from ..services.rag_service import RAGService
 # CORRECTED: Import the new history service
 from ..services.chat_history_service import ChatHistoryService
@@ -10,20 +10,43 @@ router = APIRouter()
 # --- Core Chat Endpoint ---
 @router.post("/query")
 async def query(payload: ChatQueryIn, service: RAGService = Depends(RAGService)):
-    """Endpoint to ask a question and get a streamed answer."""
-    return StreamingResponse(service.query_stream(payload), media_type="text/event-stream")
+    """
+    Endpoint to ask a question and get a streamed answer. Cached answers are
+    replayed; otherwise returns 429 right away when the generation queue is full.
+    """
+    return await service.stream_answer(payload)
 
 # --- NEW: Conversation History Endpoints ---
 
+# Paginated endpoints return the cursor of the next page in this header (absent on the last page).
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
 @router.get("/sessions")
-def get_sessions(service: ChatHistoryService = Depends(ChatHistoryService)):
-    """Retrieves a list of all past conversation sessions."""
-    return service.get_sessions()
+def get_sessions(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    service: ChatHistoryService = Depends(ChatHistoryService),
+):
+    """Retrieves a page of past conversation sessions, most recently active first."""
+    sessions, next_cursor = service.get_sessions(limit, cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return sessions
 
 @router.get("/history/{session_id}")
-def get_history(session_id: str, service: ChatHistoryService = Depends(ChatHistoryService)):
-    """Retrieves all messages for a specific conversation session."""
-    return service.get_history(session_id)
+def get_history(
+    session_id: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    service: ChatHistoryService = Depends(ChatHistoryService),
+):
+    """Retrieves the latest messages of a session; the cursor pages back to older turns."""
+    messages, next_cursor = service.get_history(session_id, limit, cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return messages
 
 @router.delete("/session/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_session(session_id: str, service: ChatHistoryService = Depends(ChatHistoryService)):
@@ -7,7 +7,7 @@ router = APIRouter()
 def get_model_config():
     """Returns the current embedding model and chunking configuration."""
     return {
-        "embedding_model": settings.DEFAULT_EMBEDDING_MODEL,
+        "embedding_model": settings.EMBEDDING_MODEL,
         "chunk_size": settings.DEFAULT_CHUNK_SIZE,
         "chunk_overlap": settings.DEFAULT_CHUNK_OVERLAP,
     }
\ No newline at end of file
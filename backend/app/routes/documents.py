@@ -1,20 +1,42 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Request, status
 from typing import List
 from ..services.document_service import DocumentService
-from ..models.api import UploadResponse, DocumentOut, ChunkOut
+from ..services.ingestion_service import IngestionService, UPLOAD_FIELD, UPDATE_FIELD
+from ..models.api import IngestionJobOut, DocumentOut, ChunkOut
 
 router = APIRouter()
 
-@router.post("/upload", response_model=UploadResponse, status_code=status.HTTP_201_CREATED)
+def _multipart_body(field: str, multiple: bool) -> dict:
+    """OpenAPI description of an upload body that the endpoint parses itself while streaming it."""
+    file_schema = {"type": "string", "format": "binary"}
+    schema = {"type": "array", "items": file_schema} if multiple else file_schema
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {
+        "schema": {"type": "object", "properties": {field: schema}, "required": [field]},
+    }}}}
+
+@router.post("/upload", response_model=IngestionJobOut, status_code=status.HTTP_202_ACCEPTED,
+             openapi_extra=_multipart_body(UPLOAD_FIELD, multiple=True))
 async def upload_documents(
-    files: List[UploadFile] = File(...),
-    service: DocumentService = Depends(DocumentService)
+    request: Request,
+    service: DocumentService = Depends(DocumentService),
+    ingestion: IngestionService = Depends(IngestionService)
 ):
-    """Endpoint to upload and process multiple documents."""
-    if not files:
-        raise HTTPException(status_code=400, detail="No files were provided.")
-    results = await service.process_uploaded_files(files)
-    return results
+    """
+    Endpoint to upload multiple documents (multipart field "files"). The files
+    are streamed to disk as they arrive and queued for background processing;
+    poll /jobs/{job_id} for progress and the final result.
+    """
+    return await ingestion.enqueue_uploads(request, service)
+
+@router.get("/jobs", response_model=List[IngestionJobOut])
+def list_ingestion_jobs(limit: int = 20, ingestion: IngestionService = Depends(IngestionService)):
+    """Endpoint to list recent ingestion jobs, newest first."""
+    return ingestion.list_jobs(limit=limit)
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobOut)
+def get_ingestion_job(job_id: str, ingestion: IngestionService = Depends(IngestionService)):
+    """Endpoint to get the status, per-file progress and result of an ingestion job."""
+    return ingestion.get_job(job_id)
 
 @router.get("", response_model=List[DocumentOut])
 def list_documents(service: DocumentService = Depends(DocumentService)):
@@ -36,6 +58,21 @@ def download_document(doc_id: int, service: DocumentService = Depends(DocumentSe
     """Endpoint to download the original document file."""
     return service.download_document_file(doc_id)
 
+@router.put("/{doc_id}", response_model=IngestionJobOut, status_code=status.HTTP_202_ACCEPTED,
+            openapi_extra=_multipart_body(UPDATE_FIELD, multiple=False))
+async def update_document(
+    doc_id: int,
+    request: Request,
+    service: DocumentService = Depends(DocumentService),
+    ingestion: IngestionService = Depends(IngestionService)
+):
+    """
+    Endpoint to replace a document with a new version of its file (multipart
+    field "file"). Only chunks that changed are re-embedded; poll
+    /jobs/{job_id} for progress and the result.
+    """
+    return await ingestion.enqueue_update(doc_id, request, service)
+
 @router.delete("/{doc_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_document(doc_id: int, service: DocumentService = Depends(DocumentService)):
     """Endpoint to delete a document and its associated chunks."""
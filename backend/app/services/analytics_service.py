@@ -1,26 +1,159 @@
-import json
-from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 # CORRECTED: Import Depends
+import numpy as np
 from fastapi import Depends
+from sqlalchemy import case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import Session, select, func
-from ..db.sqlite_db import get_session
-from ..models.database import Document, Conversation
+from ..db.sqlite_db import engine, get_session
+from ..models.database import Document, Conversation, AnalyticsRollup, QueryTrace
 from ..models.api import AnalyticsOverview
+from ..rag.query_cache import get_query_cache
+from ..rag.retrieve import get_rerank_cache
+from ..rag.answer_cache import get_answer_cache
+from ..rag.batcher import get_embedding_batcher, get_rerank_batcher
+from ..rag.scheduler import get_generation_scheduler
+
+# --- Hourly Analytics Rollups ---
+# Conversation aggregates live in `AnalyticsRollup`, one row per hour. Saving or
+# deleting conversations applies a delta to the affected hours in the same
+# transaction; `backfill_analytics_rollups` builds the table from existing
+# history once, using the same aggregation in SQL.
+
+# (label, lower bound, upper bound, rollup column)
+LATENCY_BUCKETS = [
+    ("0-0.5s", 0, 0.5, "latency_under_0_5s"),
+    ("0.5-1s", 0.5, 1, "latency_0_5_to_1s"),
+    ("1-2s", 1, 2, "latency_1_to_2s"),
+    ("2-5s", 2, 5, "latency_2_to_5s"),
+    (">5s", 5, float('inf'), "latency_over_5s"),
+]
+PRECISION_KS = [1, 3, 5]
+ROLLUP_COLUMNS = (
+    ["queries", "response_time_sum"]
+    + [column for _, _, _, column in LATENCY_BUCKETS]
+    + ["with_sources"]
+    + [f"p_at_{k}_sum" for k in PRECISION_KS]
+)
+
+
+def _hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _to_utc_naive(ts: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored as naive UTC; convert aware query parameters to match."""
+    if ts is not None and ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def conversation_rollup(conversation: Conversation) -> Dict[str, float]:
+    """The rollup delta contributed by a single conversation."""
+    rt = conversation.response_time
+    n_sources = len(conversation.sources or [])
+    delta = {"queries": 1, "response_time_sum": rt, "with_sources": 1 if n_sources else 0}
+    for _, low, high, column in LATENCY_BUCKETS:
+        delta[column] = 1 if low <= rt < high else 0
+    for k in PRECISION_KS:
+        delta[f"p_at_{k}_sum"] = min(1.0, n_sources / float(k)) if n_sources else 0.0
+    return delta
+
+
+def aggregate_conversations(session: Session, *where) -> List[Tuple[datetime, Dict[str, float]]]:
+    """Computes per-hour rollup deltas for the matching conversations in SQL."""
+    hour = func.strftime("%Y-%m-%d %H:00:00", Conversation.created_at)
+    rt = Conversation.response_time
+    n_sources = func.coalesce(func.json_array_length(Conversation.sources), 0)
+    columns = [
+        func.count(Conversation.id),
+        func.coalesce(func.sum(rt), 0.0),
+        *[func.sum(case(((rt >= low) & (rt < high), 1), else_=0)) for _, low, high, _ in LATENCY_BUCKETS],
+        func.sum(case((n_sources > 0, 1), else_=0)),
+        *[func.sum(case((n_sources > 0, func.min(1.0, n_sources * 1.0 / k)), else_=0.0)) for k in PRECISION_KS],
+    ]
+    statement = select(hour, *columns).group_by(hour)
+    for condition in where:
+        statement = statement.where(condition)
+    return [
+        (datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S"), dict(zip(ROLLUP_COLUMNS, row[1:])))
+        for row in session.exec(statement).all()
+    ]
+
+
+def apply_rollup(session: Session, bucket_start: datetime, delta: Dict[str, float], sign: int = 1):
+    """Adds (or with sign=-1 subtracts) a delta to an hourly rollup row. Doesn't commit."""
+    values = {column: sign * value for column, value in delta.items()}
+    statement = sqlite_insert(AnalyticsRollup).values(bucket_start=_hour(bucket_start), **values)
+    statement = statement.on_conflict_do_update(
+        index_elements=["bucket_start"],
+        set_={column: AnalyticsRollup.__table__.c[column] + statement.excluded[column] for column in values},
+    )
+    session.exec(statement)
+
+
+def record_conversation(session: Session, conversation: Conversation):
+    """Adds a new conversation to its hour's rollup. Doesn't commit."""
+    apply_rollup(session, conversation.created_at, conversation_rollup(conversation))
+
+
+def remove_conversations(session: Session, *where):
+    """Subtracts the conversations matching `where` from the rollups. Doesn't commit."""
+    for bucket_start, delta in aggregate_conversations(session, *where):
+        apply_rollup(session, bucket_start, delta, sign=-1)
+
+
+def backfill_analytics_rollups():
+    """Builds the rollup table from existing conversations if it is still empty."""
+    with Session(engine) as session:
+        if session.exec(select(func.count()).select_from(AnalyticsRollup)).one():
+            return
+        rows = aggregate_conversations(session)
+        if not rows:
+            return
+        print(f"--- [INFO] Backfilling analytics rollups for {len(rows)} hours ---")
+        for bucket_start, delta in rows:
+            apply_rollup(session, bucket_start, delta)
+        session.commit()
+
+
+# Per-query QueryTrace columns summarized by the stage latency endpoint.
+TRACE_METRICS = [
+    "total_ms", "ttft_ms", "cache_lookup_ms", "retrieval_ms", "hyde_ms", "query_embedding_ms", "bm25_ms",
+    "ann_ms", "rerank_ms", "sources_ms", "queue_wait_ms", "prompt_build_ms", "prefill_ms", "decode_ms",
+    "tokens_per_sec",
+]
+STAGE_LATENCY_DEFAULT_WINDOW = timedelta(hours=24)
+# Percentiles are computed over at most this many of the newest traces in the window.
+STAGE_LATENCY_MAX_SAMPLES = 10000
+
 
 class AnalyticsService:
     # CORRECTED: Changed from next(get_session()) to Depends(get_session)
     def __init__(self, session: Session = Depends(get_session)):
         self.session = session
 
-    def get_overview(self) -> AnalyticsOverview:
-        total_docs = self.session.exec(select(func.count(Document.id))).one()
-        total_chunks_result = self.session.exec(select(func.sum(Document.chunk_count))).one()
+    def _rollup_totals(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, float]:
+        """Sums the hourly rollups in [start, end), at hour granularity."""
+        statement = select(*[func.coalesce(func.sum(AnalyticsRollup.__table__.c[c]), 0) for c in ROLLUP_COLUMNS])
+        start, end = _to_utc_naive(start), _to_utc_naive(end)
+        if start is not None:
+            statement = statement.where(AnalyticsRollup.bucket_start >= _hour(start))
+        if end is not None:
+            statement = statement.where(AnalyticsRollup.bucket_start < end)
+        return dict(zip(ROLLUP_COLUMNS, self.session.exec(statement).one()))
+
+    def get_overview(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> AnalyticsOverview:
+        total_docs = self.session.exec(select(func.count(Document.id)).where(Document.status == "ready")).one()
+        total_chunks_result = self.session.exec(
+            select(func.sum(Document.chunk_count)).where(Document.status == "ready")
+        ).one()
         total_chunks = total_chunks_result if total_chunks_result is not None else 0
-        
-        total_queries = self.session.exec(select(func.count(Conversation.id))).one()
-        avg_time_result = self.session.exec(select(func.avg(Conversation.response_time))).one()
-        avg_time = avg_time_result if avg_time_result is not None else 0.0
+
+        totals = self._rollup_totals(start, end)
+        total_queries = int(totals["queries"])
+        avg_time = totals["response_time_sum"] / total_queries if total_queries else 0.0
 
         return AnalyticsOverview(
             total_documents=total_docs,
@@ -29,33 +162,57 @@ class AnalyticsService:
             avg_response_time=round(float(avg_time), 3)
         )
 
-    def get_latency_histogram(self) -> dict:
-        buckets = [(0, 0.5), (0.5, 1), (1, 2), (2, 5), (5, float('inf'))]
-        labels = ["0-0.5s", "0.5-1s", "1-2s", "2-5s", ">5s"]
-        counts = {label: 0 for label in labels}
-        
-        response_times = self.session.exec(select(Conversation.response_time)).all()
-        for rt in response_times:
-            if rt is None: continue
-            for i, (low, high) in enumerate(buckets):
-                if low <= rt < high:
-                    counts[labels[i]] += 1
-                    break
-        return counts
-
-    def get_precision_at_k(self) -> dict:
-        ks = [1, 3, 5]
-        sums = {k: 0.0 for k in ks}
-        total = 0
-        
-        # Use the .sources property which is already a list of dicts
-        conversations = self.session.exec(select(Conversation)).all()
-        for conv in conversations:
-            if not conv.sources: continue
-            total += 1
-            n = len(conv.sources)
-            for k in ks:
-                sums[k] += min(1.0, n / float(k))
-        
-        if total == 0: return {f"p_at_{k}": 0.0 for k in ks}
-        return {f"p_at_{k}": round(sums[k] / total, 4) for k in ks}
+    def get_latency_histogram(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+        totals = self._rollup_totals(start, end)
+        return {label: int(totals[column]) for label, _, _, column in LATENCY_BUCKETS}
+
+    def get_precision_at_k(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+        totals = self._rollup_totals(start, end)
+        total = totals["with_sources"]
+        if not total: return {f"p_at_{k}": 0.0 for k in PRECISION_KS}
+        return {f"p_at_{k}": round(totals[f"p_at_{k}_sum"] / total, 4) for k in PRECISION_KS}
+
+    def get_stage_latency(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+        """
+        p50/p95/p99 of every traced stage (ms) and of decode throughput over
+        [start, end). Without `start`, the last STAGE_LATENCY_DEFAULT_WINDOW is used.
+        Only the newest STAGE_LATENCY_MAX_SAMPLES traces of the window are loaded;
+        `queries` counts all of them and `sampled` the ones summarized.
+        """
+        start, end = _to_utc_naive(start), _to_utc_naive(end)
+        if start is None:
+            start = (end or datetime.utcnow()) - STAGE_LATENCY_DEFAULT_WINDOW
+        conditions = [QueryTrace.created_at >= start]
+        if end is not None:
+            conditions.append(QueryTrace.created_at < end)
+        queries = self.session.exec(select(func.count(QueryTrace.id)).where(*conditions)).one()
+        columns = [QueryTrace.__table__.c[name] for name in TRACE_METRICS]
+        rows = self.session.exec(
+            select(*columns).where(*conditions)
+            .order_by(QueryTrace.created_at.desc()).limit(STAGE_LATENCY_MAX_SAMPLES)
+        ).all()
+
+        matrix = np.array([[np.nan if v is None else v for v in row] for row in rows], dtype=float).reshape(len(rows), len(columns))
+        stages = {}
+        for i, name in enumerate(TRACE_METRICS):
+            values = matrix[:, i][~np.isnan(matrix[:, i])]
+            if not len(values):
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            stages[name.removesuffix("_ms")] = {
+                "count": int(len(values)), "p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3),
+            }
+        return {"start": start, "end": end, "queries": queries, "sampled": len(rows), "stages": stages}
+
+    def get_cache_stats(self) -> dict:
+        return {
+            "query_cache": get_query_cache().stats(),
+            "rerank_cache": get_rerank_cache().stats(),
+            "answer_cache": get_answer_cache().stats(),
+        }
+
+    def get_batching_stats(self) -> dict:
+        return {"embedding": get_embedding_batcher().stats(), "rerank": get_rerank_batcher().stats()}
+
+    def get_generation_stats(self) -> dict:
+        return get_generation_scheduler().stats()
@@ -1,62 +1,177 @@
-from typing import List, Dict, Any
+import json
+import base64
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
 from fastapi import Depends, HTTPException, status
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 # CORRECTED: Import 'func' from sqlmodel
 from sqlmodel import Session, select, delete, func
 
-from ..db.sqlite_db import get_session
-from ..models.database import Conversation
+from ..db.sqlite_db import engine, get_session
+from ..db.writer import get_background_writer
+from ..models.database import ChatSession, Conversation, QueryTrace
+from .analytics_service import remove_conversations
+
+# Upper bound on how long history reads wait for queued conversation writes.
+WRITER_FLUSH_TIMEOUT_SECONDS = 5.0
+TITLE_LENGTH = 50
+
+
+def session_title(query: str) -> str:
+    return query[:TITLE_LENGTH] + "..." if len(query) > TITLE_LENGTH else query
+
+
+def record_session_turn(session: Session, conversation: Conversation):
+    """Creates or updates the conversation's ChatSession summary row. Doesn't commit."""
+    statement = sqlite_insert(ChatSession).values(
+        session_id=conversation.session_id,
+        title=session_title(conversation.query),
+        created_at=conversation.created_at,
+        last_activity_at=conversation.created_at,
+        turn_count=1,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["session_id"],
+        set_={
+            "last_activity_at": func.max(ChatSession.last_activity_at, statement.excluded.last_activity_at),
+            "turn_count": ChatSession.turn_count + 1,
+        },
+    )
+    session.exec(statement)
+
+
+def backfill_chat_sessions():
+    """Builds the ChatSession table from existing conversations if it is still empty."""
+    with Session(engine) as session:
+        if session.exec(select(func.count()).select_from(ChatSession)).one():
+            return
+        first_ids = select(func.min(Conversation.id)).group_by(Conversation.session_id)
+        first_queries = dict(session.exec(
+            select(Conversation.session_id, Conversation.query).where(Conversation.id.in_(first_ids))
+        ).all())
+        if not first_queries:
+            return
+        print(f"--- [INFO] Backfilling chat session summaries for {len(first_queries)} sessions ---")
+        rows = session.exec(
+            select(Conversation.session_id, func.min(Conversation.created_at), func.max(Conversation.created_at),
+                   func.count(Conversation.id))
+            .group_by(Conversation.session_id)
+        ).all()
+        for session_id, created_at, last_activity_at, turn_count in rows:
+            session.add(ChatSession(
+                session_id=session_id, title=session_title(first_queries[session_id]),
+                created_at=created_at, last_activity_at=last_activity_at, turn_count=turn_count,
+            ))
+        session.commit()
+
+
+def encode_cursor(*values: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(values, list):
+            raise ValueError
+        return values
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
 
 class ChatHistoryService:
     def __init__(self, session: Session = Depends(get_session)):
         self.session = session
 
-    def get_sessions(self) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _apply_queued_writes():
+        """
+        Conversations are saved by the background writer; wait for the writes
+        queued before this read, so a just-finished chat is visible.
+        """
+        get_background_writer().flush(timeout=WRITER_FLUSH_TIMEOUT_SECONDS)
+
+    def get_sessions(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
         """
-        Retrieves a list of all unique conversation sessions, using the first
-        query of each session as its title.
+        Returns one page of sessions, most recently active first, and the cursor
+        of the next page (None on the last page). Pages are read by keyset on
+        (last_activity_at, session_id), so each costs O(limit).
         """
-        # This query finds the first entry (MIN(id)) for each session_id,
-        # then we retrieve the full row for those first entries.
-        # This line will now work correctly because 'func' is imported.
-        subquery = select(func.min(Conversation.id).label("min_id")).group_by(Conversation.session_id).alias("subquery")
-        query = select(Conversation).join(subquery, Conversation.id == subquery.c.min_id).order_by(Conversation.created_at.desc())
-        
-        first_conversations = self.session.exec(query).all()
-        
+        self._apply_queued_writes()
+        query = select(ChatSession).order_by(ChatSession.last_activity_at.desc(), ChatSession.session_id.desc())
+        if cursor:
+            try:
+                last_activity_at, session_id = decode_cursor(cursor)
+                last_activity_at = datetime.fromisoformat(last_activity_at)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+            query = query.where(
+                tuple_(ChatSession.last_activity_at, ChatSession.session_id) < tuple_(last_activity_at, session_id)
+            )
+        sessions = self.session.exec(query.limit(limit + 1)).all()
+
+        next_cursor = None
+        if len(sessions) > limit:
+            sessions = sessions[:limit]
+            next_cursor = encode_cursor(sessions[-1].last_activity_at.isoformat(), sessions[-1].session_id)
         return [
-            {"session_id": conv.session_id, "title": conv.query[:50] + "..." if len(conv.query) > 50 else conv.query}
-            for conv in first_conversations
-        ]
+            {
+                "session_id": s.session_id,
+                "title": s.title,
+                "last_activity_at": s.last_activity_at,
+                "turn_count": s.turn_count,
+            }
+            for s in sessions
+        ], next_cursor
 
-    def get_history(self, session_id: str) -> List[Dict[str, Any]]:
+    def get_history(self, session_id: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
         """
-        Retrieves the full message history for a given session_id and
-        formats it for the frontend.
+        Returns the latest `limit` turns of a session (older than `cursor`, if
+        given) as user/bot messages in chronological order, plus the cursor of
+        the previous page of turns (None once the first turn is included).
         """
-        conversations = self.session.exec(
-            select(Conversation).where(Conversation.session_id == session_id).order_by(Conversation.id)
-        ).all()
+        self._apply_queued_writes()
+        query = select(Conversation).where(Conversation.session_id == session_id)
+        if cursor:
+            try:
+                (before_id,) = decode_cursor(cursor)
+                before_id = int(before_id)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+            query = query.where(Conversation.id < before_id)
+        conversations = self.session.exec(query.order_by(Conversation.id.desc()).limit(limit + 1)).all()
 
-        if not conversations:
+        if not conversations and not cursor:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
 
+        next_cursor = None
+        if len(conversations) > limit:
+            conversations = conversations[:limit]
+            next_cursor = encode_cursor(conversations[-1].id)
+
         # "Unroll" the conversation rows into a list of user/bot messages
         messages = []
-        for conv in conversations:
+        for conv in reversed(conversations):
             messages.append({"role": "user", "text": conv.query})
             messages.append({"role": "bot", "text": conv.answer, "sources": conv.sources})
-        
-        return messages
+
+        return messages, next_cursor
 
     def delete_session(self, session_id: str):
         """
         Deletes all conversation entries for a given session_id.
         """
+        self._apply_queued_writes()
+        remove_conversations(self.session, Conversation.session_id == session_id)
+        session_conversations = select(Conversation.id).where(Conversation.session_id == session_id)
+        self.session.exec(delete(QueryTrace).where(QueryTrace.conversation_id.in_(session_conversations)))
         statement = delete(Conversation).where(Conversation.session_id == session_id)
         result = self.session.exec(statement)
+        self.session.exec(delete(ChatSession).where(ChatSession.session_id == session_id))
         self.session.commit()
 
         if result.rowcount == 0:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
-        
-        return {"status": "ok", "deleted_count": result.rowcount}
\ No newline at end of file
+
+        return {"status": "ok", "deleted_count": result.rowcount}
@@ -2,178 +2,652 @@ import os
 import uuid
 import hashlib
 import json
-import traceback
-from typing import List, Dict, Any
+import queue
+import threading
+from datetime import datetime
+from itertools import islice
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
 
-from fastapi import Depends, UploadFile, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
 
-from ..db.sqlite_db import get_session
+from ..db.sqlite_db import engine, get_session
 from ..db.chroma_db import get_or_create_collection
+from ..db import keyword_index
 from ..core.settings import settings
+from ..core.metrics import INGESTED_PAGES, INGESTED_CHUNKS
 from ..models.database import Document
-from ..models.api import UploadResponse, DocumentOut, ChunkOut
-from ..parsers.base import ParseResult
-from ..parsers import pdf_parser, docx_parser, text_parser, md_parser, html_parser
-from ..rag.retrieve import embed_texts, chunk_text
+from ..models.api import DocumentOut, ChunkOut
+from ..parsers import PARSERS
+from ..rag.retrieve import embed_texts_cached, chunk_text
+from ..rag.corpus import get_corpus_snapshot
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _legacy_chunk_filter(doc: Document) -> Dict[str, Any]:
+    """Chroma filter for a document's chunks indexed before doc_id was stored in chunk metadata."""
+    return {"$and": [{"filename": doc.filename}, {"source_path": doc.filepath}]}
+
+
+def chunk_hash(text: str) -> str:
+    """Identifies a chunk by its text, so re-ingestion can tell unchanged chunks from new ones."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _chunk_order(metadata: Dict[str, Any]) -> Tuple[int, int, int]:
+    """Sort key that puts a document's chunks in reading order."""
+    return (metadata.get("chunk_index", -1), metadata.get("page") or 0, metadata.get("char_start") or 0)
+
+
+# Written next to the Chroma data once every stored chunk carries a doc_id.
+CHUNK_DOC_IDS_MARKER = "chunk_doc_ids.v1"
+
+
+def backfill_chunk_doc_ids(batch_size: int = 1000):
+    """
+    Stamps doc_id and chunk_index into the metadata of chunks indexed before
+    ingestion stored them. Chunks are matched to their Document by stored file
+    path, or by filename where that is unambiguous; chunk_index follows
+    (page, char_start) order. Runs once per collection.
+    """
+    marker = os.path.join(settings.CHROMA_PERSIST_DIR, CHUNK_DOC_IDS_MARKER)
+    if os.path.exists(marker):
+        return
+    collection = get_or_create_collection()
+    with Session(engine) as session:
+        documents = session.exec(select(Document.id, Document.filename, Document.filepath)).all()
+    by_path = {filepath: doc_id for doc_id, _, filepath in documents}
+    filename_ids: Dict[str, List[int]] = {}
+    for doc_id, filename, _ in documents:
+        filename_ids.setdefault(filename, []).append(doc_id)
+
+    legacy: Dict[int, List[Tuple[str, Dict[str, Any]]]] = {}
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        batch = collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+        for chunk_id, meta in zip(batch["ids"], batch["metadatas"]):
+            if meta is None or "doc_id" in meta:
+                continue
+            doc_id = by_path.get(meta.get("source_path"))
+            if doc_id is None and len(filename_ids.get(meta.get("filename"), [])) == 1:
+                doc_id = filename_ids[meta["filename"]][0]
+            if doc_id is not None:
+                legacy.setdefault(doc_id, []).append((chunk_id, meta))
+
+    if legacy:
+        print(f"--- [INFO] Storing document ids in the metadata of {sum(map(len, legacy.values()))} chunks ---")
+        updates = []
+        for doc_id, chunks in legacy.items():
+            chunks.sort(key=lambda c: _chunk_order(c[1]))
+            updates.extend((chunk_id, {**meta, "doc_id": doc_id, "chunk_index": index})
+                           for index, (chunk_id, meta) in enumerate(chunks))
+        for batch in _batched(updates, batch_size):
+            collection.update(ids=[c[0] for c in batch], metadatas=[c[1] for c in batch])
+        get_corpus_snapshot().invalidate()
+        print("--- [INFO] Chunk document ids stored. ---")
+    os.makedirs(settings.CHROMA_PERSIST_DIR, exist_ok=True)
+    with open(marker, "w") as f:
+        f.write("done\n")
+
+
+_document_locks: Dict[int, threading.Lock] = {}
+_document_locks_guard = threading.Lock()
+
+
+def document_lock(doc_id: int) -> threading.Lock:
+    """The process-wide lock that serializes updates and deletes of one document."""
+    with _document_locks_guard:
+        return _document_locks.setdefault(doc_id, threading.Lock())
+
+
+class _ChunkBatchWriter:
+    """
+    Writes embedded chunk batches on a background thread, so the Chroma write of
+    batch N overlaps the embedding of batch N+1. The bounded queue applies
+    backpressure to the producer.
+    """
+
+    def __init__(self, write: Callable[[List[Dict[str, Any]]], None], max_pending: int):
+        self._write = write
+        self._queue: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(maxsize=max(1, max_pending))
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self.written_ids: List[str] = []
+        self._thread = threading.Thread(target=self._run, name="chunk-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                continue  # Drain the queue after a failure.
+            # Recorded before the write, so undoing a failed run also removes a partly written batch.
+            self.written_ids.extend(c['id'] for c in batch)
+            try:
+                self._write(batch)
+            except BaseException as e:
+                self._error = e
+
+    def put(self, batch: List[Dict[str, Any]]):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(batch)
+
+    def close(self, raise_errors: bool = True):
+        """Waits for pending batches to be written."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+        if raise_errors and self._error is not None:
+            raise self._error
+
+
+class _MultipartUploadWriter:
+    """
+    Incremental multipart/form-data parser that writes the file parts named
+    `field` to UPLOAD_DIR as their bytes arrive, hashing as it goes, so memory
+    and disk use never exceed what is kept. A part that grows past
+    MAX_UPLOAD_BYTES is abandoned right away: its partial file is deleted and
+    its remaining bytes are skipped.
+    """
+
+    def __init__(self, boundary: bytes, field: str):
+        self.field = field
+        self.uploads: List[Dict[str, Any]] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._part: Optional[Dict[str, Any]] = None
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def write(self, data: bytes):
+        self._parser.write(data)
+
+    def finalize(self):
+        self._parser.finalize()
+        if self._part is not None:
+            raise MultipartParseError("Upload ended inside a file part.")
+
+    def discard(self):
+        """Deletes every file written so far, e.g. when the request fails."""
+        if self._part is not None and self._part["file"] is not None:
+            self._part["file"].close()
+            os.remove(self._part["filepath"])
+        self._part = None
+        for upload in self.uploads:
+            if upload.get("filepath") and os.path.exists(upload["filepath"]):
+                os.remove(upload["filepath"])
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = os.path.basename(options.get(b"filename", b"").decode("utf-8", errors="replace"))
+        if options.get(b"name", b"").decode("utf-8", errors="replace") != self.field or not filename:
+            return
+        filepath = os.path.join(settings.UPLOAD_DIR, f"{uuid.uuid4()}_{filename}")
+        self._part = {
+            "filename": filename, "filepath": filepath, "file": open(filepath, "wb"),
+            "hasher": hashlib.sha256(), "size": 0,
+        }
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        part = self._part
+        if part is None or part["file"] is None:
+            return
+        part["size"] += end - start
+        if settings.MAX_UPLOAD_BYTES and part["size"] > settings.MAX_UPLOAD_BYTES:
+            part["file"].close()
+            os.remove(part["filepath"])
+            part["file"] = None
+            return
+        part["hasher"].update(data[start:end])
+        part["file"].write(data[start:end])
+
+    def _on_part_end(self):
+        part, self._part = self._part, None
+        if part is None:
+            return
+        if part["file"] is None:
+            self.uploads.append({
+                "filename": part["filename"],
+                "error": f"File exceeds the upload limit of {settings.MAX_UPLOAD_BYTES} bytes.",
+            })
+            return
+        part["file"].close()
+        self.uploads.append({
+            "filename": part["filename"], "filepath": part["filepath"], "content_hash": part["hasher"].hexdigest(),
+        })
+
 
 class DocumentService:
     def __init__(self, session: Session = Depends(get_session)):
         self.session = session
         self.chroma_collection = get_or_create_collection()
-        self.parsers = {
-            ".pdf": pdf_parser.PDFParser(),
-            ".docx": docx_parser.DOCXParser(),
-            ".txt": text_parser.TextParser(),
-            ".md": md_parser.MDParser(),
-            ".html": html_parser.HTMLParser(),
-            ".htm": html_parser.HTMLParser(),
-        }
+        self.parsers = PARSERS
         os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 
-    async def process_uploaded_files(self, files: List[UploadFile]) -> UploadResponse:
-        success_docs = []
-        error_docs = []
+    async def receive_uploads(self, request: Request, field: str, max_files: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Streams the file parts named `field` of a multipart/form-data request to
+        the upload directory as the body arrives, and returns one record per
+        file: {"filename", "filepath", "content_hash"}, or {"filename", "error"}
+        for a file over MAX_UPLOAD_BYTES, which is cut off as soon as it crosses
+        the limit. A request over MAX_UPLOAD_REQUEST_BYTES is rejected with 413,
+        up front when its Content-Length says so.
+        """
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a multipart/form-data upload.")
+        limit = settings.MAX_UPLOAD_REQUEST_BYTES
+        too_large = HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Upload exceeds the request limit of {limit} bytes.",
+        )
+        declared = request.headers.get("content-length", "")
+        if limit and declared.isdigit() and int(declared) > limit:
+            raise too_large
+
+        writer = _MultipartUploadWriter(options[b"boundary"], field)
+        received = 0
+        try:
+            async for block in request.stream():
+                received += len(block)
+                if limit and received > limit:
+                    raise too_large
+                await run_in_threadpool(writer.write, block)
+            writer.finalize()
+        except MultipartParseError:
+            writer.discard()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Malformed multipart upload.")
+        except BaseException:
+            writer.discard()
+            raise
+
+        if not writer.uploads:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No files were provided.")
+        if max_files is not None and len(writer.uploads) > max_files:
+            writer.discard()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {max_files} file(s) allowed.")
+        return writer.uploads
+
+    def find_by_content_hash(self, content_hash: str) -> Optional[Document]:
+        return self.session.exec(select(Document).where(Document.content_hash == content_hash)).first()
+
+    def ingest_file(
+        self,
+        filepath: str,
+        filename: str,
+        content_hash: str,
+        progress: Optional[Callable[..., None]] = None,
+    ) -> DocumentOut:
+        """
+        Streams one stored file through page -> chunk -> embed-batch -> Chroma-batch
+        and records it as a Document. Chunks are embedded in batches of
+        EMBED_BATCH_SIZE while earlier batches are written by a background writer,
+        so peak memory depends on the batch size rather than the document size.
+        `progress(stage, **counters)` is called as the file moves through the
+        pipeline. Raises on failure, after undoing partial indexing.
+        """
+        report = progress or (lambda stage, **counters: None)
+        parser = self._get_parser(filename)
 
-        for file in files:
-            filepath = None
+        doc = self._claim_document(filename, filepath, content_hash)
+
+        report("parsing")
+        counters = {"pages": 0, "chunks": 0, "embedded": 0}
+        writer = _ChunkBatchWriter(self.index_chunks, max_pending=settings.INGEST_MAX_PENDING_BATCHES)
+        try:
+            doc_metadata = self._write_file_chunks(writer, parser, filepath, filename, doc.id, counters, report)
+
+            doc.chunk_count = counters["chunks"]
+            doc.document_metadata = doc_metadata or {}
+            doc.status = "ready"
+            self.session.add(doc)
+            self.session.commit()
+            self.session.refresh(doc)
+            INGESTED_PAGES.inc(counters["pages"])
+            INGESTED_CHUNKS.inc(counters["chunks"])
+        except Exception:
+            writer.close(raise_errors=False)
+            self.session.rollback()
+            self.remove_chunks(writer.written_ids)
+            self.session.delete(doc)
+            self.session.commit()
+            raise
+
+        return DocumentOut(
+            id=doc.id, filename=doc.filename, chunk_count=doc.chunk_count,
+            processed_at=doc.processed_at, document_metadata=doc.document_metadata
+        )
+
+    def update_document(
+        self,
+        doc_id: int,
+        filepath: str,
+        filename: str,
+        content_hash: str,
+        progress: Optional[Callable[..., None]] = None,
+        stale_ids: Optional[List[str]] = None,
+        previous_filepath: Optional[str] = None,
+    ) -> DocumentOut:
+        """
+        Replaces a document with a new version of its file, re-indexing only what
+        changed. The new version is chunked as on ingestion and every chunk is
+        matched to the document's indexed chunks by chunk_hash: matches are kept
+        (only their position metadata is rewritten), the rest are embedded and
+        written, and indexed chunks that no longer occur are deleted. The
+        Document row is updated in one transaction once the new chunks are
+        written; just before that, the ids of the chunks to delete and the
+        previous file are reported as `stale_ids` and `previous_filepath`. A
+        resumed update passes them back so a run interrupted after the commit
+        finishes their removal. Updates and deletes of one document are
+        serialized by its document lock. Raises on failure, after undoing the
+        chunks it added.
+        """
+        report = progress or (lambda stage, **counters: None)
+        parser = self._get_parser(filename)
+
+        with document_lock(doc_id):
+            doc = self.session.get(Document, doc_id)
+            if not doc or doc.status != "ready":
+                raise ValueError("Document not found.")
+            owner = self.find_by_content_hash(content_hash)
+            if owner is not None and owner.id != doc.id:
+                raise ValueError("Duplicate document already exists.")
+            if owner is not None and owner.filepath != filepath:
+                # Same content as the current version: nothing to re-index.
+                os.remove(filepath)
+                return self.get_document_by_id(doc.id)
+            if owner is not None and stale_ids is not None:
+                # Resumed after the new version was committed: finish the removal it logged.
+                self.remove_chunks(stale_ids)
+                if previous_filepath and previous_filepath != filepath and os.path.exists(previous_filepath):
+                    os.remove(previous_filepath)
+
+            indexed = self._indexed_chunks_by_hash(doc)
+            report("parsing")
+            counters = {"pages": 0, "chunks": 0, "embedded": 0, "kept": 0}
+            kept: List[Tuple[str, Dict[str, Any]]] = []
+
+            def is_changed(chunk: Dict[str, Any]) -> bool:
+                candidates = indexed.get(chunk['metadata']['chunk_hash'])
+                if not candidates:
+                    return True
+                chunk_id, metadata = candidates.pop()
+                counters["kept"] += 1
+                new_metadata = {k: v for k, v in chunk['metadata'].items() if v is not None}
+                if new_metadata != metadata:
+                    kept.append((chunk_id, new_metadata))
+                return False
+
+            writer = _ChunkBatchWriter(self.index_chunks, max_pending=settings.INGEST_MAX_PENDING_BATCHES)
             try:
-                content = await file.read()
-                content_hash = hashlib.sha256(content).hexdigest()
-
-                existing_doc = self.session.exec(select(Document).where(Document.content_hash == content_hash)).first()
-                if existing_doc:
-                    error_docs.append({"filename": file.filename, "error": "Duplicate document already exists."})
-                    continue
-
-                filepath = os.path.join(settings.UPLOAD_DIR, f"{uuid.uuid4()}_{file.filename}")
-                with open(filepath, "wb") as buffer:
-                    buffer.write(content)
-
-                ext = os.path.splitext(file.filename)[1].lower()
-                parser = self.parsers.get(ext)
-                if not parser:
-                    raise ValueError(f"Unsupported file type: '{ext}'")
-                
-                parsed_result = parser.parse(filepath)
-
-                chunks = self._chunk_and_embed(parsed_result, file.filename, filepath)
-                
-                if chunks:
-                    sanitized_metadatas = []
-                    for c in chunks:
-                        clean_meta = {k: v for k, v in c['metadata'].items() if v is not None}
-                        sanitized_metadatas.append(clean_meta)
-
-                    self.chroma_collection.add(
-                        ids=[c['id'] for c in chunks],
-                        documents=[c['text'] for c in chunks],
-                        embeddings=[c['embedding'] for c in chunks],
-                        metadatas=sanitized_metadatas
-                    )
-
-                doc = Document(
-                    filename=file.filename,
-                    filepath=filepath,
-                    content_hash=content_hash,
-                    chunk_count=len(chunks),
-                    document_metadata=parsed_result.metadata or {}
+                doc_metadata = self._write_file_chunks(
+                    writer, parser, filepath, filename, doc.id, counters, report, needs_embedding=is_changed
                 )
+
+                stale_ids = [chunk_id for candidates in indexed.values() for chunk_id, _ in candidates]
+                previous_filepath = doc.filepath
+                report("indexing", removed=len(stale_ids), stale_ids=stale_ids, previous_filepath=previous_filepath)
+                doc.filename = filename
+                doc.filepath = filepath
+                doc.content_hash = content_hash
+                doc.chunk_count = counters["chunks"]
+                doc.document_metadata = doc_metadata or {}
+                doc.processed_at = datetime.utcnow()
                 self.session.add(doc)
                 self.session.commit()
                 self.session.refresh(doc)
-                
-                success_docs.append(DocumentOut(
-                    id=doc.id, filename=doc.filename, chunk_count=doc.chunk_count,
-                    processed_at=doc.processed_at, document_metadata=doc.document_metadata
-                ))
-
-            except Exception as e:
-                traceback.print_exc()
-                error_docs.append({"filename": file.filename, "error": str(e)})
-                if filepath and os.path.exists(filepath):
-                    os.remove(filepath)
-        
-        return UploadResponse(success=success_docs, errors=error_docs)
-
-    def _chunk_and_embed(self, parsed: ParseResult, filename: str, filepath: str) -> List[Dict[str, Any]]:
-        text_units = []
-        if "pages" in parsed.metadata and parsed.metadata["pages"]:
-            for page_data in parsed.metadata["pages"]:
-                text_units.append({
-                    "text": page_data.get("text", ""),
-                    "metadata": {"page": page_data.get("page_number")}
-                })
-        else:
-            text_units.append({
-                "text": parsed.text,
-                "metadata": {"page": None}
-            })
+            except Exception:
+                writer.close(raise_errors=False)
+                self.session.rollback()
+                self.remove_chunks(writer.written_ids)
+                raise
+
+            self._update_chunk_metadata(kept)
+            self.remove_chunks(stale_ids)
+            if previous_filepath != filepath and os.path.exists(previous_filepath):
+                os.remove(previous_filepath)
+        INGESTED_PAGES.inc(counters["pages"])
+        INGESTED_CHUNKS.inc(counters["embedded"])
+
+        return DocumentOut(
+            id=doc.id, filename=doc.filename, chunk_count=doc.chunk_count,
+            processed_at=doc.processed_at, document_metadata=doc.document_metadata
+        )
+
+    def _get_parser(self, filename: str):
+        ext = os.path.splitext(filename)[1].lower()
+        parser = self.parsers.get(ext)
+        if not parser:
+            raise ValueError(f"Unsupported file type: '{ext}'")
+        return parser
+
+    def _write_file_chunks(
+        self,
+        writer: _ChunkBatchWriter,
+        parser: Any,
+        filepath: str,
+        filename: str,
+        doc_id: int,
+        counters: Dict[str, int],
+        report: Callable[..., None],
+        needs_embedding: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Streams a stored file through page -> chunk -> embed-batch and hands the
+        batches to `writer`, waiting for them to be written.
+        `needs_embedding(chunk)` picks the chunks to embed (default: all). Keeps counters["pages"],
+        ["chunks"] and ["embedded"] current and returns the parsed document
+        metadata.
+        """
+        doc_metadata, pages = parser.stream(filepath)
+
+        def counted_pages():
+            for page in pages:
+                counters["pages"] += 1
+                yield page
 
-        all_chunks = []
-        for unit in text_units:
-            unit_text = unit.get("text", "")
-            unit_metadata = unit.get("metadata", {})
-            
-            if not unit_text.strip():
+        def selected_chunks():
+            for chunk in self.iter_chunks(counted_pages(), filename, filepath, doc_id):
+                counters["chunks"] += 1
+                if needs_embedding is None or needs_embedding(chunk):
+                    yield chunk
+
+        for batch in _batched(selected_chunks(), settings.EMBED_BATCH_SIZE):
+            report("embedding", **counters)
+            embeddings = embed_texts_cached([c['text'] for c in batch])
+            for chunk, embedding in zip(batch, embeddings):
+                chunk['embedding'] = embedding
+            counters["embedded"] += len(batch)
+            # Blocks while INGEST_MAX_PENDING_BATCHES batches are waiting (backpressure).
+            writer.put(batch)
+        report("indexing", **counters)
+        writer.close()
+        return doc_metadata
+
+    def _indexed_chunks_by_hash(self, doc: Document) -> Dict[str, List[Tuple[str, Dict[str, Any]]]]:
+        """Groups a document's indexed chunks as chunk_hash -> [(id, metadata)], hashing texts of older chunks."""
+        results = self.chroma_collection.get(where={"doc_id": doc.id}, include=["metadatas"])
+        if not results['ids']:
+            results = self.chroma_collection.get(where=_legacy_chunk_filter(doc), include=["metadatas"])
+        metadatas = dict(zip(results['ids'], results['metadatas']))
+        unhashed = [chunk_id for chunk_id, meta in metadatas.items() if "chunk_hash" not in meta]
+        texts = {}
+        if unhashed:
+            fetched = self.chroma_collection.get(ids=unhashed, include=["documents"])
+            texts = dict(zip(fetched['ids'], fetched['documents']))
+
+        grouped: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        for chunk_id, meta in sorted(metadatas.items(), key=lambda item: _chunk_order(item[1]), reverse=True):
+            key = meta.get("chunk_hash") or chunk_hash(texts[chunk_id])
+            grouped.setdefault(key, []).append((chunk_id, meta))
+        return grouped
+
+    def _update_chunk_metadata(self, updates: List[Tuple[str, Dict[str, Any]]]):
+        """Rewrites the metadata of unchanged chunks in Chroma and the corpus snapshot."""
+        for batch in _batched(updates, settings.EMBED_BATCH_SIZE):
+            ids = [chunk_id for chunk_id, _ in batch]
+            metadatas = [metadata for _, metadata in batch]
+            self.chroma_collection.update(ids=ids, metadatas=metadatas)
+            get_corpus_snapshot().update_metadata(ids, metadatas)
+
+    def _claim_document(self, filename: str, filepath: str, content_hash: str) -> Document:
+        """
+        Commits the Document row, as "ingesting", before any chunk is written, so
+        every chunk can carry its doc_id. A row left behind for the same stored file by an
+        interrupted run (e.g. a restart mid-ingestion) is reused after its
+        partial chunks are removed; any other row with this hash is a duplicate.
+        """
+        doc = self.find_by_content_hash(content_hash)
+        if doc is not None:
+            if doc.filepath != filepath:
+                raise ValueError("Duplicate document already exists.")
+            self.remove_chunks(self.chunk_ids(doc))
+            return doc
+        doc = Document(filename=filename, filepath=filepath, content_hash=content_hash, chunk_count=0, status="ingesting")
+        self.session.add(doc)
+        try:
+            self.session.commit()
+        except IntegrityError:
+            # Another worker committed the same content first.
+            self.session.rollback()
+            raise ValueError("Duplicate document already exists.")
+        self.session.refresh(doc)
+        return doc
+
+    def chunk_ids(self, doc: Document) -> List[str]:
+        """Ids of a document's chunks, by doc_id, or by file for chunks indexed before doc_id was stored."""
+        ids = self.chroma_collection.get(where={"doc_id": doc.id}, include=[])['ids']
+        return ids or self.chroma_collection.get(where=_legacy_chunk_filter(doc), include=[])['ids']
+
+    def index_chunks(self, chunks: List[Dict[str, Any]]):
+        """Writes embedded chunks to Chroma, the keyword index and the corpus snapshot."""
+        if not chunks:
+            return
+        sanitized_metadatas = []
+        for c in chunks:
+            clean_meta = {k: v for k, v in c['metadata'].items() if v is not None}
+            sanitized_metadatas.append(clean_meta)
+
+        ids = [c['id'] for c in chunks]
+        texts = [c['text'] for c in chunks]
+        self.chroma_collection.add(
+            ids=ids,
+            documents=texts,
+            embeddings=[c['embedding'] for c in chunks],
+            metadatas=sanitized_metadatas
+        )
+        keyword_index.add_chunks(ids, texts)
+        get_corpus_snapshot().add(ids, texts, sanitized_metadatas)
+
+    def remove_chunks(self, chunk_ids: List[str]):
+        """Deletes chunks from Chroma, the keyword index and the corpus snapshot."""
+        if not chunk_ids:
+            return
+        self.chroma_collection.delete(ids=chunk_ids)
+        keyword_index.delete_chunks(chunk_ids)
+        get_corpus_snapshot().remove(chunk_ids)
+
+    def iter_chunks(
+        self, pages: Iterable[Tuple[Optional[int], str]], filename: str, filepath: str, doc_id: int
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily chunks (page_number, text) units into {"id", "text", "metadata"}
+        chunks. The metadata carries the owning doc_id, the chunk's ordinal
+        within the document (chunk_index) and the hash of its text (chunk_hash).
+        """
+        chunk_index = 0
+        for page_number, unit_text in pages:
+            if not unit_text or not unit_text.strip():
                 continue
 
             base_metadata = {
+                "doc_id": doc_id,
                 "filename": filename,
                 "source_path": filepath,
-                **unit_metadata
+                "page": page_number,
             }
-            
-            unit_chunks = chunk_text(
+            for chunk in chunk_text(
                 unit_text,
                 chunk_size=settings.DEFAULT_CHUNK_SIZE,
                 overlap=settings.DEFAULT_CHUNK_OVERLAP,
                 metadata=base_metadata
-            )
-            all_chunks.extend(unit_chunks)
-
-        if not all_chunks:
-            return []
-
-        texts_to_embed = [c['text'] for c in all_chunks]
-        embeddings = embed_texts(texts_to_embed)
-
-        results = []
-        for i, chunk in enumerate(all_chunks):
-            results.append({
-                "id": str(uuid.uuid4()),
-                "text": chunk['text'],
-                "metadata": chunk['metadata'],
-                "embedding": embeddings[i]
-            })
-        return results
+            ):
+                chunk['metadata']['chunk_index'] = chunk_index
+                chunk['metadata']['chunk_hash'] = chunk_hash(chunk['text'])
+                chunk_index += 1
+                yield {"id": str(uuid.uuid4()), **chunk}
 
     def get_all_documents(self) -> List[DocumentOut]:
-        docs = self.session.exec(select(Document).order_by(Document.processed_at.desc())).all()
+        docs = self.session.exec(
+            select(Document).where(Document.status == "ready").order_by(Document.processed_at.desc())
+        ).all()
         return [DocumentOut(
             id=d.id, filename=d.filename, chunk_count=d.chunk_count,
             processed_at=d.processed_at, document_metadata=d.document_metadata
         ) for d in docs]
 
-    def get_document_by_id(self, doc_id: int) -> DocumentOut:
+    def _get_ready_document(self, doc_id: int) -> Document:
+        """Documents still being ingested are not served, as their chunks are incomplete."""
         doc = self.session.get(Document, doc_id)
-        if not doc:
+        if not doc or doc.status != "ready":
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+        return doc
+
+    def get_document_by_id(self, doc_id: int) -> DocumentOut:
+        doc = self._get_ready_document(doc_id)
         return DocumentOut(
             id=doc.id, filename=doc.filename, chunk_count=doc.chunk_count,
             processed_at=doc.processed_at, document_metadata=doc.document_metadata
         )
 
     def get_chunks_for_document(self, doc_id: int) -> List[ChunkOut]:
-        doc = self.session.get(Document, doc_id)
-        if not doc:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
-        results = self.chroma_collection.get(where={"filename": doc.filename}, include=["metadatas", "documents"])
+        doc = self._get_ready_document(doc_id)
+        results = self.chroma_collection.get(where={"doc_id": doc.id}, include=["metadatas", "documents"])
+        if not results['ids']:
+            results = self.chroma_collection.get(where=_legacy_chunk_filter(doc), include=["metadatas", "documents"])
         if not results or not results['ids']:
             return []
         chunks = []
-        for i, doc_text in enumerate(results['documents']):
+        order = sorted(range(len(results['ids'])), key=lambda i: _chunk_order(results['metadatas'][i]))
+        for i in order:
+            doc_text = results['documents'][i]
             meta = results['metadatas'][i]
             chunks.append(ChunkOut(
                 id=results['ids'][i],
@@ -186,7 +660,7 @@ class DocumentService:
 
     def download_document_file(self, doc_id: int) -> FileResponse:
         doc = self.session.get(Document, doc_id)
-        if not doc or not os.path.exists(doc.filepath):
+        if not doc or doc.status != "ready" or not os.path.exists(doc.filepath):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found on server")
         return FileResponse(doc.filepath, filename=doc.filename)
 
@@ -194,9 +668,18 @@ class DocumentService:
         doc = self.session.get(Document, doc_id)
         if not doc:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
-        self.chroma_collection.delete(where={"filename": doc.filename})
-        self.session.delete(doc)
-        self.session.commit()
+        if doc.status == "ingesting":
+            # The ingestion worker is still writing its chunks; deleting now would leave them orphaned.
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Document is still being ingested")
+        lock = document_lock(doc_id)
+        if not lock.acquire(blocking=False):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Document is being updated")
+        try:
+            self.remove_chunks(self.chunk_ids(doc))
+            self.session.delete(doc)
+            self.session.commit()
+        finally:
+            lock.release()
         if os.path.exists(doc.filepath):
             os.remove(doc.filepath)
         return None
\ No newline at end of file
@@ -0,0 +1,290 @@
+import os
+import time
+import uuid
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Dict, Any
+
+from fastapi import Depends, HTTPException, Request, status
+from sqlmodel import Session, select, col, func, update
+
+from ..db.sqlite_db import engine, get_session
+from ..core.settings import settings
+from ..core.metrics import INGESTED_FILES, INGESTION_FILE_DURATION
+from ..models.database import Document, IngestionFile, IngestionJob
+from ..models.api import IngestionJobOut, UploadResponse, DocumentOut
+from .document_service import DocumentService
+
+FINAL_STAGES = ("done", "failed")
+# Server-side bookkeeping of a file entry that is not part of the API.
+PRIVATE_FILE_FIELDS = ("filepath", "stale_ids", "previous_filepath")
+# Multipart field names of the upload and update endpoints.
+UPLOAD_FIELD = "files"
+UPDATE_FIELD = "file"
+
+
+class IngestionWorkerPool:
+    """
+    Processes the files of queued ingestion jobs on a pool of worker threads,
+    one file per task, persisting per-file progress on the file's
+    IngestionFile row.
+    """
+
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        # Guards the queued-file count and serializes completing a job.
+        self._lock = threading.Lock()
+        self._queued_files = 0
+
+    @property
+    def queued_files(self) -> int:
+        """Files submitted to the pool that no worker has picked up yet."""
+        return self._queued_files
+
+    def submit(self, job_id: str, file_count: int):
+        with self._lock:
+            self._queued_files += file_count
+        for index in range(file_count):
+            self._executor.submit(self._run_file, job_id, index)
+
+    def resume_unfinished(self):
+        """Re-queues jobs that were interrupted by a restart."""
+        with Session(engine) as session:
+            jobs = session.exec(select(IngestionJob).where(col(IngestionJob.status).in_(["queued", "running"]))).all()
+            pending = []
+            for job in jobs:
+                if job.files:
+                    migrate_job_files(session, job)
+                count = session.exec(
+                    select(func.count()).select_from(IngestionFile).where(IngestionFile.job_id == job.id)
+                ).one()
+                pending.append((job.id, count))
+        for job_id, file_count in pending:
+            print(f"--- [INFO] Resuming ingestion job {job_id} ---")
+            self.submit(job_id, file_count)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_file(self, job_id: str, index: int):
+        with self._lock:
+            self._queued_files -= 1
+        with Session(engine) as session:
+            file = session.get(IngestionFile, (job_id, index))
+            if file is None:
+                return
+            entry = {**file.data, "stage": file.stage}
+        if entry["stage"] in FINAL_STAGES:
+            return
+
+        def report(stage: str, **counters):
+            self._update_file(job_id, index, stage=stage, **counters)
+
+        started = time.perf_counter()
+        try:
+            self._mark_running(job_id)
+            report("parsing", started_at=datetime.utcnow().isoformat())
+            with Session(engine) as session:
+                documents = DocumentService(session)
+                if entry.get("doc_id") is not None:
+                    document = documents.update_document(
+                        entry["doc_id"], entry["filepath"], entry["filename"], entry["content_hash"], progress=report,
+                        stale_ids=entry.get("stale_ids"), previous_filepath=entry.get("previous_filepath"),
+                    )
+                else:
+                    document = documents.ingest_file(
+                        entry["filepath"], entry["filename"], entry["content_hash"], progress=report
+                    )
+            self._update_file(job_id, index, stage="done", document=document.model_dump(mode="json"),
+                              finished_at=datetime.utcnow().isoformat())
+            INGESTED_FILES.inc(status="done")
+        except Exception as e:
+            traceback.print_exc()
+            INGESTED_FILES.inc(status="failed")
+            if os.path.exists(entry["filepath"]) and not _is_document_file(entry["filepath"]):
+                os.remove(entry["filepath"])
+            self._update_file(job_id, index, stage="failed", error=str(e),
+                              finished_at=datetime.utcnow().isoformat())
+        finally:
+            INGESTION_FILE_DURATION.observe(time.perf_counter() - started)
+
+    def _mark_running(self, job_id: str):
+        with Session(engine) as session:
+            session.exec(
+                update(IngestionJob)
+                .where(IngestionJob.id == job_id, IngestionJob.status == "queued")
+                .values(status="running", started_at=datetime.utcnow())
+            )
+            session.commit()
+
+    def _update_file(self, job_id: str, index: int, stage: str, **changes):
+        """Updates one file's row; the job row is only touched once its last file is final."""
+        with Session(engine) as session:
+            file = session.get(IngestionFile, (job_id, index))
+            if file is None:
+                return
+            file.stage = stage
+            file.data = {**file.data, **changes}
+            session.add(file)
+            session.commit()
+        if stage in FINAL_STAGES:
+            with self._lock, Session(engine) as session:
+                job = session.get(IngestionJob, job_id)
+                if job is not None and job.status != "completed":
+                    complete_if_finished(session, job)
+                    session.commit()
+
+
+def _is_document_file(filepath: str) -> bool:
+    """Whether a Document already points at the file, e.g. an update that failed after its commit."""
+    with Session(engine) as session:
+        return session.exec(select(Document.id).where(Document.filepath == filepath)).first() is not None
+
+
+def job_files(session: Session, job: IngestionJob) -> List[Dict[str, Any]]:
+    """A job's per-file entries in upload order."""
+    if job.files:
+        return [dict(f) for f in job.files]
+    rows = session.exec(
+        select(IngestionFile).where(IngestionFile.job_id == job.id).order_by(IngestionFile.position)
+    ).all()
+    return [{**row.data, "stage": row.stage} for row in rows]
+
+
+def migrate_job_files(session: Session, job: IngestionJob):
+    """Moves the per-file entries of a job stored in its `files` column to IngestionFile rows."""
+    session.add_all([
+        IngestionFile(job_id=job.id, position=index, stage=entry.get("stage", "queued"),
+                      data={k: v for k, v in entry.items() if k != "stage"})
+        for index, entry in enumerate(job.files)
+    ])
+    job.files = []
+    session.add(job)
+    session.commit()
+
+
+def complete_if_finished(session: Session, job: IngestionJob):
+    """Marks the job completed and records its UploadResponse once every file is final."""
+    unfinished = session.exec(
+        select(func.count()).select_from(IngestionFile)
+        .where(IngestionFile.job_id == job.id, col(IngestionFile.stage).not_in(FINAL_STAGES))
+    ).one()
+    if unfinished:
+        return
+    files = job_files(session, job)
+    job.status = "completed"
+    job.started_at = job.started_at or datetime.utcnow()
+    job.finished_at = datetime.utcnow()
+    job.result = UploadResponse(
+        success=[DocumentOut(**f["document"]) for f in files if f.get("stage") == "done"],
+        errors=[{"filename": f["filename"], "error": f.get("error", "")} for f in files if f.get("stage") == "failed"],
+    ).model_dump(mode="json")
+    session.add(job)
+
+
+@lru_cache(maxsize=1)
+def get_ingestion_pool() -> IngestionWorkerPool:
+    """Returns the process-wide ingestion worker pool."""
+    return IngestionWorkerPool(max_workers=settings.INGEST_WORKERS)
+
+
+class IngestionService:
+    def __init__(self, session: Session = Depends(get_session)):
+        self.session = session
+
+    async def enqueue_uploads(self, request: Request, documents: DocumentService) -> IngestionJobOut:
+        """
+        Streams the uploaded files to disk and queues them for background
+        ingestion. Oversized files and duplicates (by content hash) are rejected
+        here, before any parsing work is queued.
+        """
+        entries = []
+        seen_hashes = set()
+        for saved in await documents.receive_uploads(request, UPLOAD_FIELD):
+            if "error" in saved:
+                entries.append({**saved, "filepath": None, "stage": "failed"})
+                continue
+
+            if saved["content_hash"] in seen_hashes or documents.find_by_content_hash(saved["content_hash"]):
+                os.remove(saved["filepath"])
+                entries.append({**saved, "filepath": None, "stage": "failed", "error": "Duplicate document already exists."})
+                continue
+            seen_hashes.add(saved["content_hash"])
+            entries.append({**saved, "stage": "queued"})
+
+        return self._enqueue(entries)
+
+    async def enqueue_update(self, doc_id: int, request: Request, documents: DocumentService) -> IngestionJobOut:
+        """
+        Streams a new version of a document to disk and queues it for background
+        re-ingestion, which re-indexes only the chunks that changed. Content that
+        belongs to a different document is rejected here.
+        """
+        documents.get_document_by_id(doc_id)
+        (saved,) = await documents.receive_uploads(request, UPDATE_FIELD, max_files=1)
+        if "error" in saved:
+            entry = {**saved, "filepath": None, "doc_id": doc_id, "stage": "failed"}
+        else:
+            owner = documents.find_by_content_hash(saved["content_hash"])
+            if owner is not None and owner.id != doc_id:
+                os.remove(saved["filepath"])
+                entry = {**saved, "filepath": None, "doc_id": doc_id, "stage": "failed",
+                         "error": "Duplicate document already exists."}
+            else:
+                entry = {**saved, "doc_id": doc_id, "stage": "queued"}
+        return self._enqueue([entry])
+
+    def _enqueue(self, entries: List[Dict[str, Any]]) -> IngestionJobOut:
+        job = IngestionJob(id=uuid.uuid4().hex)
+        self.session.add(job)
+        self.session.add_all([
+            IngestionFile(job_id=job.id, position=index, stage=entry["stage"],
+                          data={k: v for k, v in entry.items() if k != "stage"})
+            for index, entry in enumerate(entries)
+        ])
+        self.session.flush()
+        complete_if_finished(self.session, job)
+        self.session.commit()
+        self.session.refresh(job)
+
+        get_ingestion_pool().submit(job.id, len(entries))
+        return self._to_out(job)
+
+    def get_job(self, job_id: str) -> IngestionJobOut:
+        job = self.session.get(IngestionJob, job_id)
+        if not job:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ingestion job not found")
+        return self._to_out(job)
+
+    def list_jobs(self, limit: int = 20) -> List[IngestionJobOut]:
+        jobs = self.session.exec(select(IngestionJob).order_by(IngestionJob.created_at.desc()).limit(limit)).all()
+        return [self._to_out(job) for job in jobs]
+
+    def _to_out(self, job: IngestionJob) -> IngestionJobOut:
+        files = job_files(self.session, job)
+        finished = [f for f in files if f.get("stage") in FINAL_STAGES]
+        throughput = {"files_per_sec": 0.0, "pages_per_sec": 0.0, "chunks_per_sec": 0.0}
+        if job.started_at:
+            elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+            if elapsed > 0:
+                throughput = {
+                    "files_per_sec": round(len(finished) / elapsed, 3),
+                    "pages_per_sec": round(sum(f.get("pages", 0) for f in finished) / elapsed, 3),
+                    "chunks_per_sec": round(sum(f.get("chunks", 0) for f in finished) / elapsed, 3),
+                }
+        return IngestionJobOut(
+            job_id=job.id,
+            status=job.status,
+            created_at=job.created_at,
+            started_at=job.started_at,
+            finished_at=job.finished_at,
+            total_files=len(files),
+            processed_files=len(finished),
+            failed_files=sum(1 for f in files if f.get("stage") == "failed"),
+            files=[{k: v for k, v in f.items() if k not in PRIVATE_FILE_FIELDS} for f in files],
+            throughput=throughput,
+            result=UploadResponse(**job.result) if job.result else None,
+        )
@@ -0,0 +1,63 @@
+import time
+import threading
+
+from ..core.metrics import (
+    REGISTRY, PROCESS_RESIDENT_MEMORY, QUEUE_DEPTH, GENERATION_SLOTS, CACHE_HIT_RATIO, CACHE_ENTRIES, CHROMA_CHUNKS,
+    resident_memory_bytes,
+)
+from ..db.chroma_db import get_or_create_collection
+from ..db.writer import get_background_writer
+from ..rag.answer_cache import get_answer_cache
+from ..rag.batcher import get_embedding_batcher, get_rerank_batcher
+from ..rag.corpus import get_corpus_snapshot
+from ..rag.query_cache import get_query_cache
+from ..rag.retrieve import get_rerank_cache
+from ..rag.scheduler import get_generation_scheduler
+from .ingestion_service import get_ingestion_pool
+
+# Chroma's count() is only asked for when the corpus snapshot isn't loaded, and
+# at most once per interval, so scrapes stay cheap.
+_CHROMA_COUNT_INTERVAL_SECONDS = 60.0
+_chroma_count_lock = threading.Lock()
+_chroma_count = (0.0, None)
+
+
+def _chroma_chunk_count() -> int:
+    global _chroma_count
+    size = get_corpus_snapshot().loaded_size()
+    if size is not None:
+        return size
+    with _chroma_count_lock:
+        fetched_at, count = _chroma_count
+        if count is None or time.monotonic() - fetched_at > _CHROMA_COUNT_INTERVAL_SECONDS:
+            count = get_or_create_collection().count()
+            _chroma_count = (time.monotonic(), count)
+        return count
+
+
+def _refresh_gauges():
+    """Copies the current state of the in-process components into their gauges."""
+    PROCESS_RESIDENT_MEMORY.set(resident_memory_bytes())
+
+    generation = get_generation_scheduler().stats()
+    QUEUE_DEPTH.set(get_embedding_batcher().stats()["queue_depth"], queue="embedding_batch")
+    QUEUE_DEPTH.set(get_rerank_batcher().stats()["queue_depth"], queue="rerank_batch")
+    QUEUE_DEPTH.set(generation["waiting"], queue="generation")
+    QUEUE_DEPTH.set(get_ingestion_pool().queued_files, queue="ingestion")
+    QUEUE_DEPTH.set(get_background_writer().stats()["queued"], queue="db_writer")
+    for state in ("in_flight", "waiting", "active"):
+        GENERATION_SLOTS.set(generation[state], state=state)
+
+    caches = {"query": get_query_cache(), "rerank": get_rerank_cache(), "answer": get_answer_cache()}
+    for name, cache in caches.items():
+        stats = cache.stats()
+        CACHE_HIT_RATIO.set(stats["hit_rate"], cache=name)
+        CACHE_ENTRIES.set(stats["size"], cache=name)
+
+    CHROMA_CHUNKS.set(_chroma_chunk_count())
+
+
+def render_metrics() -> str:
+    """Returns all metrics in the Prometheus text exposition format."""
+    _refresh_gauges()
+    return REGISTRY.render()
@@ -1,52 +1,187 @@
-import time
+import re
 import json
-from typing import Dict, Any, List, AsyncGenerator
-from fastapi import Depends
+import threading
+from typing import Dict, Any, Iterable, List, AsyncGenerator, Optional
+from fastapi import Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
-import traceback # Add this import for detailed error logging
+from datetime import datetime
 
 from ..db.sqlite_db import get_session
-from ..models.database import Conversation, Document
+from ..db.writer import get_background_writer
+from ..core.settings import settings
+from ..models.database import Conversation, Document, QueryTrace
 from ..models.api import ChatQueryIn
-from ..rag.retrieve import retrieve_hybrid
+from ..core.concurrency import run_in_executor, iterate_in_thread, get_generation_executor
+from ..core.timing import StageTimings
+from ..core.metrics import QUERY_STAGE_DURATION, QUERIES, PROMPT_TOKENS, COMPLETION_TOKENS
+from ..rag.retrieve import retrieve_hybrid_async, embed_text
 from ..rag.answer import generate_simple_answer
+from ..rag.answer_cache import get_answer_cache, CachedAnswer
+from ..rag.corpus import get_corpus_snapshot
+from .analytics_service import record_conversation
+from .chat_history_service import record_session_turn
+from ..rag.scheduler import get_generation_scheduler, clamp_max_new_tokens, Admission, SchedulerBusy
+
+# Splits a cached answer into word-sized SSE token events.
+_REPLAY_TOKEN_RE = re.compile(r"\s*\S+\s*|\s+")
+
+
+def _observe_query(source: str, trace: Dict[str, Any]):
+    """Feeds one answered query's trace into the Prometheus metrics."""
+    QUERIES.inc(source=source)
+    for column, ms in trace.items():
+        if column.endswith("_ms") and ms is not None:
+            QUERY_STAGE_DURATION.observe(ms / 1000.0, stage=column[:-3])
+    PROMPT_TOKENS.inc(trace.get("prompt_tokens") or 0)
+    COMPLETION_TOKENS.inc(trace.get("completion_tokens") or 0)
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Releases the request's Admission when the response ends, however it ends.
+    The generator's own `with admission:` never runs if the body doesn't start
+    (client gone before the first send, error while starting the response).
+    """
+
+    def __init__(self, content, admission: Admission, **kwargs):
+        super().__init__(content, **kwargs)
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.admission.release()
+
 
 class RAGService:
     def __init__(self, session: Session = Depends(get_session)):
         self.session = session
 
-    async def query_stream(self, payload: ChatQueryIn) -> AsyncGenerator[str, None]:
-        start_time = time.time()
+    def admit(self) -> Admission:
+        """Reserves a place in the generation queue, or fails fast with a 429."""
+        try:
+            return get_generation_scheduler().admit()
+        except SchedulerBusy as e:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)},
+            )
 
-        hits = retrieve_hybrid(payload.query, top_k=payload.top_k)
-        
-        doc_id_cache = {}
-        sources = []
-        for h in hits:
-            filename = h.get("metadata", {}).get("filename")
-            if not filename: continue
-            if filename not in doc_id_cache:
-                doc = self.session.exec(select(Document).where(Document.filename == filename)).first()
-                doc_id_cache[filename] = doc.id if doc else None
-            doc_id = doc_id_cache[filename]
-            if doc_id:
-                sources.append({
-                    "doc_id": doc_id, "chunk_id": h["id"], "filename": filename, 
-                    "page": h.get("metadata", {}).get("page"), "score": round(float(h["rerank_score"]), 4)
-                })
-        
-        yield f"data: {json.dumps({'sources': sources})}\n\n"
+    async def stream_answer(self, payload: ChatQueryIn) -> StreamingResponse:
+        """
+        Replays a cached answer when a similar query was answered against the
+        current corpus. Otherwise admits the request (429 if the generation
+        queue is full) and streams a freshly generated answer.
+        """
+        timings = StageTimings()
+        query_embedding = None
+        if settings.ANSWER_CACHE_ENABLED:
+            with timings.stage("cache_lookup"):
+                query_embedding = await run_in_executor(embed_text, payload.query)
+                cached = None
+                if payload.bypass_cache:
+                    get_answer_cache().record_bypass()
+                else:
+                    cached = get_answer_cache().get(query_embedding, self._cache_options(payload))
+            if cached is not None:
+                return StreamingResponse(self.replay_stream(payload, cached, timings), media_type="text/event-stream")
 
-        full_answer_parts = []
-        token_generator = generate_simple_answer(payload.query, hits)
-        
-        for token in token_generator:
-            full_answer_parts.append(token)
+        admission = self.admit()
+        return AdmittedStreamingResponse(
+            self.query_stream(payload, admission, query_embedding, timings), admission, media_type="text/event-stream"
+        )
+
+    async def replay_stream(self, payload: ChatQueryIn, cached: CachedAnswer, timings: Optional[StageTimings] = None) -> AsyncGenerator[str, None]:
+        """Streams a cached answer through the same SSE events as a generated one."""
+        timings = timings or StageTimings()
+        yield f"data: {json.dumps({'sources': cached.sources, 'cached': True})}\n\n"
+        ttft_ms = timings.elapsed_ms()
+        for token in _REPLAY_TOKEN_RE.findall(cached.answer):
             yield f"data: {json.dumps({'token': token})}\n\n"
+        trace = {"cached": True, "total_ms": timings.elapsed_ms(), "ttft_ms": ttft_ms, **self._stage_columns(timings)}
+        _observe_query("cache", trace)
+        self._save_conversation(payload, cached.answer, cached.confidence, cached.sources, trace["total_ms"] / 1000.0, trace)
+
+    async def query_stream(
+        self,
+        payload: ChatQueryIn,
+        admission: Optional[Admission] = None,
+        query_embedding: Optional[List[float]] = None,
+        timings: Optional[StageTimings] = None,
+    ) -> AsyncGenerator[str, None]:
+        timings = timings or StageTimings()
+        admission = admission or self.admit()
+        # Answers are cached against the corpus they were retrieved from.
+        corpus_version = get_corpus_snapshot().version
+
+        # If the client disconnects, this generator is cancelled at its current
+        # await; `cancel` then stops the HyDE generation or the token loop (and
+        # their waits for a model slot), and nothing is saved.
+        cancel = threading.Event()
+        full_answer_parts = []
+        generation_stats: Dict[str, Any] = {}
+        first_token_ms = None
+        with admission:
+            try:
+                # Every blocking stage runs on the RAG executor so the event loop stays free.
+                retrieved = False
+                try:
+                    hits = await retrieve_hybrid_async(
+                        payload.query, top_k=payload.top_k, deterministic_hyde=payload.deterministic_hyde,
+                        timings=timings, cancel=cancel,
+                    )
+                    retrieved = True
+                finally:
+                    if not retrieved:
+                        cancel.set()
+                with timings.stage("sources"):
+                    legacy_filenames = {
+                        h["metadata"].get("filename") for h in hits if h.get("metadata", {}).get("doc_id") is None
+                    } - {None}
+                    legacy_doc_ids = (
+                        await run_in_executor(self._doc_ids_by_filename, legacy_filenames) if legacy_filenames else {}
+                    )
+                    sources = self._resolve_sources(hits, legacy_doc_ids)
+
+                yield f"data: {json.dumps({'sources': sources})}\n\n"
+
+                token_generator = iterate_in_thread(
+                    lambda: generate_simple_answer(
+                        payload.query, hits, max_new_tokens=payload.max_new_tokens, cancel=cancel,
+                        stats=generation_stats, timings=timings,
+                    ),
+                    stop=cancel,
+                    executor=get_generation_executor(),
+                )
+                async for token in token_generator:
+                    if first_token_ms is None:
+                        first_token_ms = timings.elapsed_ms()
+                    full_answer_parts.append(token)
+                    yield f"data: {json.dumps({'token': token})}\n\n"
+            except SchedulerBusy as e:
+                yield f"data: {json.dumps({'error': str(e), 'retry_after': e.retry_after})}\n\n"
+                return
 
         full_answer = "".join(full_answer_parts)
-        end_time = time.time()
-        response_time = end_time - start_time
+        total_ms = timings.elapsed_ms()
+        response_time = total_ms / 1000.0
+
+        stages = timings.as_dict()
+        completion_tokens = generation_stats.get("completion_tokens", 0)
+        decode_seconds = stages.get("decode", 0.0) / 1000.0
+        metrics = {
+            "ttft": round((first_token_ms if first_token_ms is not None else total_ms) / 1000.0, 3),
+            "total_time": round(response_time, 3),
+            **generation_stats,
+            "tokens_per_sec": round(completion_tokens / decode_seconds, 2) if decode_seconds > 0 else None,
+            "stages_ms": stages,
+        }
+        metrics["tokens_processed"] = metrics.get("prompt_tokens", 0) + completion_tokens
+        print(f"--- [INFO] Query metrics: {json.dumps(metrics)} ---")
+        yield f"data: {json.dumps({'metrics': metrics})}\n\n"
         
         if "could not find an answer" in full_answer.lower():
             confidence = "Medium"
@@ -55,34 +190,98 @@ class RAGService:
         else:
             confidence = "High"
 
+        if settings.ANSWER_CACHE_ENABLED and hits:
+            if query_embedding is None:
+                query_embedding = await run_in_executor(embed_text, payload.query)
+            get_answer_cache().put(query_embedding, CachedAnswer(
+                query=payload.query,
+                answer=full_answer,
+                sources=sources,
+                confidence=confidence,
+                chunk_ids=[h["id"] for h in hits],
+                corpus_version=corpus_version,
+                options=self._cache_options(payload),
+            ))
+
         # This is now the final step, happening after the stream is complete.
-        self._save_conversation(payload, full_answer, confidence, sources, response_time)
+        trace = {
+            "total_ms": total_ms,
+            "ttft_ms": first_token_ms,
+            "prompt_tokens": generation_stats.get("prompt_tokens"),
+            "completion_tokens": generation_stats.get("completion_tokens"),
+            "tokens_per_sec": metrics["tokens_per_sec"],
+            **self._stage_columns(timings),
+        }
+        _observe_query("generated", trace)
+        self._save_conversation(payload, full_answer, confidence, sources, response_time, trace)
 
-    # --- THIS IS THE DEFINITIVE FIX ---
-    def _save_conversation(self, payload: ChatQueryIn, answer: str, confidence: str, sources: list, response_time: float):
-        """Saves a record of the conversation with robust error handling."""
-        print("\n--- [DEBUG CHECKPOINT] Attempting to save conversation to database... ---")
-        try:
+    @staticmethod
+    def _stage_columns(timings: StageTimings) -> Dict[str, float]:
+        """Maps recorded stages onto the `<stage>_ms` columns of QueryTrace."""
+        return {
+            f"{stage}_ms": ms for stage, ms in timings.as_dict().items()
+            if f"{stage}_ms" in QueryTrace.model_fields
+        }
+
+    @staticmethod
+    def _cache_options(payload: ChatQueryIn) -> tuple:
+        """Request options that change the answer; cached answers only match identical ones."""
+        return (payload.top_k, clamp_max_new_tokens(payload.max_new_tokens))
+
+    def _doc_ids_by_filename(self, filenames: Iterable[str]) -> Dict[str, int]:
+        """One query mapping filenames to Document ids, for chunks indexed before doc_id was stored."""
+        rows = self.session.exec(
+            select(Document.filename, Document.id).where(Document.filename.in_(list(filenames))).order_by(Document.id)
+        ).all()
+        doc_ids = {}
+        for filename, doc_id in rows:
+            doc_ids.setdefault(filename, doc_id)
+        return doc_ids
+
+    @staticmethod
+    def _resolve_sources(hits: List[Dict[str, Any]], legacy_doc_ids: Dict[str, int]) -> List[Dict[str, Any]]:
+        """
+        Maps retrieved chunks to source citations that point at their Document,
+        using the doc_id stored in each chunk's metadata. `legacy_doc_ids` covers
+        chunks that don't carry one yet (see `_doc_ids_by_filename`).
+        """
+        sources = []
+        for h in hits:
+            metadata = h.get("metadata", {})
+            filename = metadata.get("filename")
+            if not filename: continue
+            doc_id = metadata.get("doc_id") or legacy_doc_ids.get(filename)
+            if doc_id:
+                sources.append({
+                    "doc_id": doc_id, "chunk_id": h["id"], "filename": filename,
+                    "page": metadata.get("page"), "score": round(float(h["rerank_score"]), 4)
+                })
+        return sources
+
+    @staticmethod
+    def _save_conversation(payload: ChatQueryIn, answer: str, confidence: str, sources: list, response_time: float,
+                           trace: Optional[Dict[str, Any]] = None):
+        """
+        Queues a record of the conversation (and its QueryTrace) for the
+        background DB writer, so saving never delays the end of the stream.
+        """
+        created_at = datetime.utcnow()
+
+        def write(session: Session):
             conversation = Conversation(
                 session_id=payload.session_id,
                 query=payload.query,
                 answer=answer,
                 confidence=confidence,
                 sources=sources,
-                response_time=response_time
+                response_time=response_time,
+                created_at=created_at,
             )
-            
-            print(f"--- [DEBUG] Conversation object created for session: {payload.session_id} ---")
-            
-            self.session.add(conversation)
-            self.session.commit()
-            
-            print("--- [SUCCESS] Conversation saved successfully! ---")
-
-        except Exception as e:
-            # This will catch ANY error during the save process and print it.
-            print("\n---!!! [CRITICAL ERROR] FAILED TO SAVE CONVERSATION !!!---")
-            traceback.print_exc()
-            print("---!!! [END OF ERROR TRACEBACK] !!!---\n")
-            # We roll back the session to prevent a corrupted state.
-            self.session.rollback()
\ No newline at end of file
+            session.add(conversation)
+            record_conversation(session, conversation)
+            record_session_turn(session, conversation)
+            if trace is not None:
+                session.flush()
+                session.add(QueryTrace(conversation_id=conversation.id, created_at=created_at, **trace))
+
+        get_background_writer().submit(write)
@@ -0,0 +1,203 @@
+"""
+Offline benchmark suite for the RAG pipeline.
+
+Runs against deterministic stub models (MODEL_BACKEND=stub) and a synthetic
+corpus in a scratch data directory, so no model downloads are needed and runs
+on different commits are comparable. From the `backend` directory:
+
+    python -m benchmarks run --chunks 10000 --output results.json
+    python -m benchmarks run --chunks 1000 100000 --suites index,retrieval --output big.json
+    python -m benchmarks compare before.json after.json
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_VERSION = 1
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=BACKEND_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _configure_environment(workdir: str):
+    """Points every store at `workdir` and selects the stub models. Must run before `app` is imported."""
+    os.environ.update(
+        MODEL_BACKEND="stub",
+        SQLITE_PATH=os.path.join(workdir, "sqlite", "main.db"),
+        CHROMA_PERSIST_DIR=os.path.join(workdir, "chroma"),
+        EMBEDDING_CACHE_DIR=os.path.join(workdir, "embeddings"),
+        UPLOAD_DIR=os.path.join(workdir, "uploads"),
+    )
+
+
+def _run_size(options) -> Dict[str, Any]:
+    """Runs the selected suites for a single corpus size in this process."""
+    workdir = tempfile.mkdtemp(prefix="rag-bench-", dir=options.workdir)
+    _configure_environment(workdir)
+    # Imported late: app settings are read from the environment at import time.
+    from .suites import SUITES, NEEDS_INDEX, setup
+    from .synthetic import SyntheticCorpus
+    from app.core.settings import settings
+
+    selected = [name for name in SUITES if name in options.suites]
+    if NEEDS_INDEX & set(selected) and "index" not in selected:
+        selected.insert(selected.index(next(n for n in selected if n in NEEDS_INDEX)), "index")
+
+    corpus = SyntheticCorpus(seed=options.seed)
+    results = {}
+    try:
+        setup()
+        for name in selected:
+            print(f"--- [BENCH] {name} ({options.chunks} chunks) ---", file=sys.stderr)
+            results[name] = SUITES[name](corpus, options)
+    finally:
+        if not options.keep_data:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "chunks": options.chunks,
+        "settings": {
+            key: getattr(settings, key) for key in (
+                "DEFAULT_CHUNK_SIZE", "DEFAULT_CHUNK_OVERLAP", "CHUNK_SIZE_UNIT", "EMBED_BATCH_SIZE",
+                "RERANK_TOP_N", "MICROBATCH_ENABLED", "MICROBATCH_MAX_WAIT_MS", "EMBEDDING_CACHE_ENABLED",
+                "STUB_EMBEDDING_DIM",
+            )
+        },
+        "benchmarks": results,
+    }
+
+
+def run(options) -> int:
+    sizes: List[int] = options.chunks
+    if len(sizes) == 1:
+        options.chunks = sizes[0]
+        runs = [_run_size(options)]
+    else:
+        # Each size runs in a fresh process: settings, caches and stores are process-wide.
+        runs = []
+        for size in sizes:
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+                partial = f.name
+            command = [sys.executable, "-m", "benchmarks", *_argv_for_size(sys.argv[1:], size), "--output", partial]
+            subprocess.run(command, cwd=BACKEND_ROOT, check=True)
+            with open(partial) as f:
+                runs.extend(json.load(f)["runs"])
+            os.remove(partial)
+
+    report = {
+        "schema": SCHEMA_VERSION,
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git("rev-parse", "HEAD"),
+            "git_dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "options": {k: v for k, v in vars(options).items() if k not in ("func", "output", "chunks")},
+        },
+        "runs": runs,
+    }
+    with open(options.output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"--- [BENCH] Results written to {options.output} ---", file=sys.stderr)
+    return 0
+
+
+def _argv_for_size(argv: List[str], size: int) -> List[str]:
+    """Rewrites `--chunks A B C` (and drops `--output X`) for a single-size child run."""
+    result, skip = [], False
+    for arg in argv:
+        if skip:
+            if arg.startswith("-"):
+                skip = False
+            else:
+                continue
+        if arg in ("--chunks", "--output"):
+            skip = True
+            continue
+        result.append(arg)
+    return [*result, "--chunks", str(size)]
+
+
+def _flatten(value: Any, prefix: str = "") -> Dict[str, float]:
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: float(value)}
+    return {}
+
+
+def compare(options) -> int:
+    """Prints every numeric result that changed by more than --threshold percent."""
+    with open(options.before) as f:
+        before = json.load(f)
+    with open(options.after) as f:
+        after = json.load(f)
+    old = {k: v for run in before["runs"] for k, v in _flatten(run["benchmarks"], f"{run['chunks']}").items()}
+    new = {k: v for run in after["runs"] for k, v in _flatten(run["benchmarks"], f"{run['chunks']}").items()}
+
+    print(f"before: {before['meta']['git_commit'][:12]}  after: {after['meta']['git_commit'][:12]}")
+    print(f"{'metric':<70} {'before':>14} {'after':>14} {'change':>9}")
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        change = (b - a) / abs(a) * 100.0 if a else (0.0 if a == b else float("inf"))
+        if abs(change) >= options.threshold:
+            print(f"{key:<70} {a:>14.3f} {b:>14.3f} {change:>8.1f}%")
+    for key in sorted(old.keys() ^ new.keys()):
+        print(f"{key:<70} {'only in ' + ('before' if key in old else 'after'):>39}")
+    return 0
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmark suites and write JSON results.")
+    run_parser.add_argument("--chunks", type=int, nargs="+", default=[10000],
+                            help="Synthetic corpus size(s) in chunks; several sizes run in separate processes.")
+    run_parser.add_argument("--suites", type=lambda s: s.split(","),
+                            default="chunking,index,retrieval,retrieval_concurrent,answer,ingestion,analytics",
+                            help="Comma-separated suites to run.")
+    run_parser.add_argument("--output", default="benchmark-results.json")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--queries", type=int, default=200, help="Queries per retrieval suite.")
+    run_parser.add_argument("--answer-queries", type=int, default=50)
+    run_parser.add_argument("--top-k", type=int, default=5)
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--index-batch-size", type=int, default=1000)
+    run_parser.add_argument("--ingest-files", type=int, default=10)
+    run_parser.add_argument("--ingest-file-kb", type=int, default=256)
+    run_parser.add_argument("--chunking-doc-kb", type=int, nargs="+", default=[64, 1024])
+    run_parser.add_argument("--conversations", type=int, default=20000)
+    run_parser.add_argument("--repeats", type=int, default=20, help="Repetitions for chunking and analytics timings.")
+    run_parser.add_argument("--workdir", default=None, help="Parent directory for scratch data (default: system temp).")
+    run_parser.add_argument("--keep-data", action="store_true", help="Don't delete the scratch data directory.")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Diff two result files.")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=5.0, help="Only show changes of at least this many percent.")
+    compare_parser.set_defaults(func=compare)
+
+    options = parser.parse_args(argv)
+    return options.func(options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import time
+import threading
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from app.core.metrics import resident_memory_bytes
+
+# --- Measurement Helpers ---
+
+
+class Measurement:
+    """
+    Times a block and samples the process's resident memory on a background
+    thread while it runs, so `memory` reports the peak RSS reached inside the
+    block (to within the sampling interval) rather than the process lifetime peak.
+    """
+
+    def __init__(self, sample_interval: float = 0.005):
+        self.sample_interval = sample_interval
+        self.seconds = 0.0
+        self._stop = threading.Event()
+        self._rss_start = self._rss_peak = self._rss_end = 0
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            self._rss_peak = max(self._rss_peak, resident_memory_bytes())
+
+    def __enter__(self) -> "Measurement":
+        self._rss_start = self._rss_peak = resident_memory_bytes()
+        self._sampler = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._sampler.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._started
+        self._stop.set()
+        self._sampler.join()
+        self._rss_end = resident_memory_bytes()
+        self._rss_peak = max(self._rss_peak, self._rss_end)
+
+    @property
+    def memory(self) -> Dict[str, int]:
+        return {
+            "rss_start_bytes": self._rss_start,
+            "rss_peak_bytes": self._rss_peak,
+            "rss_end_bytes": self._rss_end,
+            "rss_peak_growth_bytes": self._rss_peak - self._rss_start,
+        }
+
+
+def summarize_ms(values: Sequence[float]) -> Dict[str, float]:
+    """Latency distribution (milliseconds) of repeated measurements."""
+    if not len(values):
+        return {"count": 0}
+    array = np.asarray(values, dtype=float)
+    p50, p90, p95, p99 = np.percentile(array, [50, 90, 95, 99])
+    return {
+        "count": int(len(array)),
+        "mean": round(float(array.mean()), 3),
+        "p50": round(float(p50), 3),
+        "p90": round(float(p90), 3),
+        "p95": round(float(p95), 3),
+        "p99": round(float(p99), 3),
+        "max": round(float(array.max()), 3),
+    }
+
+
+def summarize_stages(samples: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Per-stage latency distributions from a list of StageTimings.as_dict() results."""
+    stages: Dict[str, List[float]] = {}
+    for sample in samples:
+        for stage, ms in sample.items():
+            stages.setdefault(stage, []).append(ms)
+    return {stage: summarize_ms(values) for stage, values in sorted(stages.items())}
+
+
+def per_second(count: float, seconds: float) -> float:
+    return round(count / seconds, 3) if seconds > 0 else 0.0
@@ -0,0 +1,299 @@
+import os
+import json
+import random
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+from sqlmodel import Session, select, delete, func
+
+from app.core.settings import settings
+from app.core.timing import StageTimings
+from app.db.sqlite_db import engine, init_db
+from app.db.keyword_index import init_keyword_index
+from app.models.api import ChatQueryIn
+from app.models.database import AnalyticsRollup, Conversation, Document, QueryTrace
+from app.rag.models import get_embedding_model
+from app.rag.retrieve import (
+    embed_texts_cached, iter_chunk_spans, recursive_character_text_splitter,
+    retrieve_hybrid, retrieve_hybrid_async,
+)
+from app.services.analytics_service import AnalyticsService, backfill_analytics_rollups, TRACE_METRICS
+from app.services.document_service import DocumentService, _batched
+from app.services.rag_service import RAGService
+
+from .harness import Measurement, per_second, summarize_ms, summarize_stages
+from .synthetic import SyntheticCorpus
+
+# --- Benchmark Suites ---
+# Each suite takes the synthetic corpus and the parsed CLI options and returns a
+# JSON-serializable dict. Suites run in SUITES order against one scratch data
+# directory: `index` builds the chunk corpus the retrieval suites query.
+
+
+def setup():
+    init_db()
+    init_keyword_index()
+
+
+def bench_chunking(corpus: SyntheticCorpus, options) -> Dict[str, Any]:
+    """Splitter throughput over single documents of increasing size, in char and token mode."""
+    tokenizer = get_embedding_model().tokenizer
+    results = {}
+    for size_kb in options.chunking_doc_kb:
+        text = corpus.document_text(size_kb, size_kb * 1024)
+        modes = {
+            "chars": lambda: recursive_character_text_splitter(text, settings.DEFAULT_CHUNK_SIZE, settings.DEFAULT_CHUNK_OVERLAP),
+            "tokens": lambda: [text[s:e] for s, e in iter_chunk_spans(text, 64, 16, tokenizer)],
+        }
+        for mode, split in modes.items():
+            latencies, chunks = [], []
+            with Measurement() as measured:
+                for _ in range(options.repeats):
+                    started = time.perf_counter()
+                    chunks = split()
+                    latencies.append((time.perf_counter() - started) * 1000.0)
+            results[f"{size_kb}kb_{mode}"] = {
+                "chars": len(text),
+                "chunks": len(chunks),
+                "latency_ms": summarize_ms(latencies),
+                "mb_per_sec": per_second(len(text) * options.repeats / 1e6, measured.seconds),
+                "memory": measured.memory,
+            }
+    return results
+
+
+def bench_index(corpus: SyntheticCorpus, options) -> Dict[str, Any]:
+    """Embeds `--chunks` synthetic chunks and writes them to Chroma, FTS5 and the corpus snapshot."""
+    service = DocumentService(Session(engine))
+    n_documents = -(-options.chunks // corpus.chunks_per_document)
+    batch_latencies = []
+    with Measurement() as measured:
+        for batch in _batched(range(options.chunks), options.index_batch_size):
+            started = time.perf_counter()
+            chunks = [{"id": corpus.chunk_id(i), "text": corpus.chunk_text(i), "metadata": corpus.chunk_metadata(i)}
+                      for i in batch]
+            embeddings = embed_texts_cached([c["text"] for c in chunks])
+            for chunk, embedding in zip(chunks, embeddings):
+                chunk["embedding"] = embedding
+            service.index_chunks(chunks)
+            batch_latencies.append((time.perf_counter() - started) * 1000.0)
+        with Session(engine) as session:
+            for document in range(n_documents):
+                filename = corpus.document_filename(document)
+                session.add(Document(
+                    filename=filename, filepath=f"synthetic/{filename}",
+                    content_hash=hashlib.sha256(filename.encode()).hexdigest(),
+                    chunk_count=min(corpus.chunks_per_document, options.chunks - document * corpus.chunks_per_document),
+                ))
+            session.commit()
+    service.session.close()
+    return {
+        "chunks": options.chunks,
+        "documents": n_documents,
+        "seconds": round(measured.seconds, 3),
+        "chunks_per_sec": per_second(options.chunks, measured.seconds),
+        "batch_size": options.index_batch_size,
+        "batch_latency_ms": summarize_ms(batch_latencies),
+        "memory": measured.memory,
+    }
+
+
+def _recall(hits: List[Dict[str, Any]], target_id: str) -> int:
+    return int(any(h["id"] == target_id for h in hits))
+
+
+def bench_retrieval(corpus: SyntheticCorpus, options) -> Dict[str, Any]:
+    """Sequential `retrieve_hybrid` latency per stage, plus recall of the chunk each query was drawn from."""
+    queries = corpus.queries(options.queries, options.chunks)
+    stage_samples, totals, found = [], [], 0
+    with Measurement() as measured:
+        for query, target in queries:
+            timings = StageTimings()
+            started = time.perf_counter()
+            hits = timings.bind(retrieve_hybrid)(query, top_k=options.top_k)
+            totals.append((time.perf_counter() - started) * 1000.0)
+            stage_samples.append(timings.as_dict())
+            found += _recall(hits, corpus.chunk_id(target))
+    return {
+        "queries": len(queries),
+        "top_k": options.top_k,
+        "recall_at_k": round(found / len(queries), 4) if queries else 0.0,
+        "qps": per_second(len(queries), measured.seconds),
+        "latency_ms": summarize_ms(totals),
+        "stages_ms": summarize_stages(stage_samples),
+        "memory": measured.memory,
+    }
+
+
+def bench_retrieval_concurrent(corpus: SyntheticCorpus, options) -> Dict[str, Any]:
+    """`retrieve_hybrid_async` throughput with `--concurrency` queries in flight (exercises micro-batching)."""
+    # A disjoint query set, so the HyDE and rerank caches warmed above don't help.
+    queries = corpus.queries(options.queries, options.chunks, offset=options.queries)
+    stage_samples, totals = [], []
+
+    async def run():
+        semaphore = asyncio.Semaphore(options.concurrency)
+
+        async def one(query: str):
+            async with semaphore:
+                timings = StageTimings()
+                await retrieve_hybrid_async(query, top_k=options.top_k, timings=timings)
+                totals.append(timings.elapsed_ms())
+                stage_samples.append(timings.as_dict())
+
+        await asyncio.gather(*(one(query) for query, _ in queries))
+
+    with Measurement() as measured:
+        asyncio.run(run())
+    return {
+        "queries": len(queries),
+        "concurrency": options.concurrency,
+        "qps": per_second(len(queries), measured.seconds),
+        "latency_ms": summarize_ms(totals),
+        "stages_ms": summarize_stages(stage_samples),
+        "memory": measured.memory,
+    }
+
+
+def bench_answer(corpus: SyntheticCorpus, options) -> Dict[str, Any]:
+    """End-to-end streamed answers through RAGService (retrieval, packing, stub generation, save)."""
+    queries = corpus.queries(options.answer_queries, options.chunks, offset=2 * options.queries)
+    stage_samples, totals, ttfts = [], [], []
+
+    async def answer(session: Session, query: str):
+        payload = ChatQueryIn(session_id="benchmark", query=query, bypass_cache=True)
+        timings = StageTimings()
+        first_token_ms = None
+        async for event in RAGService(session).query_stream(payload, timings=timings):
+            data = json.loads(event[len("data: "):])
+            if "token" in data and first_token_ms is None:
+                first_token_ms = timings.elapsed_ms()
+        totals.append(timings.elapsed_ms())
+        ttfts.append(first_token_ms if first_token_ms is not None else timings.elapsed_ms())
+        stage_samples.append(timings.as_dict())
+
+    async def run():
+        with Session(engine) as session:
+            for query, _ in queries:
+                await answer(session, query)
+
+    with Measurement() as measured:
+        asyncio.run(run())
+    return {
+        "queries": len(queries),
+        "qps": per_second(len(queries), measured.seconds),
+        "latency_ms": summarize_ms(totals),
+        "ttft_ms": summarize_ms(ttfts),
+        "stages_ms": summarize_stages(stage_samples),
+        "memory": measured.memory,
+    }
+
+
+def bench_ingestion(corpus: SyntheticCorpus, options) -> Dict[str, Any]:
+    """`DocumentService.ingest_file` (parse -> chunk -> embed -> index) on generated text files."""
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    files = []
+    for i in range(options.ingest_files):
+        text = corpus.document_text(1_000_000 + i, options.ingest_file_kb * 1024)
+        filename = f"ingest-{i:04d}.txt"
+        filepath = os.path.join(settings.UPLOAD_DIR, filename)
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(text)
+        files.append((filename, filepath, hashlib.sha256(text.encode("utf-8")).hexdigest(), len(text)))
+
+    latencies, chunks = [], 0
+    with Measurement() as measured:
+        for filename, filepath, content_hash, _ in files:
+            started = time.perf_counter()
+            with Session(engine) as session:
+                chunks += DocumentService(session).ingest_file(filepath, filename, content_hash).chunk_count
+            latencies.append((time.perf_counter() - started) * 1000.0)
+    total_chars = sum(size for *_, size in files)
+    return {
+        "files": len(files),
+        "chunks": chunks,
+        "seconds": round(measured.seconds, 3),
+        "files_per_sec": per_second(len(files), measured.seconds),
+        "chunks_per_sec": per_second(chunks, measured.seconds),
+        "mb_per_sec": per_second(total_chars / 1e6, measured.seconds),
+        "file_latency_ms": summarize_ms(latencies),
+        "memory": measured.memory,
+    }
+
+
+def _insert_conversations(count: int, seed: int):
+    """Bulk-inserts `count` conversations (and traces) spread over the last 30 days."""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        first_id = (session.exec(select(func.max(Conversation.id))).one() or 0) + 1
+    for batch in _batched(range(first_id, first_id + count), 5000):
+        conversations, traces = [], []
+        for conversation_id in batch:
+            created_at = now - timedelta(seconds=rng.uniform(0, 30 * 24 * 3600))
+            total_ms = rng.lognormvariate(7.0, 0.8)
+            sources = [{"doc_id": 1, "chunk_id": f"c{n}", "filename": "f.txt", "page": None, "score": 0.5}
+                       for n in range(rng.randint(0, 5))]
+            conversations.append({
+                "id": conversation_id, "session_id": f"s{conversation_id % 500}", "query": "q", "answer": "a",
+                "confidence": "High", "response_time": total_ms / 1000.0, "created_at": created_at, "sources": sources,
+            })
+            trace = {metric: rng.uniform(1, total_ms) for metric in TRACE_METRICS if metric.endswith("_ms")}
+            traces.append({**trace, "conversation_id": conversation_id, "created_at": created_at, "cached": False,
+                           "total_ms": total_ms, "tokens_per_sec": rng.uniform(5, 40)})
+        with engine.begin() as conn:
+            conn.execute(Conversation.__table__.insert(), conversations)
+            conn.execute(QueryTrace.__table__.insert(), traces)
+
+
+def bench_analytics(corpus: SyntheticCorpus, options) -> Dict[str, Any]:
+    """Rollup backfill and the analytics endpoints over `--conversations` synthetic conversations."""
+    _insert_conversations(options.conversations, corpus.seed)
+    # Rollups written by earlier suites would make the backfill a no-op.
+    with Session(engine) as session:
+        session.exec(delete(AnalyticsRollup))
+        session.commit()
+    with Measurement() as backfill:
+        backfill_analytics_rollups()
+
+    day_ago = datetime.utcnow() - timedelta(days=1)
+    endpoints: Dict[str, Callable[[AnalyticsService], Any]] = {
+        "overview": lambda s: s.get_overview(),
+        "overview_24h": lambda s: s.get_overview(start=day_ago),
+        "latency_histogram": lambda s: s.get_latency_histogram(),
+        "precision_at_k": lambda s: s.get_precision_at_k(),
+        "stage_latency_24h": lambda s: s.get_stage_latency(),
+    }
+    results = {}
+    with Session(engine) as session:
+        service = AnalyticsService(session)
+        for name, call in endpoints.items():
+            latencies = []
+            with Measurement() as measured:
+                for _ in range(options.repeats):
+                    started = time.perf_counter()
+                    call(service)
+                    latencies.append((time.perf_counter() - started) * 1000.0)
+            results[name] = {"latency_ms": summarize_ms(latencies), "memory": measured.memory}
+    return {
+        "conversations": options.conversations,
+        "backfill_seconds": round(backfill.seconds, 3),
+        "backfill_memory": backfill.memory,
+        "endpoints": results,
+    }
+
+
+# Run order matters: retrieval needs the index, ingestion runs against it.
+SUITES: Dict[str, Callable[[SyntheticCorpus, Any], Dict[str, Any]]] = {
+    "chunking": bench_chunking,
+    "index": bench_index,
+    "retrieval": bench_retrieval,
+    "retrieval_concurrent": bench_retrieval_concurrent,
+    "answer": bench_answer,
+    "ingestion": bench_ingestion,
+    "analytics": bench_analytics,
+}
+NEEDS_INDEX = {"retrieval", "retrieval_concurrent", "answer"}
@@ -0,0 +1,78 @@
+import re
+import random
+import itertools
+from typing import Dict, List, Tuple
+
+# --- Synthetic Corpus ---
+# Generates a reproducible corpus of pseudo-English text. Word frequencies
+# follow a Zipf distribution, so BM25 sees a realistic mix of common and rare
+# terms. Every chunk is a pure function of (seed, index): an index of any size
+# can be built and queried without holding the corpus in memory.
+
+_WORD_RE = re.compile(r"\w+")
+_ONSETS = ["b", "c", "d", "f", "g", "h", "j", "k", "l", "m", "n", "p", "r", "s", "t", "v", "w", "z",
+           "br", "ch", "cl", "dr", "fl", "gr", "pl", "pr", "sh", "st", "th", "tr"]
+_VOWELS = ["a", "e", "i", "o", "u", "ai", "ea", "io", "ou"]
+
+
+class SyntheticCorpus:
+    def __init__(self, seed: int = 0, vocabulary_size: int = 20000, chunk_words: Tuple[int, int] = (30, 50),
+                 chunks_per_document: int = 50):
+        self.seed = seed
+        self.chunk_words = chunk_words
+        self.chunks_per_document = chunks_per_document
+        rng = random.Random(seed)
+        words = set()
+        while len(words) < vocabulary_size:
+            words.add("".join(rng.choice(_ONSETS) + rng.choice(_VOWELS) for _ in range(rng.randint(1, 4))))
+        self.vocabulary = sorted(words)
+        rng.shuffle(self.vocabulary)
+        self._cumulative = list(itertools.accumulate(1.0 / (rank + 1) ** 1.07 for rank in range(vocabulary_size)))
+
+    def _rng(self, *key: int) -> random.Random:
+        return random.Random(hash((self.seed, *key)))
+
+    def _sentences(self, rng: random.Random, n_words: int) -> str:
+        words = rng.choices(self.vocabulary, cum_weights=self._cumulative, k=n_words)
+        sentences, start = [], 0
+        while start < len(words):
+            end = start + rng.randint(8, 14)
+            sentence = " ".join(words[start:end])
+            sentences.append(sentence[:1].upper() + sentence[1:] + ".")
+            start = end
+        return " ".join(sentences)
+
+    def chunk_id(self, index: int) -> str:
+        return f"synthetic-{self.seed}-{index:09d}"
+
+    def chunk_text(self, index: int) -> str:
+        rng = self._rng(0, index)
+        return self._sentences(rng, rng.randint(*self.chunk_words))
+
+    def chunk_metadata(self, index: int) -> Dict[str, str]:
+        filename = self.document_filename(index // self.chunks_per_document)
+        return {"filename": filename, "source_path": f"synthetic/{filename}"}
+
+    def document_filename(self, document: int) -> str:
+        return f"synthetic-{self.seed}-{document:06d}.txt"
+
+    def document_text(self, document: int, target_chars: int) -> str:
+        """A multi-paragraph document of roughly `target_chars` characters."""
+        rng = self._rng(1, document)
+        paragraphs, size = [], 0
+        while size < target_chars:
+            paragraph = self._sentences(rng, rng.randint(40, 160))
+            paragraphs.append(paragraph)
+            size += len(paragraph) + 2
+        return "\n\n".join(paragraphs)
+
+    def queries(self, count: int, n_chunks: int, words_per_query: int = 4, offset: int = 0) -> List[Tuple[str, int]]:
+        """(query, target chunk index) pairs; each query is a few words drawn from its target chunk."""
+        pairs = []
+        for i in range(offset, offset + count):
+            rng = self._rng(2, i)
+            target = rng.randrange(n_chunks)
+            words = sorted(set(_WORD_RE.findall(self.chunk_text(target).lower())))
+            query = " ".join(rng.sample(words, min(words_per_query, len(words))))
+            pairs.append((query + "?", target))
+        return pairs
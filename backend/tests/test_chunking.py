@@ -0,0 +1,13 @@
+from app.rag.retrieve import iter_chunk_spans
+
+
+def test_whitespace_only_segment_does_not_repeat_previous_chunk():
+    text = "delta\n eps\n\n eta. theta"
+    assert list(iter_chunk_spans(text, 5, 4)) == [(0, 5), (7, 10), (13, 17), (18, 23)]
+
+
+def test_spans_advance_and_are_trimmed():
+    text = "\n\n".join(f"paragraph {i} " + "word " * (i % 40) + ".\n \n" for i in range(200))
+    spans = list(iter_chunk_spans(text, 256, 64))
+    assert all(later[1] > earlier[1] for earlier, later in zip(spans, spans[1:]))
+    assert all(text[start:end] == text[start:end].strip() for start, end in spans)
@@ -5,6 +5,7 @@ import { Button } from '../ui/Button';
 import { useNavigate } from 'react-router-dom';
 import { useAppStore } from '../../store/useAppStore';
 import { API_BASE_URL } from '../../config';
+import { api } from '../../services/api';
 
 const Chat = () => {
   const { 
@@ -15,20 +16,46 @@ const Chat = () => {
     startLoading, 
     stopLoading,
     startNewChat,
+    olderCursor,
+    prependMessages,
     triggerHistoryRefresh // Get the new trigger action from the store
   } = useAppStore();
 
   const [input, setInput] = useState('');
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const chatLogRef = useRef<HTMLDivElement>(null);
+  // Set while older turns are prepended, so the view keeps its position instead of jumping to the end.
+  const keepScrollRef = useRef<number | null>(null);
   const navigate = useNavigate();
 
   useEffect(() => {
+    const log = chatLogRef.current;
+    if (keepScrollRef.current !== null && log) {
+      log.scrollTop = log.scrollHeight - keepScrollRef.current;
+      keepScrollRef.current = null;
+      return;
+    }
     // A small timeout to allow the DOM to update before scrolling
     setTimeout(() => {
       chatLogRef.current?.scrollTo({ top: chatLogRef.current.scrollHeight, behavior: 'smooth' });
     }, 100);
   }, [messages]);
 
+  const handleLoadOlder = async () => {
+    if (!olderCursor || loadingOlder) return;
+    setLoadingOlder(true);
+    try {
+      const res = await api.get(`/chat/history/${sessionId}`, { params: { cursor: olderCursor } });
+      const log = chatLogRef.current;
+      keepScrollRef.current = log ? log.scrollHeight - log.scrollTop : null;
+      prependMessages(res.data, res.headers['x-next-cursor'] ?? null);
+    } catch (error) {
+      console.error("Failed to load older messages", error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const handleSend = async () => {
     if (!input.trim()) return;
 
@@ -45,6 +72,10 @@ const Chat = () => {
         body: JSON.stringify({ session_id: sessionId, query: currentInput })
       });
 
+      if (response.status === 429) {
+        addMessage({ role: 'bot', text: 'The server is busy answering other questions. Please try again in a few seconds.' });
+        return;
+      }
       if (!response.body) return;
 
       const reader = response.body.getReader();
@@ -67,6 +98,11 @@ const Chat = () => {
             botMessageInitialized = true;
           }
 
+          if (data.error) {
+            addMessage({ role: 'bot', text: data.error });
+            botMessageInitialized = true;
+          }
+
           if (data.token) {
             if (!botMessageInitialized) {
               // Fallback in case sources arrive late or not at all
@@ -113,6 +149,13 @@ const Chat = () => {
       </div>
 
       <div ref={chatLogRef} className="flex-1 p-6 overflow-y-auto space-y-6">
+        {olderCursor && (
+          <div className="flex justify-center">
+            <Button variant="outline" size="sm" onClick={handleLoadOlder} disabled={loadingOlder}>
+              {loadingOlder ? 'Loading...' : 'Load older messages'}
+            </Button>
+          </div>
+        )}
         {messages.map((msg, i) => (
           <div key={i} className={`flex items-start gap-4 ${msg.role === 'user' ? 'justify-end' : ''}`}>
             {msg.role === 'bot' && <Bot className="h-8 w-8 text-primary flex-shrink-0" />}
@@ -6,6 +6,19 @@ import { Button } from '../ui/Button';
 import { api } from '../../services/api';
 import { useToast } from '../../hooks/useToast';
 
+const POLL_INTERVAL_MS = 1000;
+
+// Uploads are processed in the background; poll the job until it has a final result.
+const waitForJob = async (jobId: string) => {
+  while (true) {
+    const response = await api.get(`/documents/jobs/${jobId}`);
+    if (response.data.status === 'completed') {
+      return response.data.result;
+    }
+    await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL_MS));
+  }
+};
+
 const Upload = () => {
   const [files, setFiles] = useState<File[]>([]);
   const [isUploading, setIsUploading] = useState(false);
@@ -35,7 +48,7 @@ const Upload = () => {
       const response = await api.post('/documents/upload', formData, {
         headers: { 'Content-Type': 'multipart/form-data' },
       });
-      const { success, errors } = response.data;
+      const { success, errors } = await waitForJob(response.data.job_id);
       
       if (success.length > 0) {
         toast({ title: "Upload Complete", description: `${success.length} file(s) processed successfully.` });
@@ -12,6 +12,7 @@ type Session = {
 
 export const ChatHistory = () => {
   const [sessions, setSessions] = useState<Session[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const { 
     loadConversation, 
     sessionId: activeSessionId, 
@@ -21,10 +22,12 @@ export const ChatHistory = () => {
   const navigate = useNavigate();
   const { toast } = useToast();
 
-  const fetchSessions = async () => {
+  // Sessions are paginated; the server returns the next page's cursor in X-Next-Cursor.
+  const fetchSessions = async (cursor?: string) => {
     try {
-      const res = await api.get('/chat/sessions');
-      setSessions(res.data);
+      const res = await api.get('/chat/sessions', { params: cursor ? { cursor } : {} });
+      setSessions(prev => (cursor ? [...prev, ...res.data] : res.data));
+      setNextCursor(res.headers['x-next-cursor'] ?? null);
     } catch (error) {
       console.error("Failed to fetch chat sessions", error);
     }
@@ -36,8 +39,9 @@ export const ChatHistory = () => {
 
   const handleLoadSession = async (sessionId: string) => {
     try {
+      // History returns the latest turns; older ones are paged in from the chat view.
       const res = await api.get(`/chat/history/${sessionId}`);
-      loadConversation(sessionId, res.data);
+      loadConversation(sessionId, res.data, res.headers['x-next-cursor'] ?? null);
       navigate('/chat');
     } catch (error) {
       toast({ title: "Error", description: "Failed to load chat history.", variant: "destructive" });
@@ -90,6 +94,14 @@ export const ChatHistory = () => {
             </span>
           </button>
         ))}
+        {nextCursor && (
+          <button
+            onClick={() => fetchSessions(nextCursor)}
+            className="w-full text-left text-xs text-muted-foreground hover:text-foreground p-2"
+          >
+            Show older conversations
+          </button>
+        )}
       </div>
     </div>
   );
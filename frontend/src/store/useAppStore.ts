@@ -10,6 +10,8 @@ type Message = {
 interface AppState {
   sessionId: string;
   messages: Message[];
+  // Cursor of the loaded conversation's older turns (X-Next-Cursor), or null when all are loaded.
+  olderCursor: string | null;
   isLoading: boolean;
   // CORRECTED: Add a refresh trigger
   historyRefreshTrigger: number;
@@ -18,7 +20,8 @@ interface AppState {
   startLoading: () => void;
   stopLoading: () => void;
   startNewChat: () => void;
-  loadConversation: (sessionId: string, messages: Message[]) => void;
+  loadConversation: (sessionId: string, messages: Message[], olderCursor?: string | null) => void;
+  prependMessages: (messages: Message[], olderCursor: string | null) => void;
   // CORRECTED: Add an action to increment the trigger
   triggerHistoryRefresh: () => void;
 }
@@ -28,6 +31,7 @@ export const useAppStore = create<AppState>((set) => ({
   messages: [
     { role: 'bot', text: "Hello! How can I help you with your documents today?" }
   ],
+  olderCursor: null,
   isLoading: false,
   // CORRECTED: Initialize the trigger
   historyRefreshTrigger: 0,
@@ -42,13 +46,19 @@ export const useAppStore = create<AppState>((set) => ({
     messages: [
       { role: 'bot', text: "New chat started. How can I assist you?" }
     ],
+    olderCursor: null,
     isLoading: false,
   }),
-  loadConversation: (sessionId, messages) => set({
+  loadConversation: (sessionId, messages, olderCursor = null) => set({
     sessionId: sessionId,
     messages: messages,
+    olderCursor: olderCursor,
     isLoading: false,
   }),
+  prependMessages: (messages, olderCursor) => set((state) => ({
+    messages: [...messages, ...state.messages],
+    olderCursor: olderCursor,
+  })),
   // CORRECTED: Implement the trigger action
   triggerHistoryRefresh: () => set((state) => ({
     historyRefreshTrigger: state.historyRefreshTrigger + 1